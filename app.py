@@ -1,20 +1,35 @@
-from flask import Flask, render_template, redirect, url_for, flash, session, request, send_from_directory
+from flask import Flask, render_template, redirect, url_for, flash, session, request, send_from_directory, g, jsonify, Response
 from forms import RegistrationForm, LoginForm
 from models import User, Department, ReimbursementRequest
 from crud import *
-from database import get_session
-from datetime import datetime
+from database import get_session, get_pool_stats, engine
+from jobs import enqueue, worker
+import tasks  # registers the job handlers
+from datetime import datetime, timedelta
 from sqlalchemy.exc import SQLAlchemyError 
-from sqlalchemy.orm import joinedload
 from sqlalchemy.sql import or_
 import os
-from werkzeug.utils import secure_filename
+import atexit
+import csv
+import hmac
+import io
+import json
+import mimetypes
+import uuid
+from urllib.parse import quote
+from werkzeug.security import safe_join
+from storage import store_upload, content_digest
+from passwords import check_password, hash_password, PasswordHasherBusy
+from config import (document_cache_max_age, document_use_x_sendfile, document_x_accel_prefix, user_import_max_rows,
+                    max_documents_per_request, metrics_token)
 import logging
-from logging.handlers import RotatingFileHandler
+from app_logging import configure_logging
+import metrics
 
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_secret_key_here'
+app.config['USE_X_SENDFILE'] = document_use_x_sendfile
 
 UPLOAD_FOLDER = 'uploads'
 if not os.path.exists(UPLOAD_FOLDER):
@@ -27,17 +42,72 @@ role_mapping = {
 }
 
 if not app.debug:
-    handler = RotatingFileHandler('app.log', maxBytes=10000, backupCount=1)
-    handler.setLevel(logging.INFO)
-
-    formatter = logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s'
-    )
-    handler.setFormatter(formatter)
-
-    app.logger.addHandler(handler)
+    configure_logging(app, logging.getLogger('audit'), logging.getLogger('jobs'), logging.getLogger('slow_query'))
+
+metrics.init_app(app, engine)
+
+@app.before_first_request
+def start_job_worker():
+    # Tests run jobs explicitly with jobs.run_pending().
+    if not app.testing:
+        worker.start()
+        atexit.register(worker.stop)
+
+def get_db():
+    # One session per app context; close_db() returns its connection to the pool.
+    if 'db_session' not in g:
+        g.db_session = get_session()
+    return g.db_session
+
+def json_bulk_items(payload, id_key, **fields):
+    """Return ``payload['items']`` if it is a list of dicts with an integer ``id_key``.
+
+    ``fields`` maps optional item keys to the type their non-null values must
+    have. Anything else returns None so the route can answer 400.
+    """
+    items = payload.get('items') if isinstance(payload, dict) else None
+    if not isinstance(items, list):
+        return None
+    for item in items:
+        if not isinstance(item, dict):
+            return None
+        for key, kind in {id_key: int, **fields}.items():
+            value = item.get(key)
+            if value is None and key != id_key:
+                continue
+            # bool is an int subclass, but true is not an id.
+            if not isinstance(value, kind) or isinstance(value, bool):
+                return None
+    return items
+
+@app.teardown_appcontext
+def close_db(exception):
+    session_db = g.pop('db_session', None)
+    if session_db is not None:
+        session_db.close()
 
-    app.logger.setLevel(logging.INFO)
+@app.before_request
+def load_identity():
+    # Refresh role and manager from the cached user record so role changes and
+    # deletions apply on the next request, not the next login.
+    if 'user_id' not in session or request.endpoint == 'static':
+        return
+    identity = get_user_identity(session['user_id'])
+    if identity is None or identity.user_status in ('deleted', 'inactive'):
+        app.logger.warning(f"Session of user {session['user_id']} ended: account no longer active.")
+        session.clear()
+        return
+    g.identity = identity
+    if session.get('role') != identity.role or session.get('manager_id') != identity.manager_id:
+        session['role'] = identity.role
+        session['manager_id'] = identity.manager_id
+
+@app.context_processor
+def inject_unread_notification_count():
+    # Called from templates only where the counter is shown.
+    def unread_notification_count():
+        return get_unread_count(session['user_id']) if 'user_id' in session else 0
+    return {'unread_notification_count': unread_notification_count}
 
 @app.route('/')
 def home():
@@ -57,12 +127,6 @@ def error():
 def register():
     form = RegistrationForm()
 
-    session = get_session()
-    departments = session.query(Department).all()
-    department_choices = [(str(department.department_id), department.department_name) for department in departments]
-
-    form.department.choices = department_choices
-
     if form.validate_on_submit():
         try:
             department_id = form.department.data
@@ -72,11 +136,15 @@ def register():
                 flash('Registration successful, awaiting admin approval.', 'success')
                 app.logger.info('Registration successful, awaiting admin approval.')
 
-                create_notification(1, f'New user registration pending approval: {user.email}', datetime.utcnow())
+                enqueue('notify_admins', {'message': f'New user registration pending approval: {user.email}'})
                 return redirect(url_for('login'))
         except SQLAlchemyError as e:
             flash(f'Error: {e}', 'danger')
             app.logger.error(f'Error: {e}')
+        except PasswordHasherBusy:
+            flash('Too many requests right now, please try registering again.', 'danger')
+            app.logger.warning('Password hasher busy, registration shed.')
+            return render_template('register.html', title='Register', form=form), 503
     else:
         if form.errors:
             for field, errors in form.errors.items():
@@ -95,18 +163,33 @@ def login():
             flash('Invalid email domain', 'danger')
             return redirect(url_for('login'))
         
-        session_db = get_session()
+        session_db = get_db()
         user = session_db.query(User).filter_by(email=form.email.data).first()
         if user and user.user_status == 'deleted':
             flash('User is deleted.', 'danger')
             app.logger.warning('User is deleted.')
             return redirect(url_for('login'))
         
-        if user and (check_password_hash(user.password, form.password.data) or user.password == form.password.data):
+        try:
+            matches, needs_rehash = check_password(user.password, form.password.data) if user else (False, False)
+        except PasswordHasherBusy:
+            flash('Too many login attempts right now, please try again.', 'danger')
+            app.logger.warning('Password hasher busy, login shed.')
+            return render_template('login.html', title='Login', form=form), 503
+
+        if matches:
             if user.user_status == 'inactive':
                 flash('Your account is not yet activated.', 'warning')
                 app.logger.warning('Account is not yet activated.')  
             else:
+                if needs_rehash:
+                    # Legacy and plaintext passwords are upgraded to the current hasher on login.
+                    try:
+                        user.password = hash_password(form.password.data)
+                        session_db.commit()
+                    except (SQLAlchemyError, PasswordHasherBusy) as e:
+                        session_db.rollback()
+                        app.logger.warning(f'Password rehash failed: {e}')
                 session['user_id'] = user.user_id
                 session['role'] = user.role
                 session['manager_id'] = user.manager_id if user.manager_id else None
@@ -131,6 +214,43 @@ def logout():
     app.logger.info("log out")
     return redirect(url_for('home'))
 
+@app.route('/notifications')
+def notifications():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    unread_notifications = get_unread_notifications(session['user_id'])
+    return render_template('notifications.html', notifications=unread_notifications)
+
+@app.route('/notifications/mark_read', methods=['POST'])
+def mark_read():
+    if 'user_id' not in session:
+        if request.is_json:
+            return jsonify(error='Forbidden'), 403
+        return redirect(url_for('login'))
+
+    # JSON without notification_ids, or the form's "all" button, marks every unread notification read.
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        notification_ids = payload.get('notification_ids') if isinstance(payload, dict) else payload
+        # JSON ids must already be a list of integers; a string would otherwise be read character by character.
+        if notification_ids is not None and not (
+                isinstance(payload, dict) and isinstance(notification_ids, list)
+                and all(isinstance(notification_id, int) and not isinstance(notification_id, bool)
+                        for notification_id in notification_ids)):
+            return jsonify(error='Invalid notification ids'), 400
+    elif request.form.get('all'):
+        notification_ids = None
+    else:
+        try:
+            notification_ids = [int(notification_id) for notification_id in request.form.getlist('notification_ids')]
+        except ValueError:
+            return jsonify(error='Invalid notification ids'), 400
+
+    updated = mark_notifications_read(session['user_id'], notification_ids)
+    if request.is_json:
+        return jsonify(updated=updated, unread=get_unread_count(session['user_id']))
+    return redirect(url_for('notifications'))
+
 @app.route('/download_policy')
 def download_policy():
     return send_from_directory(directory='static' , path='Reimbursement Request Policy.pdf', as_attachment=True)
@@ -141,21 +261,81 @@ def admin_dashboard():
     if 'user_id' not in session or session['role'] != 'Admin':
         return redirect(url_for('login'))
 
-    session_db = get_session()
+    session_db = get_db()
     pending_users = session_db.query(User).filter_by(role='pending').all()
-    reimbursement_requests = get_all_reimbursement_requests()
     app.logger.info("admin dashboard")
-    return render_template('admin_dashboard.html', title='Admin Dashboard', pending_users=pending_users,reimbursement_requests=reimbursement_requests)
+    return render_template('admin_dashboard.html', title='Admin Dashboard', pending_users=pending_users)
 
 @app.route('/pending_user_registration')
 def pending_user_registration():
-    session = get_session()
-    pending_users = session.query(User).filter_by(user_status='Inactive').options(joinedload(User.department)).all()
-    managers = session.query(User).filter(or_(User.role == 'manager', User.role == 'admin'), User.user_status != 'deleted').all()
-    session.close()
+    if 'user_id' not in session or session['role'] != 'Admin':
+        return redirect(url_for('login'))
+
+    pending_users, next_cursor = get_pending_registrations_page(
+        after_id=request.args.get('cursor', type=int),
+        page_size=request.args.get('page_size', PENDING_USERS_PAGE_SIZE, type=int))
+    managers = get_manager_choices()
     app.logger.info("pending user registration. ")
     
-    return render_template('pending_user_registration.html', pending_users=pending_users , managers=managers)
+    return render_template('pending_user_registration.html', pending_users=pending_users , managers=managers,
+                           next_cursor=next_cursor)
+
+@app.route('/bulk_review_users', methods=['POST'])
+def bulk_review_users():
+    if 'user_id' not in session or session['role'] != 'Admin':
+        if request.is_json:
+            return jsonify(error='Forbidden'), 403
+        return redirect(url_for('login'))
+
+    # JSON: {"action": ..., "items": [{"user_id": ..., "role": ..., "manager_id": ...}]}
+    # Form: action, role, manager_id, user_ids (repeated) and optional role_<user_id>/manager_id_<user_id>.
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        items = json_bulk_items(payload, 'user_id', role=str, manager_id=int)
+        if items is None or not isinstance(payload.get('action'), str):
+            return jsonify(error='Invalid bulk user review request'), 400
+        action = payload['action']
+        items = [(item['user_id'], item.get('role'), item.get('manager_id')) for item in items]
+    else:
+        action = request.form.get('action')
+        items = [(user_id, request.form.get(f'role_{user_id}') or request.form.get('role'),
+                  request.form.get(f'manager_id_{user_id}') or request.form.get('manager_id'))
+                 for user_id in request.form.getlist('user_ids')]
+
+    approvals = {}
+    try:
+        for user_id, role, manager_id in items:
+            approvals[int(user_id)] = (role, int(manager_id) if manager_id not in (None, '') else None)
+    except (TypeError, ValueError):
+        action = None
+    if action not in ('approve', 'reject') or not approvals or len(approvals) > MAX_BULK_USER_REVIEW:
+        if request.is_json:
+            return jsonify(error='Invalid bulk user review request'), 400
+        session['message'] = 'Invalid bulk user review request.'
+        session['message_category'] = 'danger'
+        return redirect(url_for('pending_user_registration'))
+
+    try:
+        if action == 'approve':
+            results = approve_users(approvals)
+        else:
+            results = reject_users(list(approvals))
+    except SQLAlchemyError as e:
+        app.logger.error(f'Error: {e}')
+        if request.is_json:
+            return jsonify(error='Database error'), 500
+        session['message'] = 'Error'
+        session['message_category'] = 'danger'
+        return redirect(url_for('pending_user_registration'))
+
+    status = 'approved' if action == 'approve' else 'rejected'
+    reviewed = sum(1 for outcome in results.values() if outcome == status)
+    app.logger.info(f'{reviewed} of {len(results)} user registrations {status} in bulk.')
+    if request.is_json:
+        return jsonify(results=[{'user_id': user_id, 'outcome': outcome} for user_id, outcome in results.items()])
+    session['message'] = f'{reviewed} of {len(results)} registrations {status}.'
+    session['message_category'] = 'success' if reviewed == len(results) else 'warning'
+    return redirect(url_for('pending_user_registration'))
 
 @app.route('/approve_user/<int:user_id>', methods=['POST'])
 def approve_user(user_id):
@@ -166,7 +346,7 @@ def approve_user(user_id):
     manager_id = request.form.get('manager_id')
 
     try:
-        session_db = get_session()
+        session_db = get_db()
         user = session_db.query(User).get(user_id)
         if user:
             if not role:
@@ -184,6 +364,7 @@ def approve_user(user_id):
             if role.lower() == 'employee':
                 user.manager_id = manager_id
             session_db.commit()
+            invalidate_user_identity(user_id)
             session['message'] = f'User {user.email} approved successfully.'
             session['message_category'] = 'success'
             app.logger.info("user approved by admin successfully")
@@ -195,23 +376,66 @@ def approve_user(user_id):
         session['message'] = f'Error {e}.'
         session['message_category'] = 'danger'
         app.logger.error(f'Error :{e}')
-    finally:
-        session_db.close()
     
     return redirect(url_for('pending_user_registration'))
 
 
+def parse_user_import(upload):
+    # CSV with a header row, or JSON Lines; unparsable JSON lines become None so they are reported per row.
+    filename = (upload.filename or '').lower()
+    text = io.TextIOWrapper(upload.stream, encoding='utf-8-sig')
+    if filename.endswith('.csv'):
+        return list(csv.DictReader(text))
+    if filename.endswith(('.jsonl', '.ndjson')):
+        rows = []
+        for line in text:
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                rows.append(None)
+        return rows
+    return None
+
+@app.route('/import_users', methods=['POST'])
+def bulk_import_users():
+    if 'user_id' not in session or session['role'] != 'Admin':
+        return jsonify(error='Forbidden'), 403
+
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify(error='Upload a .csv or .jsonl file as "file"'), 400
+    try:
+        rows = parse_user_import(upload)
+    except (UnicodeDecodeError, csv.Error):
+        rows = None
+    if rows is None:
+        return jsonify(error='Unsupported or unreadable import file'), 400
+    if len(rows) > user_import_max_rows:
+        return jsonify(error=f'At most {user_import_max_rows} users per import'), 400
+
+    try:
+        result = import_users(rows)
+    except SQLAlchemyError as e:
+        app.logger.error(f'Error: {e}')
+        return jsonify(error='Database error'), 500
+
+    app.logger.info(f"{result['imported']} users imported, {len(result['errors'])} rows rejected.")
+    return jsonify(result)
+
 @app.route('/reject_user/<int:user_id>', methods=['POST'])
 def reject_user(user_id):
     if 'user_id' not in session or session['role'] != 'Admin':
         return redirect(url_for('login'))
 
     try:
-        session_db = get_session()
+        session_db = get_db()
         user = session_db.query(User).get(user_id)
         if user:
             session_db.delete(user)
             session_db.commit()
+            invalidate_user_identity(user_id)
             session['message'] = f'User {user.email} request rejected and deleted successfully.'
             session['message_category'] = 'success'
             app.logger.info("user rejected by admin")
@@ -221,25 +445,91 @@ def reject_user(user_id):
         session['message_category'] = 'danger'
         app.logger.error(f'Error :{e}')
 
-    finally:
-        session_db.close()
-
     return redirect(url_for('pending_user_registration'))
 
+# Only these are carried into pagination and export links; url_for() reserves names like endpoint and _external.
+TRACKING_QUERY_ARGS = ('status', 'employee_id', 'manager_id', 'request_type_id', 'date_from', 'date_to', 'page_size')
+
+def get_tracking_filters(args):
+    filters = {}
+    if args.get('status') in ('pending', 'approved', 'rejected'):
+        filters['status'] = args['status']
+    for key in ('employee_id', 'manager_id', 'request_type_id'):
+        value = args.get(key, type=int)
+        if value:
+            filters[key] = value
+    for key in ('date_from', 'date_to'):
+        try:
+            filters[key] = datetime.strptime(args.get(key, ''), '%Y-%m-%d').date()
+        except ValueError:
+            pass
+    return filters
+
 @app.route('/reimbursement_request_tracking')
 def reimbursement_request_tracking():
-    session = get_session()
-    reimbursement_requests = get_all_reimbursement_requests()    
-    session.close()
+    if 'user_id' not in session or session['role'] != 'Admin':
+        return redirect(url_for('login'))
+
+    filters = get_tracking_filters(request.args)
+    page_size = request.args.get('page_size', TRACKING_PAGE_SIZE, type=int)
+    reimbursement_requests, next_cursor = get_reimbursement_requests_page(
+        filters, before_id=request.args.get('cursor', type=int), page_size=page_size)
+    request_types = get_all_request_types()
+    query_args = {key: request.args[key] for key in TRACKING_QUERY_ARGS if request.args.get(key)}
     app.logger.info("Reibursement form request tracking")
-    return render_template('reimbursement_request_tracking.html', reimbursement_requests=reimbursement_requests)
+    return render_template('reimbursement_request_tracking.html', reimbursement_requests=reimbursement_requests,
+                           request_types=request_types, query_args=query_args, next_cursor=next_cursor)
+
+
+EXPORT_COLUMNS = ['request_id', 'employee_id', 'first_name', 'last_name', 'email', 'request_type_id', 'type_name',
+                  'amount', 'request_date', 'status', 'manager_id', 'comments']
+
+def export_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def export_jsonl(rows):
+    lines = []
+    for row in rows:
+        record = dict(zip(EXPORT_COLUMNS, row))
+        record['request_date'] = record['request_date'].isoformat() if record['request_date'] else None
+        lines.append(json.dumps(record) + '\n')
+        if len(lines) == EXPORT_BATCH_SIZE:
+            yield ''.join(lines)
+            lines = []
+    yield ''.join(lines)
+
+@app.route('/export_reimbursement_requests')
+def export_reimbursement_requests():
+    if 'user_id' not in session or session['role'] != 'Admin':
+        return redirect(url_for('login'))
+
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'jsonl'):
+        return 'Unsupported export format', 400
+
+    rows = iter_reimbursement_request_export(get_tracking_filters(request.args))
+    app.logger.info(f"Reimbursement requests exported as {export_format}")
+    if export_format == 'csv':
+        body, mimetype = export_csv(rows), 'text/csv'
+    else:
+        body, mimetype = export_jsonl(rows), 'application/x-ndjson'
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=reimbursement_requests.{export_format}'})
 
 
 @app.route('/manage_departments')
 def manage_departments():
-    session = get_session()
-    departments = session.query(Department).order_by(Department.department_id.asc(  )).all()
-    session.close()
+    session_db = get_db()
+    departments = session_db.query(Department).order_by(Department.department_id.asc(  )).all()
     app.logger.info("Manager Dashboard")
     return render_template('manage_departments.html', departments=departments)
 
@@ -249,10 +539,11 @@ def add_department():
         department_name = request.form['department_name']
         department_id = request.form['department_id']
         
-        session = get_session()
+        session_db = get_db()
         new_department = Department(department_name=department_name, department_id=department_id)
-        session.add(new_department)
-        session.commit()
+        session_db.add(new_department)
+        session_db.commit()
+        invalidate_department_cache()
         app.logger.info("Add departments")
         return redirect(url_for('manage_departments'))
 
@@ -261,7 +552,7 @@ def manage_users():
     if 'user_id' not in session or session['role'] != 'Admin':
         return redirect(url_for('login'))
     
-    session_db = get_session()
+    session_db = get_db()
     users = session_db.query(User).filter(User.user_status.in_(['active','pending']), User.role != 'Admin').all()
     app.logger.info("Manage users")
     return render_template('manage_users.html', users=users)
@@ -271,7 +562,7 @@ def edit_user(user_id):
     if 'user_id' not in session or session['role'] != 'Admin':
         return redirect(url_for('login'))
     
-    session_db = get_session()
+    session_db = get_db()
     user = session_db.query(User).get(user_id)
     managers = session_db.query(User).filter(or_(User.role == 'manager', User.role == 'admin'), User.user_status != 'deleted').all()
 
@@ -286,12 +577,13 @@ def update_user(user_id):
     role = request.form['role']
     manager_id = request.form['manager_id'] or None
     
-    session_db = get_session()
+    session_db = get_db()
     user = session_db.query(User).get(user_id)
     if user:
         user.role = role
         user.manager_id = manager_id
         session_db.commit()
+        invalidate_user_identity(user_id)
         session['message'] = f'User {user.email} updated successfully.'
         session['message_category'] = 'success'
         app.logger.info(f"user {user.email} details updated")
@@ -306,11 +598,12 @@ def delete_user(user_id):
     if 'user_id' not in session or session['role'] != 'Admin':
         return redirect(url_for('login'))
     
-    session_db = get_session()
+    session_db = get_db()
     user = session_db.query(User).get(user_id)
     if user:
         user.user_status = 'deleted'
         session_db.commit()
+        invalidate_user_identity(user_id)
         session['message'] = f'User {user.email} deleted.'
         session['message_category'] = 'success'
         app.logger.info("user status udpated")
@@ -321,9 +614,53 @@ def delete_user(user_id):
     return redirect(url_for('manage_users'))
 
 
-@app.route('/uploads/<filename>')
+@app.route('/pool_stats')
+def pool_stats():
+    if 'user_id' not in session or session['role'] != 'Admin':
+        return redirect(url_for('login'))
+    return jsonify(get_pool_stats())
+
+
+def send_document(filename):
+    # Content-addressed files never change, so they get a strong ETag from their digest and
+    # immutable caching; legacy flat uploads are revalidated with the stat-based ETag.
+    digest = content_digest(filename)
+    if document_x_accel_prefix:
+        path = safe_join(os.path.join(app.root_path, UPLOAD_FOLDER), filename)
+        if path is None or not os.path.isfile(path):
+            return 'Not Found', 404
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = document_x_accel_prefix.rstrip('/') + '/' + quote(filename)
+        if digest:
+            response.set_etag(digest)
+            response.make_conditional(request)
+    elif digest:
+        response = send_from_directory(UPLOAD_FOLDER, filename, etag=digest, max_age=document_cache_max_age)
+    else:
+        response = send_from_directory(UPLOAD_FOLDER, filename, etag=True, max_age=0)
+
+    if digest:
+        response.cache_control.public = True
+        response.cache_control.max_age = document_cache_max_age
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if session.get('role') != 'Admin':
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer':
+            token = ''
+        if not metrics_token or not hmac.compare_digest(token.encode(), metrics_token.encode()):
+            return Response('Unauthorized', 401, {'WWW-Authenticate': 'Bearer'})
+    pool_gauges = {f'portal_pool_{key}': value for key, value in get_pool_stats().items()}
+    return Response(metrics.render_prometheus(pool_gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    return send_from_directory("uploads", filename)
+    return send_document(filename)
 
 # EMPLOYEE ROUTES
 @app.route('/employee_dashboard')
@@ -341,37 +678,61 @@ def submit_reimbursement():
     request_types = get_all_request_types()
 
     if request.method == 'POST':
+        # The form carries a key generated when it was rendered, so a double-submit or browser
+        # retry finds the request it already created without re-uploading the receipt.
+        idempotency_key = request.form.get('idempotency_key') or request.headers.get('Idempotency-Key')
+        if idempotency_key and len(idempotency_key) > 64:
+            idempotency_key = None
+        if idempotency_key:
+            existing_id = find_submission(session['user_id'], idempotency_key)
+            if existing_id is not None:
+                return submitted_again(existing_id)
+
         request_type_id = request.form.get('request_type_id')
         amount = float(request.form.get('amount'))
-        request_date = request.form.get('request_date')
-        document = request.files['document']
+        documents = [document for document in request.files.getlist('document') if document]
+        try:
+            # <input type="date"> always posts ISO dates; SQLite's Date type only accepts date objects.
+            request_date = datetime.strptime(request.form.get('request_date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            request_date = None
         
         amount_limit =get_amount_limit(request_type_id)
         
-        if amount_limit is None:
+        if request_date is None:
+            session['message'] = "Invalid request date"
+            session['message_category']='danger'
+        elif amount_limit is None:
             session['message']= "Invalid request amount"
             session['message_category']='danger'
         elif amount > amount_limit:
             session['message'] = f"Amount exceeds the limit . Limit {amount_limit}"
             session['message_category']='danger'
+        elif len(documents) > max_documents_per_request:
+            session['message'] = f"At most {max_documents_per_request} documents per request"
+            session['message_category']='danger'
         else:
-            if document :
+            if documents :
                 
-                document_filename = secure_filename(document.filename)
-                document_path = os.path.join(UPLOAD_FOLDER, document_filename)
-                document.save(document_path)
+                document_paths = [store_upload(document, UPLOAD_FOLDER) for document in documents]
 
                 try:
+                    # The request, its documents and their verification jobs are committed together.
                     request_id = create_reimbursement_request(
                         employee_id=session['user_id'],
                         request_type_id=request_type_id,
                         amount=amount,
                         request_date=request_date,
-                        manager_id=session['manager_id']
+                        manager_id=session['manager_id'],
+                        idempotency_key=idempotency_key,
+                        content_hash=submission_hash(session['user_id'], amount, request_date,
+                                                     [content_digest(path) for path in document_paths]),
+                        document_paths=document_paths
                     )
-                    create_document(request_id, document_filename)
                     app.logger.info(f'Reimbursement request {request_id} submitted successfully.')
                     return redirect(url_for('employee_dashboard'))
+                except DuplicateSubmission as e:
+                    return submitted_again(e.request_id)
                 except SQLAlchemyError as e:
                     session['message'] = f'Error {e}.'
                     session['message_category']='danger'
@@ -379,27 +740,31 @@ def submit_reimbursement():
             
             return redirect(url_for('employee_dashboard'))
 
-    return render_template('submit_reimbursement.html', request_types=request_types)
+    return render_template('submit_reimbursement.html', request_types=request_types, idempotency_key=uuid.uuid4().hex)
+
+def submitted_again(request_id):
+    session['message'] = f'This claim was already submitted as request {request_id}.'
+    session['message_category'] = 'info'
+    app.logger.info(f'Duplicate submission of reimbursement request {request_id}.')
+    return redirect(url_for('employee_dashboard'))
 
-@app.route('/user_uploads/<filename>')
+@app.route('/user_uploads/<path:filename>')
 def user_uploaded_file(filename):
-    return send_from_directory(UPLOAD_FOLDER,filename)
+    return send_document(filename)
 
 @app.route('/history')
 def history():
     if 'user_id' not in session or session['role'] != 'Employee':
         return redirect(url_for('login'))
 
-    session_db = get_session()
+    session_db = get_db()
     reimbursement_request = session_db.query(ReimbursementRequest).filter_by(employee_id=session['user_id']).all()
     reimbursement_requests = []
     for request in reimbursement_request:
-        documents = session_db.query(Document).filter_by(request_id = request.request_id).all()
         reimbursement_requests.append({
             'rr': request,
-            'documents':documents
+            'documents': request.documents
         })
-    session_db.close()
     app.logger.info("employee history")   
     return render_template('history.html', reimbursement_requests=reimbursement_requests)
 
@@ -409,12 +774,46 @@ def manager_dashboard():
     if 'user_id' not in session or session['role'] != 'Manager':
         return redirect(url_for('login'))
 
-    session_db = get_session()
-    manager_id = session['user_id']
-    pending_requests = session_db.query(ReimbursementRequest).filter_by(manager_id=manager_id, status='pending').all()
+    summary = get_manager_summary(session['user_id'])
     app.logger.info("manager dashboard")
-    return render_template('manager_dashboard.html', title='Manager Dashboard', pending_requests=pending_requests)
-    
+    return render_template('manager_dashboard.html', title='Manager Dashboard', summary=summary)
+
+@app.route('/manager_dashboard/summary')
+def manager_dashboard_summary():
+    if 'user_id' not in session or session['role'] != 'Manager':
+        return jsonify(error='Forbidden'), 403
+    return jsonify(get_manager_summary(session['user_id']))
+
+@app.route('/analytics')
+def analytics():
+    if 'user_id' not in session or session['role'] != 'Admin':
+        return redirect(url_for('login'))
+    year = request.args.get('year', type=int)
+    spend = get_spend_analytics(year)
+    if request.args.get('format') == 'json':
+        return jsonify(spend)
+    app.logger.info("spend analytics")
+    return render_template('analytics.html', spend=spend, year=year)
+
+@app.route('/status_history/<int:request_id>')
+def status_history(request_id):
+    if 'user_id' not in session or session['role'] != 'Admin':
+        return jsonify(error='Forbidden'), 403
+    return jsonify(history=[{'old_status': entry.old_status, 'new_status': entry.new_status, 'actor_id': entry.actor_id,
+                             'comment': entry.comment, 'changed_at': entry.changed_at.isoformat()}
+                            for entry in get_status_history(request_id)])
+
+@app.route('/review_latency')
+def review_latency():
+    # ?days=30&status=approved&manager_id=2; median time from submission to review per manager.
+    if 'user_id' not in session or session['role'] != 'Admin':
+        return jsonify(error='Forbidden'), 403
+    days = max(1, min(request.args.get('days', 30, type=int), 366))
+    statuses = [request.args['status']] if request.args.get('status') in ('approved', 'rejected') else ['approved', 'rejected']
+    latency = get_review_latency(datetime.utcnow() - timedelta(days=days), statuses,
+                                 manager_id=request.args.get('manager_id', type=int))
+    return jsonify(days=days, statuses=statuses,
+                   managers=[{'manager_id': manager_id, **stats} for manager_id, stats in sorted(latency.items())])
 
 
 @app.route('/pending_requests')
@@ -422,7 +821,7 @@ def pending_requests():
     if 'user_id' not in session or session['role'] != 'Manager':
         return redirect(url_for('login'))
     
-    session_db = get_session()
+    session_db = get_db()
     pending_requests = (
         session_db.query(ReimbursementRequest, User,RequestType)
         .join(User, ReimbursementRequest.employee_id == User.user_id)
@@ -433,65 +832,111 @@ def pending_requests():
 
     reimbursement_requests = []
     for reimbursement_request, user,request_type in pending_requests:
-        documents = session_db.query(Document).filter_by(request_id=reimbursement_request.request_id).all()
         reimbursement_requests.append({
             'request': reimbursement_request,
             'user': user,
             'request_type':request_type,
-            'documents': documents
+            'documents': reimbursement_request.documents
         })
     
     return render_template('pending_requests.html', pending_requests=reimbursement_requests)
 
 
-@app.route('/approve_reimbursement/<int:request_id>', methods=['POST'])
-def approve_reimbursement(request_id):
-    if 'user_id' not in session or session['role'] != 'Manager':
-        return redirect(url_for('login'))
-    
+REVIEW_MESSAGES = {
+    'approved': ('Request Approved successfully.', 'success'),
+    'rejected': ('Request rejected successfully.', 'success'),
+    'not_pending': ('Request was already reviewed.', 'warning'),
+    'conflict': ('Request was changed by someone else, please reload and try again.', 'warning'),
+    'comment_required': ('Comments are required to reject a request.', 'danger'),
+    'forbidden': ('Request not found.', 'danger'),
+    'not_found': ('Request not found.', 'danger'),
+}
+
+def review_reimbursement(request_id, status):
+    # The form carries the version the manager saw, so a review of a since-changed request is refused.
     comments = request.form.get('comments')
-    session_db = get_session()
+    versions = {request_id: request.form.get('version', type=int)} if request.form.get('version') else None
     try:
-        reimbursement_request = session_db.query(ReimbursementRequest).filter_by(request_id=request_id).first()
-        if reimbursement_request and reimbursement_request.manager_id == session['user_id']:
-            reimbursement_request.status = 'approved'
-            reimbursement_request.comments = comments
-            session_db.commit()
-            session['message'] = 'Request Approved successfully.'
-            session['message_category'] = 'success'
-            app.logger.info('Request approved successfully.')
+        outcome = review_reimbursement_requests(session['user_id'], status, {request_id: comments}, versions)[request_id]
     except SQLAlchemyError as e:
-        session_db.rollback()
-        session['message'] = f'Error {e}.'
+        session['message'] = 'Error'
         session['message_category'] = 'danger'
         app.logger.error(f'Error: {e}')
-    finally:
-        session_db.close()
+        return redirect(url_for('pending_requests'))
+    session['message'], session['message_category'] = REVIEW_MESSAGES[outcome]
+    if outcome == status:
+        app.logger.info(f'Request {status} successfully.')
+    else:
+        app.logger.warning(f'Review of request {request_id} refused: {outcome}')
     return redirect(url_for('pending_requests'))
 
+@app.route('/approve_reimbursement/<int:request_id>', methods=['POST'])
+def approve_reimbursement(request_id):
+    if 'user_id' not in session or session['role'] != 'Manager':
+        return redirect(url_for('login'))
+    return review_reimbursement(request_id, 'approved')
+
 @app.route('/reject_reimbursement/<int:request_id>', methods=['POST'])
 def reject_reimbursement(request_id):
     if 'user_id' not in session or session['role'] != 'Manager':
         return redirect(url_for('login'))
-    
-    comments = request.form.get('comments')
-    session_db = get_session()
+    return review_reimbursement(request_id, 'rejected')
+
+@app.route('/bulk_review_reimbursements', methods=['POST'])
+def bulk_review_reimbursements():
+    if 'user_id' not in session or session['role'] != 'Manager':
+        if request.is_json:
+            return jsonify(error='Forbidden'), 403
+        return redirect(url_for('login'))
+
+    # JSON: {"action": ..., "comments": ..., "items": [{"request_id": ..., "comments": ..., "version": ...}]}
+    # Form: action, comments, request_ids (repeated) and optional comments_<request_id>/version_<request_id>.
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        items = json_bulk_items(payload, 'request_id', comments=str, version=int)
+        if items is None or not isinstance(payload.get('action'), str) or not isinstance(payload.get('comments'), (str, type(None))):
+            return jsonify(error='Invalid bulk review request'), 400
+        action = payload['action']
+        shared_comment = payload.get('comments')
+        items = [(item['request_id'], item.get('comments'), item.get('version')) for item in items]
+    else:
+        action = request.form.get('action')
+        shared_comment = request.form.get('comments')
+        items = [(request_id, request.form.get(f'comments_{request_id}'), request.form.get(f'version_{request_id}'))
+                 for request_id in request.form.getlist('request_ids')]
+
+    status = {'approve': 'approved', 'reject': 'rejected'}.get(action)
+    comments, versions = {}, {}
     try:
-        reimbursement_request = session_db.query(ReimbursementRequest).filter_by(request_id=request_id).first()
-        if reimbursement_request and reimbursement_request.manager_id == session['user_id']:
-            reimbursement_request.status = 'rejected'
-            reimbursement_request.comments = comments
-            session_db.commit()
-            session['message'] = 'Request rejected successfully.'
-            session['message_category'] = 'success'
-            app.logger.info('Request rejected successfully.')
-    except SQLAlchemyError as e:
-        session_db.rollback()
-        session['message'] = f'Error'
+        for request_id, comment, version in items:
+            comments[int(request_id)] = comment or shared_comment
+            if version not in (None, ''):
+                versions[int(request_id)] = int(version)
+    except (TypeError, ValueError):
+        status = None
+    if status is None or not comments or len(comments) > MAX_BULK_REVIEW:
+        if request.is_json:
+            return jsonify(error='Invalid bulk review request'), 400
+        session['message'] = 'Invalid bulk review request.'
         session['message_category'] = 'danger'
+        return redirect(url_for('pending_requests'))
+
+    try:
+        results = review_reimbursement_requests(session['user_id'], status, comments, versions)
+    except SQLAlchemyError as e:
         app.logger.error(f'Error: {e}')
-    finally:
-        session_db.close()
+        if request.is_json:
+            return jsonify(error='Database error'), 500
+        session['message'] = 'Error'
+        session['message_category'] = 'danger'
+        return redirect(url_for('pending_requests'))
+
+    reviewed = sum(1 for outcome in results.values() if outcome == status)
+    app.logger.info(f'{reviewed} of {len(results)} requests {status} in bulk.')
+    if request.is_json:
+        return jsonify(results=[{'request_id': request_id, 'outcome': outcome} for request_id, outcome in results.items()])
+    session['message'] = f'{reviewed} of {len(results)} requests {status}.'
+    session['message_category'] = 'success' if reviewed == len(results) else 'info'
     return redirect(url_for('pending_requests'))
 
 @app.route('/approved_requests')
@@ -499,7 +944,7 @@ def approved_requests():
     if 'user_id' not in session or session['role'] != 'Manager':
         return redirect(url_for('login'))
     
-    session_db = get_session()
+    session_db = get_db()
     approved_requests = (
         session_db.query(ReimbursementRequest, User, RequestType)
         .join(User, ReimbursementRequest.employee_id == User.user_id)
@@ -510,12 +955,10 @@ def approved_requests():
 
     reimbursement_requests = []
     for request, user, request_type in approved_requests:
-        documents = session_db.query(Document).filter_by(request_id=request.request_id).all()
         reimbursement_requests.append({
             'rr': (request, user, request_type),
-            'documents': documents
+            'documents': request.documents
         })
-    session_db.close()
     app.logger.info("approved requests")
     return render_template('approved_requests.html', reimbursement_requests=reimbursement_requests)
 
@@ -524,9 +967,7 @@ def rejected_requests():
     if 'user_id' not in session or session['role'] != 'Manager':
         return redirect(url_for('login'))
     
-    session_db = get_session()
-
-    session_db = get_session()
+    session_db = get_db()
     rejected_requests = (
         session_db.query(ReimbursementRequest, User, RequestType)
         .join(User, ReimbursementRequest.employee_id == User.user_id)
@@ -537,13 +978,11 @@ def rejected_requests():
 
     reimbursement_requests = []
     for request, user, request_type in rejected_requests:
-        documents = session_db.query(Document).filter_by(request_id=request.request_id).all()
         reimbursement_requests.append({
             'rr': (request, user, request_type),
-            'documents': documents
+            'documents': request.documents
         })
 
-    session_db.close()
     app.logger.info("rejected requests")
     return render_template('rejected_requests.html', reimbursement_requests=reimbursement_requests)
 
@@ -0,0 +1,105 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import g, has_request_context, request, session
+from flask.logging import default_handler
+from config import log_file, log_max_bytes, log_backup_count, log_level
+
+CONTEXT_FIELDS = ('request_id', 'user_id', 'route', 'method', 'status', 'duration_ms')
+
+class RequestContextFilter(logging.Filter):
+    """Copy request id, user id and route onto the record.
+
+    Runs on the QueueHandler, i.e. in the thread that logged, because the
+    listener thread has no request context.
+    """
+
+    def filter(self, record):
+        if has_request_context():
+            if not hasattr(record, 'request_id'):
+                record.request_id = g.get('request_id')
+            if not hasattr(record, 'user_id'):
+                record.user_id = session.get('user_id')
+            if not hasattr(record, 'route'):
+                record.route = request.endpoint
+        return True
+
+class JsonQueueHandler(QueueHandler):
+    """QueueHandler that keeps the traceback apart from the message.
+
+    The stock prepare() folds the formatted traceback into ``msg`` and drops
+    ``exc_info``; here it is rendered once, before enqueueing, into ``exc_text``.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Already rendered by JsonQueueHandler; the listener thread has no live traceback.
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+def configure_logging(app, *loggers):
+    """Route ``app.logger`` and ``loggers`` through a queue to a rotating JSON log file.
+
+    Routes only enqueue records; a QueueListener thread does the file I/O.
+    Flask's stderr handler is removed from ``app.logger`` so nothing else
+    writes on the request thread.
+    """
+    file_handler = RotatingFileHandler(log_file, maxBytes=log_max_bytes, backupCount=log_backup_count)
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(-1)
+    queue_handler = JsonQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    app.logger.removeHandler(default_handler)
+    for logger in (app.logger, *loggers):
+        logger.addHandler(queue_handler)
+        logger.setLevel(log_level)
+
+    @app.before_request
+    def start_request_log():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def finish_request_log(response):
+        started = g.get('request_started')
+        if started is not None:
+            duration_ms = round((time.perf_counter() - started) * 1000, 2)
+            app.logger.info('%s %s', request.method, request.path,
+                            extra={'method': request.method, 'status': response.status_code, 'duration_ms': duration_ms})
+        response.headers['X-Request-ID'] = g.get('request_id', '')
+        return response
+
+    return listener
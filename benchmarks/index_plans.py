@@ -0,0 +1,93 @@
+"""Show the query plan of each portal view before and after the declared indexes exist.
+
+Usage: python -m benchmarks.index_plans [--url sqlite:///bench.db] [--requests 200000] [--i-know-this-drops-tables]
+
+The database at --url is dropped and reseeded; only scratch SQLite files under
+the temp directory are accepted without --i-know-this-drops-tables.
+"""
+import argparse
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from models import Base, User, ReimbursementRequest, Document
+from benchmarks.seed import seed_database, reset_database, DROP_TABLES_FLAG
+
+def view_queries(session, manager_id, employee_id):
+    return {
+        'manager views (manager_id, status)': session.query(ReimbursementRequest)
+            .filter(ReimbursementRequest.manager_id == manager_id, ReimbursementRequest.status == 'pending'),
+        'history (employee_id)': session.query(ReimbursementRequest)
+            .filter(ReimbursementRequest.employee_id == employee_id),
+        'documents (request_id)': session.query(Document)
+            .filter(Document.request_id.in_(range(1, 51))),
+        'pending user registration (user_status)': session.query(User)
+            .filter(User.user_status == 'inactive'),
+        'manage users (user_status, role)': session.query(User)
+            .filter(User.user_status.in_(['active', 'pending']), User.role != 'Admin'),
+    }
+
+def explain(connection, sql):
+    if connection.dialect.name == 'sqlite':
+        return [row[-1] for row in connection.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+    return [' '.join(f'{key}={value}' for key, value in row._mapping.items() if value is not None)
+            for row in connection.execute(text('EXPLAIN ' + sql))]
+
+def measure(engine, manager_id, employee_id, repeat):
+    results = {}
+    with Session(engine) as session:
+        for name, query in view_queries(session, manager_id, employee_id).items():
+            sql = str(query.statement.compile(engine, compile_kwargs={'literal_binds': True}))
+            with engine.connect() as connection:
+                plan = explain(connection, sql)
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    connection.execute(text(sql)).fetchall()
+                elapsed = (time.perf_counter() - started) / repeat
+            results[name] = (plan, elapsed)
+    return results
+
+def set_indexes(engine, present):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if present:
+                index.create(engine, checkfirst=True)
+            else:
+                index.drop(engine, checkfirst=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', help='database URL to seed; defaults to a temporary SQLite file')
+    parser.add_argument('--requests', type=int, default=200000)
+    parser.add_argument('--employees', type=int, default=2000)
+    parser.add_argument('--managers', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument(DROP_TABLES_FLAG, dest='allow_drop', action='store_true',
+                        help='allow dropping the tables at a --url that is not a scratch SQLite file')
+    args = parser.parse_args()
+
+    url = args.url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'index_plans.db')
+    engine = create_engine(url)
+    reset_database(engine, args.allow_drop)
+    ids = seed_database(engine, managers=args.managers, employees=args.employees, requests=args.requests)
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            connection.execute(text('ANALYZE'))
+
+    manager_id, employee_id = ids['manager_ids'][0], ids['employee_ids'][0]
+    set_indexes(engine, present=False)
+    before = measure(engine, manager_id, employee_id, args.repeat)
+    set_indexes(engine, present=True)
+    after = measure(engine, manager_id, employee_id, args.repeat)
+
+    for name in before:
+        print(name)
+        for label, (plan, elapsed) in (('without indexes', before[name]), ('with indexes', after[name])):
+            print(f'  {label}: {elapsed * 1000:.2f} ms')
+            for line in plan:
+                print(f'    {line}')
+    engine.dispose()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""Drive the portal's routes concurrently against a seeded database and report latency.
+
+Usage: python -m benchmarks.load_test [--url sqlite:///bench.db] [--requests 1000000]
+                                      [--threads 8] [--iterations 200] [--save-baseline]
+                                      [--i-know-this-drops-tables]
+
+Each worker thread gets its own test client and replays a weighted mix of
+login, submit, history, manager and tracking requests through the real app.
+A request counts as an error unless it lands where a successful one would.
+Per route it reports throughput, p50/p95/p99 latency and SQL statements per
+request. With --save-baseline the results are written to --baseline; otherwise
+they are compared against it and the run exits non-zero on a regression.
+Baselines are only comparable on the same machine, database and dataset size.
+Seeding drops the tables at --url first; only scratch SQLite files under the
+temp directory are accepted without --i-know-this-drops-tables.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from sqlalchemy import create_engine, text
+import database
+import metrics
+from benchmarks.seed import seed_database, reset_database, DROP_TABLES_FLAG, SEED_PASSWORD
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'load_baseline.json')
+
+# Scenario names are the Flask endpoints they hit, so route_metrics lines up with them.
+DEFAULT_MIX = {
+    'login': 1,
+    'submit_reimbursement': 1,
+    'history': 3,
+    'pending_requests': 2,
+    'approved_requests': 1,
+    'rejected_requests': 1,
+    'reimbursement_request_tracking': 1,
+}
+
+def percentile(samples, pct):
+    # Nearest-rank percentile of an unsorted list.
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+def expect(response, location=None):
+    # Failed submits and logins redirect or re-render with 200, so check where each response went.
+    if location is None:
+        return response.status_code == 200
+    return response.status_code == 302 and urlparse(response.location).path == location
+
+def login_as(client, user_id, role, manager_id=None):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['role'] = role
+        sess['manager_id'] = manager_id
+
+def make_scenarios(users, request_types):
+    employees, managers = users['employees'], users['managers']
+
+    def login(client, rng):
+        user_id, _ = rng.choice(employees)
+        with client.session_transaction() as sess:
+            sess.clear()
+        response = client.post('/login', data={'email': f'employee{user_id}@nucleusteq.com', 'password': SEED_PASSWORD})
+        return expect(response, '/employee_dashboard')
+
+    def submit_reimbursement(client, rng):
+        user_id, manager_id = rng.choice(employees)
+        login_as(client, user_id, 'Employee', manager_id)
+        receipt = f'receipt {rng.getrandbits(64)}'.encode()
+        response = client.post('/submit_reimbursement', content_type='multipart/form-data', data={
+            'request_type_id': str(rng.randint(1, request_types)),
+            'amount': str(round(rng.uniform(10, 1000), 2)),
+            'request_date': '2024-01-15',
+            'document': (io.BytesIO(receipt), 'receipt.pdf'),
+        })
+        # Validation and database errors also land on the dashboard, with a message in the session.
+        with client.session_transaction() as sess:
+            message = sess.pop('message', None)
+            sess.pop('message_category', None)
+        return expect(response, '/employee_dashboard') and message is None
+
+    def history(client, rng):
+        user_id, manager_id = rng.choice(employees)
+        login_as(client, user_id, 'Employee', manager_id)
+        return expect(client.get('/history'))
+
+    def manager_view(path):
+        def view(client, rng):
+            login_as(client, rng.choice(managers), 'Manager')
+            return expect(client.get(path))
+        return view
+
+    def reimbursement_request_tracking(client, rng):
+        login_as(client, users['admin'], 'Admin')
+        return expect(client.get('/reimbursement_request_tracking'))
+
+    return {
+        'login': login,
+        'submit_reimbursement': submit_reimbursement,
+        'history': history,
+        'pending_requests': manager_view('/pending_requests'),
+        'approved_requests': manager_view('/approved_requests'),
+        'rejected_requests': manager_view('/rejected_requests'),
+        'reimbursement_request_tracking': reimbursement_request_tracking,
+    }
+
+def run_worker(app, scenarios, mix, iterations, warmup, seed):
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = {name: [] for name in names}
+    errors = dict.fromkeys(names, 0)
+    with app.test_client() as client:
+        for i in range(warmup + iterations):
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            ok = scenarios[name](client, rng)
+            elapsed = time.perf_counter() - started
+            if i < warmup:
+                continue
+            samples[name].append(elapsed)
+            if not ok:
+                errors[name] += 1
+    return samples, errors
+
+def run_load(app, scenarios, mix, threads, iterations, warmup):
+    metrics.route_metrics.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(run_worker, app, scenarios, mix, iterations, warmup, seed)
+                   for seed in range(threads)]
+        outcomes = [future.result() for future in futures]
+    wall_seconds = time.perf_counter() - started
+    route_stats = metrics.route_metrics.snapshot()
+
+    results = {}
+    for name in mix:
+        latencies = [sample for samples, _ in outcomes for sample in samples[name]]
+        if not latencies:
+            continue
+        stats = route_stats.get(name, {})
+        results[name] = {
+            'requests': len(latencies),
+            'errors': sum(errors[name] for _, errors in outcomes),
+            'throughput': len(latencies) / wall_seconds,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'queries_per_request': stats['queries'] / stats['requests'] if stats.get('requests') else 0.0,
+        }
+    total = sum(result['requests'] for result in results.values())
+    return {'throughput': total / wall_seconds, 'wall_seconds': wall_seconds, 'routes': results}
+
+def compare_to_baseline(current, baseline, latency_tolerance=0.25, query_tolerance=0.5):
+    """Return human readable regressions of ``current`` against ``baseline``."""
+    regressions = []
+    if current['throughput'] < baseline['throughput'] * (1 - latency_tolerance):
+        regressions.append(f"throughput {current['throughput']:.1f}/s < baseline {baseline['throughput']:.1f}/s")
+    for name, base in baseline['routes'].items():
+        result = current['routes'].get(name)
+        if result is None:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + latency_tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']:.1f} ms > baseline {base['p95_ms']:.1f} ms")
+        if result['queries_per_request'] > base['queries_per_request'] + query_tolerance:
+            regressions.append(f"{name}: {result['queries_per_request']:.1f} queries/request "
+                               f"> baseline {base['queries_per_request']:.1f}")
+        if result['errors'] / result['requests'] > base['errors'] / base['requests']:
+            regressions.append(f"{name}: {result['errors']} errors in {result['requests']} requests")
+    return regressions
+
+def print_report(results):
+    print(f"{'route':32} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>7}")
+    for name, result in results['routes'].items():
+        print(f"{name:32} {result['requests']:8} {result['errors']:6} {result['throughput']:8.1f} "
+              f"{result['p50_ms']:8.1f} {result['p95_ms']:8.1f} {result['p99_ms']:8.1f} {result['queries_per_request']:7.1f}")
+    print(f"total: {results['throughput']:.1f} req/s over {results['wall_seconds']:.1f} s")
+
+def bench_engine(url):
+    if url.startswith('sqlite'):
+        # Worker threads share the file; wait on its write lock instead of failing.
+        return create_engine(url, connect_args={'check_same_thread': False, 'timeout': 30})
+    return create_engine(url, **database._engine_options(url))
+
+def load_app(engine, upload_folder):
+    # Point every session at the benchmark database before app (and forms) import.
+    database.SessionLocal.configure(bind=engine)
+    import app as portal
+    metrics.instrument_engine(engine)
+    portal.UPLOAD_FOLDER = upload_folder
+    # TESTING keeps the job worker from starting; errors still become 500s.
+    portal.app.config.update(TESTING=True, PROPAGATE_EXCEPTIONS=False, WTF_CSRF_ENABLED=False)
+    return portal.app
+
+def load_users(engine):
+    with engine.connect() as connection:
+        employees = [tuple(row) for row in connection.execute(text(
+            "SELECT user_id, manager_id FROM users WHERE role = 'Employee' AND user_status = 'active'"))]
+        managers = [row[0] for row in connection.execute(text("SELECT user_id FROM users WHERE role = 'Manager'"))]
+    return {'admin': 1, 'employees': employees, 'managers': managers}
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'unknown scenario {name!r}')
+        mix[name] = int(weight or 1)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='database URL to seed; defaults to a temporary SQLite file')
+    parser.add_argument('--no-seed', action='store_true', help='reuse the data already at --url')
+    parser.add_argument('--requests', type=int, default=100000)
+    parser.add_argument('--employees', type=int, default=2000)
+    parser.add_argument('--managers', type=int, default=50)
+    parser.add_argument('--request-types', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=200, help='timed requests per thread')
+    parser.add_argument('--warmup', type=int, default=10, help='untimed requests per thread')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='weighted scenarios, e.g. history=3,pending_requests=1')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--latency-tolerance', type=float, default=0.25)
+    parser.add_argument('--query-tolerance', type=float, default=0.5)
+    parser.add_argument(DROP_TABLES_FLAG, dest='allow_drop', action='store_true',
+                        help='allow dropping the tables at a --url that is not a scratch SQLite file')
+    args = parser.parse_args()
+
+    url = args.url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'load_test.db')
+    engine = bench_engine(url)
+    if not args.no_seed:
+        reset_database(engine, args.allow_drop)
+        seed_database(engine, request_types=args.request_types, managers=args.managers,
+                      employees=args.employees, requests=args.requests)
+
+    app = load_app(engine, tempfile.mkdtemp())
+    scenarios = make_scenarios(load_users(engine), args.request_types)
+    results = run_load(app, scenarios, args.mix, args.threads, args.iterations, args.warmup)
+    print_report(results)
+    engine.dispose()
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f'baseline saved to {args.baseline}')
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f'no baseline at {args.baseline}; run with --save-baseline to create one')
+        return 0
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare_to_baseline(results, baseline, args.latency_tolerance, args.query_tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
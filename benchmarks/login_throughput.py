@@ -0,0 +1,56 @@
+"""Measure login throughput and latency at different password hashing costs.
+
+Usage: python -m benchmarks.login_throughput [--costs 1000,100000,260000] [--threads 8] [--iterations 50]
+
+For every PBKDF2 iteration count the seeded users' passwords are re-hashed at
+that cost and the login route is driven concurrently through the test client.
+The hasher pool size (password_hash_threads) bounds how much of the CPU the
+logins can take, so compare runs with different --hash-threads as well.
+"""
+import argparse
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from sqlalchemy import update
+import passwords
+from models import User
+from benchmarks.seed import seed_database, reset_database, DROP_TABLES_FLAG, SEED_PASSWORD
+from benchmarks.load_test import bench_engine, load_app, load_users, make_scenarios, run_load
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='database URL to seed; defaults to a temporary SQLite file')
+    parser.add_argument('--costs', default='1000,50000,100000,260000', help='comma separated PBKDF2 iteration counts')
+    parser.add_argument('--employees', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--hash-threads', type=int, default=passwords.password_hash_threads)
+    parser.add_argument('--iterations', type=int, default=50, help='logins per client')
+    parser.add_argument(DROP_TABLES_FLAG, dest='allow_drop', action='store_true',
+                        help='allow dropping the tables at a --url that is not a scratch SQLite file')
+    args = parser.parse_args()
+
+    url = args.url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'login_throughput.db')
+    engine = bench_engine(url)
+    reset_database(engine, args.allow_drop)
+    seed_database(engine, employees=args.employees, requests=0)
+    app = load_app(engine, tempfile.mkdtemp())
+    scenarios = make_scenarios(load_users(engine), request_types=4)
+
+    print(f"{'iterations':>10} {'logins/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    executor = ThreadPoolExecutor(max_workers=args.hash_threads, thread_name_prefix='password-hash')
+    with patch('passwords._executor', executor):
+        for cost in (int(value) for value in args.costs.split(',')):
+            hasher = passwords.PasswordHasher(iterations=cost)
+            with engine.begin() as connection:
+                connection.execute(update(User).values(password=hasher.hash(SEED_PASSWORD)))
+            with patch('passwords.hasher', hasher):
+                results = run_load(app, scenarios, {'login': 1}, args.threads, args.iterations, warmup=1)
+            login = results['routes']['login']
+            print(f"{cost:10} {login['throughput']:9.1f} {login['p50_ms']:8.1f} {login['p95_ms']:8.1f} "
+                  f"{login['p99_ms']:8.1f} {login['errors']:6}")
+    executor.shutdown()
+    engine.dispose()
+
+if __name__ == '__main__':
+    main()
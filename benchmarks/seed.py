@@ -0,0 +1,96 @@
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+from sqlalchemy import insert
+from passwords import make_hash
+from models import Base, User, Department, RequestType, ReimbursementRequest, Document
+
+SEED_PASSWORD = 'password123'
+STATUSES = ['pending', 'approved', 'rejected']
+DROP_TABLES_FLAG = '--i-know-this-drops-tables'
+
+def is_scratch_url(url) -> bool:
+    # In-memory SQLite, or a SQLite file under the temp directory (the harnesses' default).
+    if url.get_backend_name() != 'sqlite':
+        return False
+    if url.database in (None, '', ':memory:'):
+        return True
+    # A relative path depends on where the harness is run from, so it never counts as scratch.
+    if not os.path.isabs(url.database):
+        return False
+    temp_dir = os.path.realpath(tempfile.gettempdir())
+    return os.path.commonpath([os.path.realpath(url.database), temp_dir]) == temp_dir
+
+def reset_database(engine, allow_drop=False):
+    """Drop every portal table on ``engine`` before reseeding it.
+
+    Refuses anything but a scratch SQLite database unless ``allow_drop`` is
+    set, so pointing --url at a real database cannot wipe it by accident.
+    """
+    if not allow_drop and not is_scratch_url(engine.url):
+        raise SystemExit(f'refusing to drop the tables at {engine.url!r}; pass {DROP_TABLES_FLAG} if that is intended')
+    Base.metadata.drop_all(engine)
+
+def _insert_chunks(connection, table, rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            connection.execute(insert(table), chunk)
+            chunk = []
+    if chunk:
+        connection.execute(insert(table), chunk)
+
+def seed_database(engine, departments=5, request_types=4, managers=20, employees=500, requests=100000,
+                  documents_per_request=1, chunk_size=10000, seed=0):
+    """Create the schema on ``engine`` and fill it with a synthetic dataset.
+
+    User 1 is the admin, users 2..managers+1 are managers and the rest are
+    employees spread across the managers. Every user's password is SEED_PASSWORD.
+    Returns a dict with the generated id ranges.
+    """
+    rng = random.Random(seed)
+    Base.metadata.create_all(engine)
+    password = make_hash(SEED_PASSWORD)
+    manager_ids = list(range(2, managers + 2))
+    employee_ids = list(range(managers + 2, managers + employees + 2))
+    employee_managers = {employee_id: rng.choice(manager_ids) for employee_id in employee_ids}
+    start_date = date(2021, 1, 1)
+
+    def users():
+        yield dict(user_id=1, first_name='Admin', last_name='User', email='admin@nucleusteq.com', password=password,
+                   role='Admin', user_status='active', manager_id=None, department_id=1)
+        for user_id in manager_ids:
+            yield dict(user_id=user_id, first_name='Manager', last_name=str(user_id), email=f'manager{user_id}@nucleusteq.com',
+                       password=password, role='Manager', user_status='active', manager_id=None,
+                       department_id=rng.randint(1, departments))
+        for user_id in employee_ids:
+            yield dict(user_id=user_id, first_name='Employee', last_name=str(user_id), email=f'employee{user_id}@nucleusteq.com',
+                       password=password, role='Employee', user_status=rng.choice(['active'] * 9 + ['inactive']),
+                       manager_id=employee_managers[user_id], department_id=rng.randint(1, departments))
+
+    def reimbursement_requests():
+        for request_id in range(1, requests + 1):
+            employee_id = rng.choice(employee_ids)
+            yield dict(request_id=request_id, employee_id=employee_id, request_type_id=rng.randint(1, request_types),
+                       amount=round(rng.uniform(10, 1000), 2), request_date=start_date + timedelta(days=rng.randint(0, 1095)),
+                       status=rng.choice(STATUSES), comments=None, manager_id=employee_managers[employee_id])
+
+    def documents():
+        document_id = 1
+        for request_id in range(1, requests + 1):
+            for i in range(documents_per_request):
+                yield dict(document_id=document_id, request_id=request_id, document_path=f'receipt_{request_id}_{i}.pdf')
+                document_id += 1
+
+    with engine.begin() as connection:
+        _insert_chunks(connection, Department.__table__,
+                       (dict(department_id=i, department_name=f'Department {i}') for i in range(1, departments + 1)), chunk_size)
+        _insert_chunks(connection, RequestType.__table__,
+                       (dict(request_type_id=i, type_name=f'Type {i}', amount_limit=1000) for i in range(1, request_types + 1)), chunk_size)
+        _insert_chunks(connection, User.__table__, users(), chunk_size)
+        _insert_chunks(connection, ReimbursementRequest.__table__, reimbursement_requests(), chunk_size)
+        _insert_chunks(connection, Document.__table__, documents(), chunk_size)
+
+    return {'admin_id': 1, 'manager_ids': manager_ids, 'employee_ids': employee_ids, 'requests': requests}
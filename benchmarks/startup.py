@@ -0,0 +1,53 @@
+"""Time a cold import of the app and check that it never connects to the database.
+
+Usage: python -m benchmarks.startup [--runs 10]
+
+Each run imports app in a fresh interpreter with a hook that fails the run
+if anything opens a database connection, which is what a web worker does on
+boot. Reports min/median/max import time.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+IMPORT_APP = '''
+import time
+started = time.perf_counter()
+import database
+from sqlalchemy import event
+
+@event.listens_for(database.engine, 'do_connect')
+def refuse(dialect, conn_rec, cargs, cparams):
+    raise RuntimeError('the database was touched during startup')
+
+import app
+print(time.perf_counter() - started)
+'''
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    timings = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', IMPORT_APP], capture_output=True, text=True)
+        wall_seconds = time.perf_counter() - started
+        if result.returncode != 0:
+            print(result.stderr, file=sys.stderr)
+            print('startup failed; see the traceback above', file=sys.stderr)
+            return 1
+        timings.append((float(result.stdout.strip().splitlines()[-1]), wall_seconds))
+
+    imports = [import_seconds * 1000 for import_seconds, _ in timings]
+    processes = [wall_seconds * 1000 for _, wall_seconds in timings]
+    print(f"import app:      min {min(imports):7.1f} ms  median {statistics.median(imports):7.1f} ms  max {max(imports):7.1f} ms")
+    print(f"process startup: min {min(processes):7.1f} ms  median {statistics.median(processes):7.1f} ms  max {max(processes):7.1f} ms")
+    print('no database connection was opened')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
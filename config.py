@@ -1,4 +1,67 @@
 # config.py
 db_config ="mysql+pymysql://username:password/db_name"
 
+# Connection pool settings, see database.py
+db_pool_size = 10
+db_max_overflow = 20
+db_pool_timeout = 30
+db_pool_recycle = 1800
+db_pool_pre_ping = True
 
+# Reference data (request types, departments) cache, see crud.py
+reference_cache_size = 256
+reference_cache_ttl = 300
+manager_summary_cache_size = 1024
+manager_summary_cache_ttl = 30
+unread_count_cache_size = 4096
+unread_count_cache_ttl = 60
+
+# Document serving, see send_document in app.py
+document_cache_max_age = 31536000
+document_use_x_sendfile = False
+document_x_accel_prefix = None
+
+# Background job queue, see jobs.py
+job_worker_threads = 2
+job_poll_interval = 1.0
+job_max_attempts = 5
+job_backoff_seconds = 2
+job_backoff_max_seconds = 300
+job_stale_after_seconds = 600
+# Finished jobs are deleted after this long; dead jobs are kept for inspection.
+job_retention_seconds = 7 * 24 * 3600
+job_purge_interval = 3600
+
+# Logging, see app_logging.py
+log_file = 'app.log'
+log_max_bytes = 10 * 1024 * 1024
+log_backup_count = 5
+log_level = 'INFO'
+
+# Request metrics, see metrics.py
+slow_query_threshold_ms = 200
+server_timing_header = False
+# /metrics is served to admins, or to scrapers sending 'Authorization: Bearer <metrics_token>'; None disables the token.
+metrics_token = None
+
+# Bulk user import, see crud.import_users
+user_import_max_rows = 10000
+user_import_chunk_size = 1000
+user_import_hash_workers = 4
+# Imports with fewer passwords than this are hashed inline; each hash takes a noticeable fraction of a second.
+user_import_parallel_min_rows = 8
+
+# Password hashing, see passwords.py
+password_hash_algorithm = 'sha256'
+password_hash_iterations = 260000
+password_salt_length = 16
+password_hash_threads = 4
+password_hash_max_pending = 32
+password_hash_timeout = 5
+
+# Per-request user identity (role, status, manager), see load_identity in app.py
+user_identity_cache_size = 4096
+user_identity_cache_ttl = 60
+
+# Receipts per reimbursement request, see submit_reimbursement in app.py
+max_documents_per_request = 10
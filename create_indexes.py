@@ -0,0 +1,19 @@
+from sqlalchemy import Index, inspect
+from models import Base
+from database import engine
+
+# Indexes made redundant by a wider one; dropped once their replacement exists.
+RETIRED_INDEXES = {
+    'reimbursement_requests': ['ix_reimbursement_requests_employee_id'],
+}
+
+# create_all() skips tables that already exist, so their new indexes are added here.
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(engine, checkfirst=True)
+
+for table_name, index_names in RETIRED_INDEXES.items():
+    table = Base.metadata.tables[table_name]
+    for index in inspect(engine).get_indexes(table_name):
+        if index['name'] in index_names:
+            Index(index['name'], *(table.c[column] for column in index['column_names'])).drop(engine)
@@ -1,13 +1,67 @@
 from database import get_session
+import atexit
+import hashlib
+import multiprocessing
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from statistics import median
+from cache import TTLCache
+from jobs import enqueue
+from config import (reference_cache_size, reference_cache_ttl, manager_summary_cache_size, manager_summary_cache_ttl,
+                    unread_count_cache_size, unread_count_cache_ttl, user_import_chunk_size, user_import_hash_workers,
+                    user_import_parallel_min_rows, user_identity_cache_size, user_identity_cache_ttl)
 from models import *
-from sqlalchemy.exc import SQLAlchemyError
-from werkzeug.security import generate_password_hash
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy import and_, case, extract, func, insert, or_, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased, joinedload, lazyload
+import passwords as passwords_module
+from passwords import hash_password, make_hash
+
+# Request types and departments change rarely; cache them so hot paths skip the database.
+reference_cache = TTLCache(reference_cache_size, reference_cache_ttl)
+
+def invalidate_request_type_cache():
+    # Covers both the 'request_types' list and the per-id 'request_type:<id>' entries.
+    reference_cache.invalidate_prefix('request_type')
+
+def invalidate_department_cache():
+    reference_cache.invalidate_prefix('department')
+
+# Short-lived per-manager dashboard totals; a TTL of 0 disables it.
+manager_summary_cache = TTLCache(manager_summary_cache_size, manager_summary_cache_ttl)
+
+def invalidate_manager_summary(manager_id):
+    manager_summary_cache.invalidate(manager_id)
+
+unread_count_cache = TTLCache(unread_count_cache_size, unread_count_cache_ttl)
+
+# What authorization needs about a user, cached so it can be checked on every request.
+# Writes invalidate it here; the TTL bounds staleness across processes.
+UserIdentity = namedtuple('UserIdentity', ['user_id', 'role', 'user_status', 'manager_id'])
+user_identity_cache = TTLCache(user_identity_cache_size, user_identity_cache_ttl)
+
+def invalidate_user_identity(*user_ids):
+    user_identity_cache.invalidate(*user_ids)
+
+def get_user_identity(user_id: int):
+    def load():
+        session = get_session()
+        try:
+            row = (session.query(User.user_id, User.role, User.user_status, User.manager_id)
+                   .filter(User.user_id == user_id).first())
+            return UserIdentity(*row) if row else None
+        finally:
+            session.close()
+    return user_identity_cache.get_or_load(user_id, load)
 
 def create_user(first_name: str, last_name: str, email: str, password: str, role: str, user_status: str, manager_id: int, department_id: int):
     session = get_session()
     try:  
-        hashed_password = generate_password_hash(password, method='sha256')        
+        hashed_password = hash_password(password)
         user = User(first_name=first_name, last_name=last_name, email=email, password=hashed_password,
                     role=role, user_status=user_status, manager_id=manager_id, department_id=department_id)
         session.add(user)
@@ -21,33 +75,211 @@ def create_user(first_name: str, last_name: str, email: str, password: str, role
     finally:
         session.close()
 
+USER_IMPORT_REQUIRED = ('first_name', 'last_name', 'email', 'password', 'role', 'department')
+USER_ROLES = {'employee': 'Employee', 'manager': 'Manager', 'admin': 'Admin'}
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+# One long-lived pool per process, started on first use. Workers are spawned rather than
+# forked so they never inherit locks held by the web server's other threads.
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+def _get_hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(max_workers=user_import_hash_workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+            atexit.register(shutdown_hash_pool)
+        return _hash_pool
+
+def shutdown_hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown()
+            _hash_pool = None
+
+def hash_passwords(passwords):
+    # Salted hashing is CPU bound, so all but tiny batches are spread over worker processes.
+    if user_import_hash_workers <= 1 or len(passwords) < user_import_parallel_min_rows:
+        return [make_hash(password) for password in passwords]
+    # Send the current hasher along explicitly; spawned workers start from a fresh import.
+    return list(_get_hash_pool().map(passwords_module.hasher.hash, passwords,
+                                     chunksize=max(len(passwords) // (user_import_hash_workers * 4), 1)))
+
+def _users_by_email(session, emails):
+    users = {}
+    for chunk in _chunks(list(emails), user_import_chunk_size):
+        for row in session.query(User.user_id, User.email, User.role, User.user_status).filter(User.email.in_(chunk)):
+            users[row.email.lower()] = row
+    return users
+
+def import_users(rows):
+    """Validate ``rows`` of user dicts and insert the valid ones as active users.
+
+    Departments are matched by name and managers by email, either an existing
+    active Manager/Admin or a Manager/Admin row of the same import. Everything
+    is written in one transaction with chunked executemany inserts.
+    Returns ``{'imported': n, 'errors': [{'row': ..., 'email': ..., 'error': ...}]}``.
+    """
+    errors = []
+    valid = []
+    departments = {department.department_name.lower(): department.department_id for department in get_all_departments()}
+    records = [{key: str(value).strip() for key, value in row.items() if value is not None and key is not None}
+               if isinstance(row, dict) else None for row in rows]
+    session = get_session()
+    try:
+        referenced = {record[key].lower() for record in records if record
+                      for key in ('email', 'manager_email') if record.get(key)}
+        existing = _users_by_email(session, referenced)
+
+        seen = set()
+        for number, record in enumerate(records, 1):
+            if record is None:
+                errors.append({'row': number, 'email': None, 'error': 'Malformed row'})
+                continue
+            email = record.get('email', '')
+            missing = [field for field in USER_IMPORT_REQUIRED if not record.get(field)]
+            role = USER_ROLES.get(record.get('role', '').lower())
+            if missing:
+                error = f"Missing {', '.join(missing)}"
+            elif not email.lower().endswith('@nucleusteq.com'):
+                error = 'Invalid email domain'
+            elif role is None:
+                error = f"Unknown role {record['role']}"
+            elif record['department'].lower() not in departments:
+                error = f"Unknown department {record['department']}"
+            elif email.lower() in seen:
+                error = 'Duplicate email in import'
+            elif email.lower() in existing:
+                error = 'Email already registered'
+            elif role == 'Employee' and not record.get('manager_email'):
+                error = 'Manager email is mandatory for employee role'
+            else:
+                error = None
+            seen.add(email.lower())
+            if error:
+                errors.append({'row': number, 'email': email or None, 'error': error})
+            else:
+                valid.append((number, record, role))
+
+        imported_managers = {record['email'].lower() for _, record, role in valid if role in ('Manager', 'Admin')}
+        independent, dependent = [], []
+        for number, record, role in valid:
+            manager_email = record.get('manager_email', '').lower() if role == 'Employee' else ''
+            manager = existing.get(manager_email)
+            if not manager_email or (manager and manager.role in ('Manager', 'Admin') and manager.user_status == 'active'):
+                independent.append((number, record, role, manager.user_id if manager else None))
+            elif manager_email in imported_managers:
+                dependent.append((number, record, role, manager_email))
+            else:
+                errors.append({'row': number, 'email': record['email'], 'error': f"Unknown manager {record['manager_email']}"})
+
+        to_insert = independent + dependent
+        hashes = hash_passwords([record['password'] for _, record, _, _ in to_insert])
+        # Emails are stored lower-cased so the lookups below match on case-sensitive collations too.
+        values = [dict(first_name=record['first_name'], last_name=record['last_name'], email=record['email'].lower(),
+                       password=password_hash, role=role, user_status='active', manager_id=None,
+                       department_id=departments[record['department'].lower()])
+                  for (_, record, role, _), password_hash in zip(to_insert, hashes)]
+        for value, (_, _, _, manager_id) in zip(values, independent):
+            value['manager_id'] = manager_id
+
+        # Employees of managers from this same import need those managers' new ids.
+        for chunk in _chunks(values[:len(independent)], user_import_chunk_size):
+            session.execute(insert(User.__table__), chunk)
+        imported = len(independent)
+        if dependent:
+            new_managers = _users_by_email(session, {manager_email for _, _, _, manager_email in dependent})
+            employees = []
+            for value, (number, record, _, manager_email) in zip(values[len(independent):], dependent):
+                manager = new_managers.get(manager_email)
+                if manager is None:
+                    errors.append({'row': number, 'email': record['email'], 'error': f"Unknown manager {record['manager_email']}"})
+                    continue
+                value['manager_id'] = manager.user_id
+                employees.append(value)
+            for chunk in _chunks(employees, user_import_chunk_size):
+                session.execute(insert(User.__table__), chunk)
+            imported += len(employees)
+        session.commit()
+        errors.sort(key=lambda error: error['row'])
+        return {'imported': imported, 'errors': errors}
+    except SQLAlchemyError as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
 def create_department(department_name: str):
+    session = get_session()
     try:
-        session = get_session()
         department = Department(department_name=department_name)
         session.add(department)
         session.commit()
         session.refresh(department)
+        invalidate_department_cache()
         return department
     except SQLAlchemyError as e:
         print(f"Error creating department: {e}")
         session.rollback()
         return None
+    finally:
+        session.close()
 
 def create_request_type(type_name: str, amount_limit: float):
+    session = get_session()
     try:
-        session = get_session()
         request_type = RequestType(type_name=type_name, amount_limit=amount_limit)
         session.add(request_type)
         session.commit()
         session.refresh(request_type)
+        invalidate_request_type_cache()
         return request_type
     except SQLAlchemyError as e:
         print(f"Error creating request type: {e}")
         session.rollback()
         return None
+    finally:
+        session.close()
+
+class DuplicateSubmission(Exception):
+    """Raised when a submission repeats an existing request; carries its id."""
 
-def create_reimbursement_request(employee_id, request_type_id, amount, request_date, manager_id):
+    def __init__(self, request_id: int):
+        super().__init__(request_id)
+        self.request_id = request_id
+
+def submission_hash(employee_id: int, amount: float, request_date, receipt_digests):
+    # Same employee, amount, date and receipts means the same claim, whatever the idempotency key.
+    if not receipt_digests or not all(receipt_digests):
+        return None
+    key = '|'.join([str(employee_id), f'{float(amount):.2f}', request_date.isoformat(), *sorted(receipt_digests)])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def find_submission(employee_id: int, idempotency_key: str = None, content_hash: str = None):
+    criteria = []
+    if idempotency_key:
+        criteria.append(and_(ReimbursementRequest.employee_id == employee_id,
+                             ReimbursementRequest.idempotency_key == idempotency_key))
+    if content_hash:
+        criteria.append(ReimbursementRequest.content_hash == content_hash)
+    if not criteria:
+        return None
+    session = get_session()
+    try:
+        row = session.query(ReimbursementRequest.request_id).filter(or_(*criteria)).first()
+        return row.request_id if row else None
+    finally:
+        session.close()
+
+def create_reimbursement_request(employee_id, request_type_id, amount, request_date, manager_id,
+                                 idempotency_key=None, content_hash=None, document_paths=()):
+    """Create a request, its documents and history row in one commit."""
     session_db = get_session()
     try:
         new_request = ReimbursementRequest(
@@ -56,12 +288,27 @@ def create_reimbursement_request(employee_id, request_type_id, amount, request_d
             amount=amount,
             request_date=request_date,
             status='pending',
-            manager_id=manager_id
+            manager_id=manager_id,
+            idempotency_key=idempotency_key,
+            content_hash=content_hash
         )
         session_db.add(new_request)
-        session_db.commit()
+        session_db.flush()
         request_id = new_request.request_id
+        if document_paths:
+            session_db.execute(insert(Document), [{'request_id': request_id, 'document_path': document_path}
+                                                  for document_path in document_paths])
+        add_status_history(session_db, [(request_id, None, 'pending', employee_id, None)])
+        session_db.commit()
+        invalidate_manager_summary(manager_id)
         return request_id
+    except IntegrityError:
+        # A concurrent or earlier submission won the unique index; hand back its request.
+        session_db.rollback()
+        existing_id = find_submission(employee_id, idempotency_key, content_hash)
+        if existing_id is None:
+            raise
+        raise DuplicateSubmission(existing_id)
     except SQLAlchemyError as e:
         session_db.rollback()
         raise e
@@ -69,14 +316,26 @@ def create_reimbursement_request(employee_id, request_type_id, amount, request_d
         session_db.close()
 
 def get_all_request_types():
-    session = get_session()
-    request_types = session.query(RequestType).all()
-    session.close()
-    return request_types
+    def load():
+        session = get_session()
+        try:
+            return session.query(RequestType).all()
+        finally:
+            session.close()
+    return reference_cache.get_or_load('request_types', load)
+
+def get_all_departments():
+    def load():
+        session = get_session()
+        try:
+            return session.query(Department).order_by(Department.department_id.asc()).all()
+        finally:
+            session.close()
+    return reference_cache.get_or_load('departments', load)
 
 def create_document(request_id: int, document_path: str):
+    session = get_session()
     try:
-        session = get_session()
         document = Document(request_id=request_id, document_path=document_path)
         session.add(document)
         session.commit()
@@ -86,36 +345,268 @@ def create_document(request_id: int, document_path: str):
         print(f"Error creating document: {e}")
         session.rollback()
         return None
+    finally:
+        session.close()
 
-def create_notification(user_id: int, message: str, is_read: bool, created_at: datetime):
+def create_notification(user_id: int, message: str, created_at: datetime = None, is_read: bool = False):
+    session = get_session()
     try:
-        session = get_session()
-        notification = Notification(user_id=user_id, message=message, is_read=is_read, created_at=created_at)
+        notification = Notification(user_id=user_id, message=message, is_read=is_read,
+                                    created_at=created_at or datetime.utcnow())
         session.add(notification)
         session.commit()
         session.refresh(notification)
+        unread_count_cache.invalidate(user_id)
         return notification
     except SQLAlchemyError as e:
         print(f"Error creating notification: {e}")
         session.rollback()
         return None
+    finally:
+        session.close()
+
+def add_status_history(session, transitions):
+    # One executemany INSERT of (request_id, old_status, new_status, actor_id, comment) rows
+    # on the session that changes the status, so history commits or rolls back with it.
+    if transitions:
+        changed_at = datetime.utcnow()
+        session.execute(insert(RequestStatusHistory.__table__),
+                        [dict(request_id=request_id, old_status=old_status, new_status=new_status,
+                              actor_id=actor_id, comment=comment, changed_at=changed_at)
+                         for request_id, old_status, new_status, actor_id, comment in transitions])
+
+def get_status_history(request_id: int):
+    session = get_session()
+    try:
+        return (session.query(RequestStatusHistory)
+                .filter(RequestStatusHistory.request_id == request_id)
+                .order_by(RequestStatusHistory.changed_at.asc(), RequestStatusHistory.history_id.asc())
+                .all())
+    finally:
+        session.close()
+
+def get_review_latency(since: datetime, statuses=('approved', 'rejected'), manager_id: int = None):
+    """Time from submission to review per reviewer, for reviews since ``since``.
+
+    Reviews are found through the (new_status, changed_at) index and each is
+    joined to its submission row through (request_id, changed_at), so only the
+    window is read. Returns ``{actor_id: {'count', 'median_seconds', 'mean_seconds'}}``.
+    """
+    reviewed = aliased(RequestStatusHistory)
+    submitted = aliased(RequestStatusHistory)
+    session = get_session()
+    try:
+        query = (session.query(reviewed.actor_id, submitted.changed_at, reviewed.changed_at)
+                 .join(submitted, and_(submitted.request_id == reviewed.request_id,
+                                       submitted.old_status.is_(None), submitted.new_status == 'pending'))
+                 .filter(reviewed.new_status.in_(list(statuses)), reviewed.old_status == 'pending',
+                         reviewed.changed_at >= since))
+        if manager_id is not None:
+            query = query.filter(reviewed.actor_id == manager_id)
+        latencies = {}
+        for actor_id, submitted_at, reviewed_at in query:
+            latencies.setdefault(actor_id, []).append((reviewed_at - submitted_at).total_seconds())
+    finally:
+        session.close()
+    return {actor_id: {'count': len(seconds), 'median_seconds': median(seconds), 'mean_seconds': sum(seconds) / len(seconds)}
+            for actor_id, seconds in latencies.items()}
+
+ROLLUP_STATUSES = ('approved', 'rejected')
+
+def _rollup_upsert(session):
+    # Adds the given counts and amounts onto existing rollup rows. MySQL in production, SQLite in tests.
+    table = MonthlySpendRollup.__table__
+    if session.get_bind().dialect.name == 'mysql':
+        statement = mysql_insert(table)
+        return statement.on_duplicate_key_update(
+            request_count=table.c.request_count + statement.inserted.request_count,
+            total_amount=table.c.total_amount + statement.inserted.total_amount)
+    statement = sqlite_insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[column.name for column in table.primary_key],
+        set_={'request_count': table.c.request_count + statement.excluded.request_count,
+              'total_amount': table.c.total_amount + statement.excluded.total_amount})
+
+def add_spend_rollups(session, transitions):
+    # transitions are (old_status, new_status, request_date, department_id, request_type_id, amount);
+    # leaving a reviewed status subtracts from its bucket, entering one adds. The caller commits.
+    deltas = {}
+    for old_status, new_status, request_date, department_id, request_type_id, amount in transitions:
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            if status in ROLLUP_STATUSES:
+                key = (request_date.year, request_date.month, department_id or 0, request_type_id, status)
+                count, total = deltas.get(key, (0, 0.0))
+                deltas[key] = (count + sign, total + sign * amount)
+    rows = [dict(year=year, month=month, department_id=department_id, request_type_id=request_type_id, status=status,
+                 request_count=count, total_amount=total)
+            for (year, month, department_id, request_type_id, status), (count, total) in deltas.items() if count or total]
+    if rows:
+        session.execute(_rollup_upsert(session), rows)
+
+def rebuild_monthly_spend_rollups():
+    """Recompute every rollup row from reimbursement_requests in one transaction.
+
+    For backfills and imports that bypass the review paths; it reads the whole
+    requests table, so run it off-peak.
+    """
+    year = extract('year', ReimbursementRequest.request_date)
+    month = extract('month', ReimbursementRequest.request_date)
+    department_id = func.coalesce(User.department_id, 0)
+    totals = (select(year, month, department_id, ReimbursementRequest.request_type_id, ReimbursementRequest.status,
+                     func.count(ReimbursementRequest.request_id), func.coalesce(func.sum(ReimbursementRequest.amount), 0))
+              .join(User, User.user_id == ReimbursementRequest.employee_id)
+              .where(ReimbursementRequest.status.in_(ROLLUP_STATUSES))
+              .group_by(year, month, department_id, ReimbursementRequest.request_type_id, ReimbursementRequest.status))
+    session = get_session()
+    try:
+        session.query(MonthlySpendRollup).delete(synchronize_session=False)
+        session.execute(insert(MonthlySpendRollup.__table__).from_select(
+            ['year', 'month', 'department_id', 'request_type_id', 'status', 'request_count', 'total_amount'], totals))
+        session.commit()
+        return session.query(func.count()).select_from(MonthlySpendRollup).scalar()
+    except SQLAlchemyError as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def get_spend_analytics(year: int = None):
+    # Reads only the rollup table; names come from the cached reference data.
+    session = get_session()
+    try:
+        query = session.query(MonthlySpendRollup)
+        if year:
+            query = query.filter(MonthlySpendRollup.year == year)
+        rollups = query.all()
+    finally:
+        session.close()
+    departments = {department.department_id: department.department_name for department in get_all_departments()}
+    request_types = {request_type.request_type_id: request_type.type_name for request_type in get_all_request_types()}
+
+    def bucket():
+        return {'approved_count': 0, 'approved_amount': 0.0, 'rejected_count': 0, 'rejected_amount': 0.0}
+
+    analytics = {'total': bucket(), 'by_month': {}, 'by_department': {}, 'by_request_type': {}}
+    for rollup in rollups:
+        buckets = [analytics['total'],
+                   analytics['by_month'].setdefault(f'{rollup.year:04d}-{rollup.month:02d}', bucket()),
+                   analytics['by_department'].setdefault(departments.get(rollup.department_id, 'Unassigned'), bucket()),
+                   analytics['by_request_type'].setdefault(request_types.get(rollup.request_type_id, str(rollup.request_type_id)), bucket())]
+        for totals in buckets:
+            totals[f'{rollup.status}_count'] += rollup.request_count
+            totals[f'{rollup.status}_amount'] += rollup.total_amount
+    analytics['by_month'] = dict(sorted(analytics['by_month'].items()))
+    return analytics
+
+def add_notifications(session, messages):
+    # One executemany INSERT of (user_id, message) pairs on an open session; the caller commits.
+    if messages:
+        created_at = datetime.utcnow()
+        session.execute(insert(Notification.__table__),
+                        [dict(user_id=user_id, message=message, is_read=False, created_at=created_at)
+                         for user_id, message in messages])
+
+def create_notifications(messages):
+    session = get_session()
+    try:
+        add_notifications(session, messages)
+        session.commit()
+        unread_count_cache.invalidate(*{user_id for user_id, _ in messages})
+        return len(messages)
+    except SQLAlchemyError as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def notify_users(user_ids, message: str):
+    return create_notifications([(user_id, message) for user_id in set(user_ids)])
+
+def _active_user_ids(*criteria):
+    session = get_session()
+    try:
+        return [row.user_id for row in session.query(User.user_id).filter(User.user_status == 'active', *criteria)]
+    finally:
+        session.close()
+
+def notify_admins(message: str):
+    return notify_users(_active_user_ids(User.role == 'Admin'), message)
+
+def notify_team(manager_id: int, message: str):
+    return notify_users(_active_user_ids(User.manager_id == manager_id), message)
+
+def get_unread_notifications(user_id: int, limit: int = 50):
+    session = get_session()
+    try:
+        return (session.query(Notification)
+                .filter(Notification.user_id == user_id, Notification.is_read == False)
+                .order_by(Notification.created_at.desc())
+                .limit(limit)
+                .all())
+    finally:
+        session.close()
+
+def get_unread_count(user_id: int):
+    def load():
+        session = get_session()
+        try:
+            return (session.query(func.count(Notification.notification_id))
+                    .filter(Notification.user_id == user_id, Notification.is_read == False)
+                    .scalar())
+        finally:
+            session.close()
+    return unread_count_cache.get_or_load(user_id, load)
+
+def mark_notifications_read(user_id: int, notification_ids=None):
+    # None marks every unread notification of the user as read.
+    session = get_session()
+    try:
+        query = session.query(Notification).filter(Notification.user_id == user_id, Notification.is_read == False)
+        if notification_ids is not None:
+            query = query.filter(Notification.notification_id.in_(list(notification_ids)))
+        updated = query.update({Notification.is_read: True}, synchronize_session=False)
+        session.commit()
+        unread_count_cache.invalidate(user_id)
+        return updated
+    except SQLAlchemyError as e:
+        print(f"Error marking notifications read: {e}")
+        session.rollback()
+        return 0
+    finally:
+        session.close()
 
 # read function
 def get_user(user_id: int):
     session = get_session()
-    return session.query(User).get(user_id)
+    try:
+        return session.query(User).get(user_id)
+    finally:
+        session.close()
 
 def get_departments(department_id: int):
-    session = get_session()
-    return session.query(Department).get(department_id)
+    def load():
+        session = get_session()
+        try:
+            return session.query(Department).get(department_id)
+        finally:
+            session.close()
+    return reference_cache.get_or_load(f'department:{department_id}', load)
 
 def get_request_type(request_type_id: int):
-    session = get_session()
-    return session.query(RequestType).get(request_type_id)
+    def load():
+        session = get_session()
+        try:
+            return session.query(RequestType).get(request_type_id)
+        finally:
+            session.close()
+    return reference_cache.get_or_load(f'request_type:{request_type_id}', load)
 
 def get_reimbursement_request(request_id: int):
     session = get_session()
-    return session.query(ReimbursementRequest).get(request_id)
+    try:
+        return session.query(ReimbursementRequest).get(request_id)
+    finally:
+        session.close()
 
 def get_all_reimbursement_requests():
     session = get_session()
@@ -123,30 +614,131 @@ def get_all_reimbursement_requests():
     session.close()
     return reimbursement_requests
 
+TRACKING_PAGE_SIZE = 50
+MAX_TRACKING_PAGE_SIZE = 200
+
+def filter_reimbursement_requests(query, filters: dict):
+    if filters.get('status'):
+        query = query.filter(ReimbursementRequest.status == filters['status'])
+    if filters.get('employee_id'):
+        query = query.filter(ReimbursementRequest.employee_id == filters['employee_id'])
+    if filters.get('manager_id'):
+        query = query.filter(ReimbursementRequest.manager_id == filters['manager_id'])
+    if filters.get('request_type_id'):
+        query = query.filter(ReimbursementRequest.request_type_id == filters['request_type_id'])
+    if filters.get('date_from'):
+        query = query.filter(ReimbursementRequest.request_date >= filters['date_from'])
+    if filters.get('date_to'):
+        query = query.filter(ReimbursementRequest.request_date <= filters['date_to'])
+    return query
+
+def get_reimbursement_requests_page(filters: dict, before_id: int = None, page_size: int = TRACKING_PAGE_SIZE):
+    # Keyset pagination: newest first, the cursor is the last request_id of the previous page.
+    page_size = max(1, min(page_size, MAX_TRACKING_PAGE_SIZE))
+    session = get_session()
+    try:
+        query = session.query(ReimbursementRequest).options(lazyload(ReimbursementRequest.documents))
+        query = filter_reimbursement_requests(query, filters)
+        if before_id:
+            query = query.filter(ReimbursementRequest.request_id < before_id)
+        reimbursement_requests = query.order_by(ReimbursementRequest.request_id.desc()).limit(page_size + 1).all()
+    finally:
+        session.close()
+    next_cursor = None
+    if len(reimbursement_requests) > page_size:
+        reimbursement_requests = reimbursement_requests[:page_size]
+        next_cursor = reimbursement_requests[-1].request_id
+    return reimbursement_requests, next_cursor
+
+def get_manager_summary(manager_id: int):
+    # Counts and amount totals per status, request type and month from a single GROUP BY.
+    if manager_summary_cache_ttl > 0:
+        summary = manager_summary_cache.get(manager_id)
+        if summary is not None:
+            return summary
+
+    session = get_session()
+    try:
+        year = extract('year', ReimbursementRequest.request_date)
+        month = extract('month', ReimbursementRequest.request_date)
+        rows = (session.query(ReimbursementRequest.status, ReimbursementRequest.request_type_id, year, month,
+                              func.count(ReimbursementRequest.request_id), func.sum(ReimbursementRequest.amount))
+                .filter(ReimbursementRequest.manager_id == manager_id)
+                .group_by(ReimbursementRequest.status, ReimbursementRequest.request_type_id, year, month)
+                .all())
+    finally:
+        session.close()
+
+    type_names = {request_type.request_type_id: request_type.type_name for request_type in get_all_request_types()}
+    summary = {'total': {'count': 0, 'amount': 0.0}, 'by_status': {}, 'by_request_type': {}, 'by_month': {}}
+    for status, request_type_id, row_year, row_month, count, amount in rows:
+        buckets = [summary['total'],
+                   summary['by_status'].setdefault(status, {'count': 0, 'amount': 0.0}),
+                   summary['by_request_type'].setdefault(type_names.get(request_type_id, str(request_type_id)), {'count': 0, 'amount': 0.0}),
+                   summary['by_month'].setdefault(f'{int(row_year):04d}-{int(row_month):02d}', {'count': 0, 'amount': 0.0})]
+        for bucket in buckets:
+            bucket['count'] += count
+            bucket['amount'] += amount or 0.0
+    summary['by_month'] = dict(sorted(summary['by_month'].items()))
+
+    if manager_summary_cache_ttl > 0:
+        manager_summary_cache.set(manager_id, summary)
+    return summary
+
+EXPORT_BATCH_SIZE = 1000
+
+def iter_reimbursement_request_export(filters: dict, batch_size: int = EXPORT_BATCH_SIZE):
+    # Streams rows through a server-side cursor so memory stays flat however many rows match.
+    session = get_session()
+    try:
+        query = (session.query(ReimbursementRequest.request_id, ReimbursementRequest.employee_id,
+                               User.first_name, User.last_name, User.email,
+                               ReimbursementRequest.request_type_id, RequestType.type_name,
+                               ReimbursementRequest.amount, ReimbursementRequest.request_date,
+                               ReimbursementRequest.status, ReimbursementRequest.manager_id,
+                               ReimbursementRequest.comments)
+                 .join(User, ReimbursementRequest.employee_id == User.user_id)
+                 .join(RequestType, ReimbursementRequest.request_type_id == RequestType.request_type_id))
+        query = filter_reimbursement_requests(query, filters)
+        query = query.order_by(ReimbursementRequest.request_id.asc())
+        for row in query.execution_options(stream_results=True).yield_per(batch_size):
+            yield row
+    finally:
+        session.close()
+
 def get_document(request_id: int):
     session = get_session()
-    Document = session.query(Document).get(request_id)
-    return Document.document_path
+    try:
+        document = session.query(Document).get(request_id)
+        return document.document_path
+    finally:
+        session.close()
 
 def get_amount_limit(request_type_id :int):
-    session = get_session()
-    request_type =session.query(RequestType).filter_by(request_type_id=request_type_id).first()
+    try:
+        request_type = get_request_type(int(request_type_id))
+    except (TypeError, ValueError):
+        return None
     return request_type.amount_limit if request_type else None
 
 
 def get_notification(notification_id: int):
     session = get_session()
-    return session.query(Notification).get(notification_id)
+    try:
+        return session.query(Notification).get(notification_id)
+    finally:
+        session.close()
 
 # update funcion
 def update_user(user_id: int, updates: dict):
+    session = get_session()
     try:
-        session = get_session()
         user = session.query(User).get(user_id)
         if user:
             for key, value in updates.items():
                 setattr(user, key, value)
             session.commit()
+            invalidate_user_identity(user_id)
             session.refresh(user)
             return user
         else:
@@ -155,16 +747,19 @@ def update_user(user_id: int, updates: dict):
         print(f"Error updating user: {e}")
         session.rollback()
         return None
+    finally:
+        session.close()
 
 def update_department(department_id: int, updates: dict):
+    session = get_session()
     try:
-        session = get_session()
         department = session.query(Department).get(department_id)
         if department:
             for key, value in updates.items():
                 setattr(department, key, value)
             session.commit()
             session.refresh(department)
+            invalidate_department_cache()
             return department
         else:
             return None
@@ -172,16 +767,19 @@ def update_department(department_id: int, updates: dict):
         print(f"Error updating department: {e}")
         session.rollback()
         return None
+    finally:
+        session.close()
 
 def update_request_type(request_type_id: int, updates: dict):
+    session = get_session()
     try:
-        session = get_session()
         request_type = session.query(RequestType).get(request_type_id)
         if request_type:
             for key, value in updates.items():
                 setattr(request_type, key, value)
             session.commit()
             session.refresh(request_type)
+            invalidate_request_type_cache()
             return request_type
         else:
             return None
@@ -189,31 +787,230 @@ def update_request_type(request_type_id: int, updates: dict):
         print(f"Error updating request type: {e}")
         session.rollback()
         return None
+    finally:
+        session.close()
+
+MAX_BULK_REVIEW = 1000
+REVIEW_ATTEMPTS = 3
+
+def review_reimbursement_requests(manager_id: int, status: str, comments: dict, versions: dict = None):
+    """Approve or reject requests with optimistic locking.
+
+    ``comments`` maps request_id -> comment and ``versions`` optionally maps
+    request_id -> the version the reviewer saw. Rows are read without locks and
+    changed by one UPDATE conditioned on status='pending' and each row's version.
+    If another reviewer got in first, the batch is rolled back and re-read, so
+    their rows report not_pending (or conflict against a stale ``versions``).
+    Outcomes: approved/rejected, not_found, forbidden, not_pending, conflict or
+    comment_required.
+    """
+    versions = versions or {}
+    session = get_session()
+    try:
+        for attempt in range(REVIEW_ATTEMPTS):
+            results = dict.fromkeys(comments)
+            rows = (session.query(ReimbursementRequest.request_id, ReimbursementRequest.employee_id,
+                                  ReimbursementRequest.manager_id, ReimbursementRequest.status, ReimbursementRequest.version,
+                                  ReimbursementRequest.request_date, ReimbursementRequest.request_type_id,
+                                  ReimbursementRequest.amount, User.department_id)
+                    .outerjoin(User, User.user_id == ReimbursementRequest.employee_id)
+                    .filter(ReimbursementRequest.request_id.in_(list(comments)))
+                    .all())
+            found = {row.request_id: row for row in rows}
+            reviewable = {}
+            for request_id, comment in comments.items():
+                row = found.get(request_id)
+                if row is None:
+                    results[request_id] = 'not_found'
+                elif row.manager_id != manager_id:
+                    results[request_id] = 'forbidden'
+                elif row.status != 'pending':
+                    results[request_id] = 'not_pending'
+                elif versions.get(request_id, row.version) != row.version:
+                    results[request_id] = 'conflict'
+                elif status == 'rejected' and not comment:
+                    results[request_id] = 'comment_required'
+                else:
+                    reviewable[request_id] = comment
+            if not reviewable:
+                session.rollback()
+                return results
+
+            changes = {ReimbursementRequest.status: status,
+                       ReimbursementRequest.comments: case(reviewable, value=ReimbursementRequest.request_id),
+                       ReimbursementRequest.version: ReimbursementRequest.version + 1}
+            if status == 'rejected':
+                # A rejected claim may be corrected and submitted again, so it stops counting as a duplicate.
+                changes[ReimbursementRequest.content_hash] = None
+            updated = (session.query(ReimbursementRequest)
+                       .filter(ReimbursementRequest.request_id.in_(list(reviewable)),
+                               ReimbursementRequest.manager_id == manager_id,
+                               ReimbursementRequest.status == 'pending',
+                               ReimbursementRequest.version == case({request_id: found[request_id].version for request_id in reviewable},
+                                                                    value=ReimbursementRequest.request_id))
+                       .update(changes, synchronize_session=False))
+            if updated != len(reviewable):
+                session.rollback()
+                continue
+
+            add_status_history(session, [(request_id, 'pending', status, manager_id, comment)
+                                         for request_id, comment in reviewable.items()])
+            add_spend_rollups(session, [('pending', status, found[request_id].request_date, found[request_id].department_id,
+                                         found[request_id].request_type_id, found[request_id].amount)
+                                        for request_id in reviewable])
+            enqueue('notifications', {'messages': [(found[request_id].employee_id, f'Your reimbursement request {request_id} was {status}.')
+                                                   for request_id in reviewable]}, session=session)
+            enqueue('audit', {'message': f'Requests {sorted(reviewable)} {status} by manager {manager_id}'}, session=session)
+            session.commit()
+            invalidate_manager_summary(manager_id)
+            for request_id in reviewable:
+                results[request_id] = status
+            return results
+
+        # Lost the race on every attempt; nothing was written.
+        for request_id in reviewable:
+            results[request_id] = 'conflict'
+        return results
+    except SQLAlchemyError as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+PENDING_USERS_PAGE_SIZE = 50
+MAX_BULK_USER_REVIEW = 1000
+
+def get_pending_registrations_page(after_id: int = None, page_size: int = PENDING_USERS_PAGE_SIZE):
+    # Keyset pagination: oldest registration first, the cursor is the last user_id of the previous page.
+    page_size = max(1, min(page_size, MAX_TRACKING_PAGE_SIZE))
+    session = get_session()
+    try:
+        query = session.query(User).options(joinedload(User.department)).filter(User.user_status == 'inactive')
+        if after_id:
+            query = query.filter(User.user_id > after_id)
+        users = query.order_by(User.user_id.asc()).limit(page_size + 1).all()
+    finally:
+        session.close()
+    next_cursor = None
+    if len(users) > page_size:
+        users = users[:page_size]
+        next_cursor = users[-1].user_id
+    return users, next_cursor
+
+def _active_managers(session, *criteria):
+    return (session.query(User.user_id, User.first_name, User.last_name)
+            .filter(User.role.in_(['Manager', 'Admin']), User.user_status == 'active', *criteria))
+
+def get_manager_choices():
+    session = get_session()
+    try:
+        return _active_managers(session).order_by(User.first_name, User.last_name).all()
+    finally:
+        session.close()
+
+def approve_users(approvals: dict):
+    # approvals maps user_id -> (role, manager_id); one SELECT per table touched and one UPDATE for all of them.
+    results = dict.fromkeys(approvals)
+    session = get_session()
+    try:
+        found = {row.user_id: row for row in session.query(User.user_id, User.user_status)
+                 .filter(User.user_id.in_(list(approvals))).with_for_update()}
+        manager_ids = {manager_id for role, manager_id in approvals.values() if manager_id is not None}
+        managers = {row.user_id for row in _active_managers(session, User.user_id.in_(list(manager_ids)))} if manager_ids else set()
+        roles, manager_of = {}, {}
+        for user_id, (role, manager_id) in approvals.items():
+            role = USER_ROLES.get(role.lower()) if isinstance(role, str) else None
+            if user_id not in found:
+                results[user_id] = 'not_found'
+            elif found[user_id].user_status != 'inactive':
+                results[user_id] = 'not_pending'
+            elif role is None:
+                results[user_id] = 'invalid_role'
+            elif role == 'Employee' and manager_id is None:
+                results[user_id] = 'manager_required'
+            elif role == 'Employee' and manager_id not in managers:
+                results[user_id] = 'unknown_manager'
+            else:
+                roles[user_id] = role
+                manager_of[user_id] = manager_id if role == 'Employee' else None
+        if roles:
+            (session.query(User)
+             .filter(User.user_id.in_(list(roles)), User.user_status == 'inactive')
+             .update({User.role: case(roles, value=User.user_id),
+                      User.manager_id: case(manager_of, value=User.user_id),
+                      User.user_status: 'active'},
+                     synchronize_session=False))
+        session.commit()
+        invalidate_user_identity(*roles)
+        for user_id in roles:
+            results[user_id] = 'approved'
+        return results
+    except SQLAlchemyError as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def reject_users(user_ids):
+    # Rejected registrations are deleted, as reject_user does, but only while still pending.
+    results = dict.fromkeys(user_ids)
+    session = get_session()
+    try:
+        found = {row.user_id: row for row in session.query(User.user_id, User.user_status)
+                 .filter(User.user_id.in_(list(results))).with_for_update()}
+        rejected = []
+        for user_id in results:
+            if user_id not in found:
+                results[user_id] = 'not_found'
+            elif found[user_id].user_status != 'inactive':
+                results[user_id] = 'not_pending'
+            else:
+                rejected.append(user_id)
+        if rejected:
+            (session.query(User)
+             .filter(User.user_id.in_(rejected), User.user_status == 'inactive')
+             .delete(synchronize_session=False))
+        session.commit()
+        invalidate_user_identity(*rejected)
+        for user_id in rejected:
+            results[user_id] = 'rejected'
+        return results
+    except SQLAlchemyError as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
 
 # Delete functions
 
 def delete_user(user_id: int):
+    session = get_session()
     try:
-        session = get_session()
         user = session.query(User).get(user_id)
         if user:
             session.delete(user)
             session.commit()
+            invalidate_user_identity(user_id)
         else:
             print("User not found.")
     except SQLAlchemyError as e:
         print(f"Error deleting user: {e}")
         session.rollback()
+    finally:
+        session.close()
 
 def delete_request_type(request_type_id: int):
+    session = get_session()
     try:
-        session = get_session()
         request_type = session.query(RequestType).get(request_type_id)
         if request_type:
             session.delete(request_type)
             session.commit()
+            invalidate_request_type_cache()
         else:
             print("Request type not found.")
     except SQLAlchemyError as e:
         print(f"Error deleting request type: {e}")
-        session.rollback()        
+        session.rollback()
+    finally:
+        session.close()
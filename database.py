@@ -1,8 +1,55 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
-from config import db_config
+from sqlalchemy.pool import QueuePool
+from config import db_config, db_pool_size, db_max_overflow, db_pool_timeout, db_pool_recycle, db_pool_pre_ping
 
-engine = create_engine(db_config)
+_pool_stats_lock = threading.Lock()
+_pool_stats = {
+    'checkouts': 0,
+    'checkout_wait_seconds': 0.0,
+    'max_checkout_wait_seconds': 0.0,
+    'checkout_timeouts': 0,
+}
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to check out a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self._record_wait(started, 'checkout_timeouts')
+            raise
+        self._record_wait(started, 'checkouts')
+        return connection
+
+    @staticmethod
+    def _record_wait(started, counter):
+        # Other failures (e.g. the database refusing the connection) are not pool waits and are not counted.
+        waited = time.perf_counter() - started
+        with _pool_stats_lock:
+            _pool_stats[counter] += 1
+            _pool_stats['checkout_wait_seconds'] += waited
+            _pool_stats['max_checkout_wait_seconds'] = max(_pool_stats['max_checkout_wait_seconds'], waited)
+
+def _engine_options(url):
+    # SQLite uses its own single-connection pools which take none of these options.
+    if make_url(url).get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': db_pool_size,
+        'max_overflow': db_max_overflow,
+        'pool_timeout': db_pool_timeout,
+        'pool_recycle': db_pool_recycle,
+        'pool_pre_ping': db_pool_pre_ping,
+    }
+
+engine = create_engine(db_config, **_engine_options(db_config))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -10,3 +57,12 @@ Base = declarative_base()
 
 def get_session():
     return SessionLocal()
+
+def get_pool_stats():
+    with _pool_stats_lock:
+        stats = dict(_pool_stats)
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        stats.update(pool_size=pool.size(), checked_out=pool.checkedout(),
+                     checked_in=pool.checkedin(), overflow=pool.overflow())
+    return stats
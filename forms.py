@@ -1,15 +1,11 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, SelectField, FloatField, DateField
 from wtforms.validators import DataRequired, Email, EqualTo, Length , ValidationError
-from models import Department
-from database import get_session
+from crud import get_all_departments
 
 def get_department_choices():
-    session = get_session()
-    departments = session.query(Department).all()
-    choices = [(dept.department_id, dept.department_name) for dept in departments]
-    session.close()
-    return choices
+    # Served from the reference-data cache; called per form, never at import time.
+    return [(dept.department_id, dept.department_name) for dept in get_all_departments()]
 
 class RegistrationForm(FlaskForm):
     first_name = StringField('First Name', validators=[DataRequired(), Length(min=2, max=50)])
@@ -17,8 +13,13 @@ class RegistrationForm(FlaskForm):
     email = StringField('Email', validators=[DataRequired(), Email()])
     password = PasswordField('Password', validators=[DataRequired(), Length(min=6, max=100)])
     confirm_password = PasswordField('Confirm Password', validators=[DataRequired(), EqualTo('password')])
-    department = SelectField('Department', choices=get_department_choices(), validators=[DataRequired()])
+    department = SelectField('Department', coerce=int, validators=[DataRequired()])
     submit = SubmitField('Register')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.department.choices = get_department_choices()
+
     def validate_email(self, email):
         if not email.data.endswith('@nucleusteq.com'):
             raise ValidationError('Enter valid email')
@@ -0,0 +1,222 @@
+import json
+import logging
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from database import get_session
+from models import Job
+from config import (job_worker_threads, job_poll_interval, job_max_attempts, job_backoff_seconds,
+                    job_backoff_max_seconds, job_stale_after_seconds, job_retention_seconds, job_purge_interval)
+
+logger = logging.getLogger(__name__)
+
+handlers = {}
+
+def job_handler(job_type: str):
+    """Register ``func(payload)`` as the handler for ``job_type``."""
+    def register(func):
+        handlers[job_type] = func
+        return func
+    return register
+
+def enqueue(job_type: str, payload: dict, session=None, max_attempts: int = job_max_attempts):
+    """Queue a job.
+
+    Pass the caller's ``session`` to write the job in the same transaction as
+    the state change that caused it; the caller then commits, and the
+    worker is woken once that commit lands. Without a session the job is
+    committed on its own.
+    """
+    job = Job(job_type=job_type, payload=json.dumps(payload), status='queued', attempts=0,
+              max_attempts=max_attempts, run_at=datetime.utcnow(), created_at=datetime.utcnow())
+    if session is not None:
+        session.add(job)
+        # Waking now would only find the job invisible to other connections.
+        event.listen(session, 'after_commit', lambda committed: worker.wake(), once=True)
+        return job
+    own_session = get_session()
+    try:
+        own_session.add(job)
+        own_session.commit()
+        own_session.refresh(job)
+        worker.wake()
+        return job
+    except SQLAlchemyError:
+        own_session.rollback()
+        raise
+    finally:
+        own_session.close()
+
+def backoff_delay(attempts: int) -> float:
+    return min(job_backoff_seconds * 2 ** (attempts - 1), job_backoff_max_seconds)
+
+def claim_job():
+    # Claim by a conditional UPDATE so concurrent workers never run the same job twice.
+    session = get_session()
+    try:
+        now = datetime.utcnow()
+        candidates = (session.query(Job.job_id)
+                      .filter(Job.status == 'queued', Job.run_at <= now)
+                      .order_by(Job.run_at.asc())
+                      .limit(10)
+                      .all())
+        for candidate in candidates:
+            claimed = (session.query(Job)
+                       .filter(Job.job_id == candidate.job_id, Job.status == 'queued')
+                       .update({Job.status: 'running', Job.locked_at: now, Job.attempts: Job.attempts + 1},
+                               synchronize_session=False))
+            session.commit()
+            if claimed:
+                job = session.query(Job).get(candidate.job_id)
+                session.expunge(job)
+                return job
+        return None
+    finally:
+        session.close()
+
+def finish_job(job, error: str = None):
+    session = get_session()
+    try:
+        values = {Job.locked_at: None}
+        if error is None:
+            values[Job.status] = 'done'
+            values[Job.last_error] = None
+        elif job.attempts >= job.max_attempts:
+            values[Job.status] = 'dead'
+            values[Job.last_error] = error
+        else:
+            values[Job.status] = 'queued'
+            values[Job.last_error] = error
+            values[Job.run_at] = datetime.utcnow() + timedelta(seconds=backoff_delay(job.attempts))
+        session.query(Job).filter(Job.job_id == job.job_id).update(values, synchronize_session=False)
+        session.commit()
+    finally:
+        session.close()
+
+def run_job(job):
+    handler = handlers.get(job.job_type)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job type {job.job_type!r}')
+        handler(json.loads(job.payload))
+    except Exception:
+        logger.warning('Job %s (%s) failed on attempt %s', job.job_id, job.job_type, job.attempts, exc_info=True)
+        finish_job(job, traceback.format_exc(limit=5))
+        return False
+    finish_job(job)
+    return True
+
+def run_pending(limit: int = None):
+    """Run due jobs in the calling thread until none are left; returns how many ran."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_job()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+def requeue_stale_jobs():
+    # Jobs left 'running' by a worker that died are picked up again.
+    session = get_session()
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=job_stale_after_seconds)
+        requeued = (session.query(Job)
+                    .filter(Job.status == 'running', Job.locked_at < cutoff)
+                    .update({Job.status: 'queued', Job.locked_at: None}, synchronize_session=False))
+        session.commit()
+        return requeued
+    finally:
+        session.close()
+
+def purge_done_jobs(batch_size: int = 1000):
+    # run_at of a done job is when it last ran, so it dates the job's completion closely enough.
+    session = get_session()
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=job_retention_seconds)
+        purged = 0
+        while True:
+            batch = [row.job_id for row in session.query(Job.job_id)
+                     .filter(Job.status == 'done', Job.run_at < cutoff).limit(batch_size)]
+            if not batch:
+                return purged
+            purged += session.query(Job).filter(Job.job_id.in_(batch)).delete(synchronize_session=False)
+            session.commit()
+    finally:
+        session.close()
+
+class JobWorker:
+    """Pool of daemon threads polling the jobs table."""
+
+    def __init__(self, threads: int = job_worker_threads, poll_interval: float = job_poll_interval):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._purge_lock = threading.Lock()
+        self._next_purge = 0.0
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping.clear()
+        try:
+            requeue_stale_jobs()
+        except SQLAlchemyError:
+            logger.exception('Could not requeue stale jobs')
+        self._threads = [threading.Thread(target=self._loop, name=f'job-worker-{i}', daemon=True)
+                         for i in range(self.threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self, timeout: float = 10):
+        """Let running jobs finish, then stop the threads."""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _purge_if_due(self):
+        # Only one thread purges, at most once per job_purge_interval.
+        with self._purge_lock:
+            if time.monotonic() < self._next_purge:
+                return
+            self._next_purge = time.monotonic() + job_purge_interval
+        try:
+            purged = purge_done_jobs()
+            if purged:
+                logger.info('Purged %s finished jobs', purged)
+        except SQLAlchemyError:
+            logger.exception('Could not purge finished jobs')
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            self._purge_if_due()
+            try:
+                job = claim_job()
+            except SQLAlchemyError:
+                logger.exception('Could not claim a job')
+                job = None
+            if job is not None:
+                try:
+                    run_job(job)
+                except SQLAlchemyError:
+                    logger.exception('Could not record the result of job %s', job.job_id)
+                continue
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+worker = JobWorker()
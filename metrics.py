@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from config import slow_query_threshold_ms, server_timing_header
+
+slow_query_logger = logging.getLogger('slow_query')
+
+class RouteMetrics:
+    """Per-endpoint request, latency and database counters."""
+
+    FIELDS = ('requests', 'wall_seconds', 'max_wall_seconds', 'queries', 'db_seconds', 'rows')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, wall_seconds, queries, db_seconds, rows):
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, dict.fromkeys(self.FIELDS, 0))
+            stats['requests'] += 1
+            stats['wall_seconds'] += wall_seconds
+            stats['max_wall_seconds'] = max(stats['max_wall_seconds'], wall_seconds)
+            stats['queries'] += queries
+            stats['db_seconds'] += db_seconds
+            stats['rows'] += rows
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: dict(stats) for endpoint, stats in self._endpoints.items()}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+route_metrics = RouteMetrics()
+
+PROMETHEUS_METRICS = [
+    ('portal_requests_total', 'counter', 'Requests handled per endpoint.', 'requests'),
+    ('portal_request_duration_seconds_total', 'counter', 'Total wall time spent per endpoint.', 'wall_seconds'),
+    ('portal_request_duration_seconds_max', 'gauge', 'Slowest request seen per endpoint.', 'max_wall_seconds'),
+    ('portal_db_queries_total', 'counter', 'SQL statements executed per endpoint.', 'queries'),
+    ('portal_db_duration_seconds_total', 'counter', 'Total time spent in SQL per endpoint.', 'db_seconds'),
+    ('portal_db_rows_total', 'counter', 'Rows returned or affected per endpoint, where the driver reports it.', 'rows'),
+]
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_prometheus(extra_gauges=None):
+    snapshot = route_metrics.snapshot()
+    lines = []
+    for name, metric_type, description, field in PROMETHEUS_METRICS:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for endpoint, stats in sorted(snapshot.items()):
+            lines.append(f'{name}{{endpoint="{_escape_label(endpoint)}"}} {stats[field]}')
+    for name, value in (extra_gauges or {}).items():
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, which is dropped with the statement even when it fails.
+    context._query_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    if elapsed * 1000 >= slow_query_threshold_ms:
+        slow_query_logger.warning('Slow query (%.1f ms): %s', elapsed * 1000, ' '.join(statement.split())[:1000])
+    if has_request_context() and 'query_count' in g:
+        g.query_count += 1
+        g.query_seconds += elapsed
+        # Drivers report -1 when the row count of a SELECT is not known up front.
+        g.query_rows += max(cursor.rowcount, 0)
+
+def instrument_engine(engine):
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+def init_app(app, engine):
+    """Time every request and count the SQL it runs on ``engine``."""
+    instrument_engine(engine)
+
+    @app.before_request
+    def start_metrics():
+        g.metrics_started = time.perf_counter()
+        g.query_count = 0
+        g.query_seconds = 0.0
+        g.query_rows = 0
+
+    @app.after_request
+    def record_metrics(response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        wall_seconds = time.perf_counter() - started
+        route_metrics.record(request.endpoint or 'unknown', wall_seconds, g.query_count, g.query_seconds, g.query_rows)
+        if server_timing_header:
+            response.headers['Server-Timing'] = (f'app;dur={wall_seconds * 1000:.1f}, '
+                                                 f'db;dur={g.query_seconds * 1000:.1f};desc="{g.query_count} queries"')
+        return response
@@ -0,0 +1,13 @@
+from sqlalchemy import inspect, text
+from database import engine
+
+# create_all() does not add columns to existing tables; add the submission dedup keys once,
+# then run create_indexes.py for their unique indexes.
+columns = {column['name'] for column in inspect(engine).get_columns('reimbursement_requests')}
+with engine.begin() as connection:
+    for name in ('idempotency_key', 'content_hash'):
+        if name not in columns:
+            connection.execute(text(f'ALTER TABLE reimbursement_requests ADD COLUMN {name} VARCHAR(64)'))
+    # Rejected requests do not block resubmitting the same claim.
+    connection.execute(text("UPDATE reimbursement_requests SET content_hash = NULL "
+                            "WHERE status = 'rejected' AND content_hash IS NOT NULL"))
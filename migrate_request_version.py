@@ -0,0 +1,7 @@
+from sqlalchemy import inspect, text
+from database import engine
+
+# create_all() does not add columns to existing tables; add reimbursement_requests.version once.
+if 'version' not in {column['name'] for column in inspect(engine).get_columns('reimbursement_requests')}:
+    with engine.begin() as connection:
+        connection.execute(text('ALTER TABLE reimbursement_requests ADD COLUMN version INTEGER NOT NULL DEFAULT 1'))
@@ -1,10 +1,13 @@
 from database import Base
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, Text, Float, TIMESTAMP, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, Text, Float, TIMESTAMP, Boolean, Index
 from sqlalchemy.orm import relationship
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('ix_users_user_status_role', 'user_status', 'role'),
+    )
     
     user_id = Column(Integer, primary_key=True)
     first_name = Column(String(50), nullable=False)
@@ -34,6 +37,12 @@ class RequestType(Base):
 
 class ReimbursementRequest(Base):
     __tablename__ = 'reimbursement_requests'
+    __table_args__ = (
+        Index('ix_reimbursement_requests_manager_id_status', 'manager_id', 'status'),
+        # Leads with employee_id, so it also serves the per-employee lookups and the foreign key.
+        Index('ux_reimbursement_requests_employee_id_idempotency_key', 'employee_id', 'idempotency_key', unique=True),
+        Index('ux_reimbursement_requests_content_hash', 'content_hash', unique=True),
+    )
     
     request_id = Column(Integer, primary_key=True)
     employee_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)
@@ -43,22 +52,34 @@ class ReimbursementRequest(Base):
     status = Column(String(20), nullable=False)
     comments = Column(Text)
     manager_id = Column(Integer, ForeignKey('users.user_id'))
+    # Bumped by every review; reviews only apply to the version the reviewer read.
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    # Dedup keys for retried submissions; NULL for requests created before they existed.
+    idempotency_key = Column(String(64))
+    content_hash = Column(String(64))
     
     employee = relationship('User', foreign_keys=[employee_id])
     manager = relationship('User', foreign_keys=[manager_id])
+    documents = relationship('Document', back_populates='reimbursement_request', lazy='selectin')
 
 class Document(Base):
     __tablename__ = 'documents'
+    __table_args__ = (
+        Index('ix_documents_request_id', 'request_id'),
+    )
     
     document_id = Column(Integer, primary_key=True)
     request_id = Column(Integer, ForeignKey('reimbursement_requests.request_id'), nullable=False)
     document_path = Column(String(255), nullable=False)
     
-    reimbursement_request = relationship('ReimbursementRequest')
+    reimbursement_request = relationship('ReimbursementRequest', back_populates='documents')
 
     
 class Notification(Base):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        Index('ix_notifications_user_id_is_read_created_at', 'user_id', 'is_read', 'created_at'),
+    )
     
     notification_id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)
@@ -68,3 +89,50 @@ class Notification(Base):
     
     user = relationship('User')
 
+
+class Job(Base):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+    job_id = Column(Integer, primary_key=True)
+    job_type = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default='queued')
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    run_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+    locked_at = Column(TIMESTAMP)
+    last_error = Column(Text)
+    created_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+
+
+class RequestStatusHistory(Base):
+    # Append-only: rows are inserted on every status change and never updated.
+    __tablename__ = 'request_status_history'
+    __table_args__ = (
+        Index('ix_request_status_history_request_id_changed_at', 'request_id', 'changed_at'),
+        Index('ix_request_status_history_new_status_changed_at', 'new_status', 'changed_at'),
+    )
+
+    history_id = Column(Integer, primary_key=True)
+    request_id = Column(Integer, ForeignKey('reimbursement_requests.request_id'), nullable=False)
+    old_status = Column(String(20))
+    new_status = Column(String(20), nullable=False)
+    actor_id = Column(Integer, ForeignKey('users.user_id'))
+    comment = Column(Text)
+    changed_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+
+
+class MonthlySpendRollup(Base):
+    # Maintained incrementally as requests are reviewed; rebuild_rollups.py recomputes it.
+    __tablename__ = 'monthly_spend_rollups'
+
+    year = Column(Integer, primary_key=True, autoincrement=False)
+    month = Column(Integer, primary_key=True, autoincrement=False)
+    department_id = Column(Integer, primary_key=True, autoincrement=False)  # 0 when the employee has none
+    request_type_id = Column(Integer, primary_key=True, autoincrement=False)
+    status = Column(String(20), primary_key=True)
+    request_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Float, nullable=False, default=0)
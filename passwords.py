@@ -0,0 +1,64 @@
+import hmac
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import check_password_hash, generate_password_hash
+from config import (password_hash_algorithm, password_hash_iterations, password_salt_length, password_hash_threads,
+                    password_hash_max_pending, password_hash_timeout)
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hashes are already queued."""
+
+class PasswordHasher:
+    """PBKDF2 hashing through werkzeug at a configurable work factor.
+
+    Subclass and assign to ``passwords.hasher`` to use another scheme; hashes
+    that ``needs_rehash`` are upgraded on the next successful login.
+    """
+
+    def __init__(self, algorithm: str = password_hash_algorithm, iterations: int = password_hash_iterations,
+                 salt_length: int = password_salt_length):
+        self.method = f'pbkdf2:{algorithm}:{iterations}'
+        self.salt_length = salt_length
+
+    def hash(self, password: str) -> str:
+        return generate_password_hash(password, method=self.method, salt_length=self.salt_length)
+
+    def verify(self, stored: str, password: str) -> bool:
+        # Werkzeug hashes look like method$salt$hash; anything else is a legacy plaintext password.
+        if stored.count('$') >= 2:
+            try:
+                return check_password_hash(stored, password)
+            except ValueError:
+                pass
+        return hmac.compare_digest(stored.encode(), password.encode())
+
+    def needs_rehash(self, stored: str) -> bool:
+        return not stored.startswith(self.method + '$')
+
+hasher = PasswordHasher()
+
+# Hashing is deliberately slow; a small pool caps how many CPUs a login storm can take,
+# and the semaphore sheds load instead of letting waiting requests pile up behind it.
+_executor = ThreadPoolExecutor(max_workers=password_hash_threads, thread_name_prefix='password-hash')
+_slots = threading.BoundedSemaphore(password_hash_threads + password_hash_max_pending)
+
+def make_hash(password: str) -> str:
+    # Synchronous, for callers that do their own batching (e.g. worker processes).
+    return hasher.hash(password)
+
+def _run(func, *args):
+    if not _slots.acquire(timeout=password_hash_timeout):
+        raise PasswordHasherBusy()
+    try:
+        return _executor.submit(func, *args).result()
+    finally:
+        _slots.release()
+
+def hash_password(password: str) -> str:
+    return _run(hasher.hash, password)
+
+def check_password(stored: str, password: str):
+    """Return ``(matches, needs_rehash)`` for ``password`` against the stored hash."""
+    current = hasher
+    matches = _run(current.verify, stored, password)
+    return matches, matches and current.needs_rehash(stored)
@@ -0,0 +1,4 @@
+from crud import rebuild_monthly_spend_rollups
+
+# Recomputes monthly_spend_rollups from reimbursement_requests, e.g. after a backfill or import.
+print(f'{rebuild_monthly_spend_rollups()} rollup rows written')
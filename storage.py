@@ -0,0 +1,48 @@
+import hashlib
+import os
+import re
+import tempfile
+from werkzeug.utils import secure_filename
+
+CHUNK_SIZE = 64 * 1024
+CONTENT_PATH_RE = re.compile(r'^([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60})(\.[a-z0-9]+)?$')
+
+def content_path(digest: str, extension: str) -> str:
+    # Two levels of sharding keep any one directory small: ab/cd/abcd....pdf
+    return '/'.join([digest[:2], digest[2:4], digest + extension])
+
+def content_digest(relative_path: str):
+    # The SHA-256 of a content-addressed path, or None for legacy flat uploads.
+    match = CONTENT_PATH_RE.match(relative_path)
+    return match.group(3) if match else None
+
+def store_upload(file_storage, upload_folder: str) -> str:
+    """Stream an uploaded file to disk in CHUNK_SIZE pieces while hashing it.
+
+    The file is stored under its SHA-256 digest, so identical receipts share
+    one copy. Returns the path relative to ``upload_folder``.
+    """
+    extension = os.path.splitext(secure_filename(file_storage.filename or ''))[1].lower()
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=upload_folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                temp_file.write(chunk)
+
+        relative_path = content_path(digest.hexdigest(), extension)
+        final_path = os.path.join(upload_folder, *relative_path.split('/'))
+        if os.path.exists(final_path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(temp_path, final_path)
+        return relative_path
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
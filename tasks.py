@@ -0,0 +1,35 @@
+"""Handlers for the background job queue in jobs.py.
+
+Run a standalone worker with ``python tasks.py``; the web app also starts one
+in-process on its first request.
+"""
+import logging
+import signal
+import threading
+from crud import create_notifications, notify_admins
+from jobs import job_handler, worker
+
+audit_logger = logging.getLogger('audit')
+
+@job_handler('notifications')
+def send_notifications(payload):
+    create_notifications([tuple(message) for message in payload['messages']])
+
+@job_handler('notify_admins')
+def send_admin_notification(payload):
+    notify_admins(payload['message'])
+
+@job_handler('audit')
+def write_audit(payload):
+    audit_logger.info(payload['message'])
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stopped.set())
+    worker.start()
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    worker.stop()
@@ -0,0 +1,41 @@
+import pytest
+from unittest.mock import patch
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from flask import session
+import crud
+from app import app
+from models import Base
+
+# Shared by the tests that run crud and the app against an in-memory database.
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+def session_identity(user_id):
+    return crud.UserIdentity(user_id, session.get('role'), 'active', session.get('manager_id'))
+
+@pytest.fixture
+def client(engine):
+    app.config['TESTING'] = True
+    app.config['SECRET_KEY'] = 'your_secret_key_here'
+    TestSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with patch('app.get_session', TestSession), patch('app.get_user_identity', side_effect=session_identity):
+        with app.test_client() as client:
+            yield client
+
+@pytest.fixture
+def statements(engine):
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
@@ -0,0 +1,28 @@
+from datetime import date
+from sqlalchemy.orm import sessionmaker
+from models import User, Department, RequestType, ReimbursementRequest, Document
+
+def seed(engine, count):
+    session = sessionmaker(bind=engine)()
+    session.add(Department(department_id=1, department_name='IT'))
+    session.add(RequestType(request_type_id=1, type_name='Travel', amount_limit=1000))
+    session.add(User(user_id=1, first_name='Manager', last_name='One', email='manager@nucleusteq.com',
+                     password='x', role='Manager', user_status='active', department_id=1))
+    session.add(User(user_id=2, first_name='Employee', last_name='One', email='employee@nucleusteq.com',
+                     password='x', role='Employee', user_status='active', manager_id=1, department_id=1))
+    for status in ('pending', 'approved', 'rejected'):
+        for i in range(count):
+            request = ReimbursementRequest(employee_id=2, request_type_id=1, amount=100, request_date=date(2024, 1, 1),
+                                           status=status, manager_id=1)
+            request.documents = [Document(document_path=f'{status}_{i}_a.pdf'), Document(document_path=f'{status}_{i}_b.pdf')]
+            session.add(request)
+    session.commit()
+    session.close()
+
+def add_registrations(engine, count):
+    session = sessionmaker(bind=engine)()
+    for i in range(count):
+        session.add(User(user_id=100 + i, first_name='New', last_name=str(i), email=f'new{i}@nucleusteq.com',
+                         password='x', role='pending', user_status='inactive', department_id=1))
+    session.commit()
+    session.close()
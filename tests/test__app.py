@@ -1,433 +1,928 @@
-import pytest
-from app import app
-from flask import session
-from unittest.mock import patch, MagicMock
-from crud import get_document
-import os
-
-@pytest.fixture
-def client():
-    app.config['TESTING'] = True
-    app.config['SECRET_KEY'] = 'your_secret_key_here'
-    with app.test_client() as client:
-        with app.app_context():
-            yield client
-
-# Tests for Flask routes
-@patch('app.get_session')
-@patch('app.RegistrationForm')
-@patch('app.create_user')
-@patch('app.create_notification')
-def test_register(mock_create_notification, mock_create_user, mock_RegistrationForm, mock_get_session, client):
-    mock_form = MagicMock()
-    mock_form.validate_on_submit.return_value = True
-    mock_form.first_name.data = 'John'
-    mock_form.last_name.data = 'Doe'
-    mock_form.email.data = 'john.doe@example.com'
-    mock_form.password.data = 'password123'
-    mock_form.department.data = '1'
-    mock_RegistrationForm.return_value = mock_form
-
-    mock_session = MagicMock()
-    mock_get_session.return_value = mock_session
-    mock_department = MagicMock()
-    mock_department.department_id = 1
-    mock_department.department_name = 'HR'
-    mock_session.query().all.return_value = [mock_department]
-
-    mock_user = MagicMock()
-    mock_create_user.return_value = mock_user
-
-    response = client.post('/register', data=dict(
-        first_name='John',
-        last_name='Doe',
-        email='john.doe@example.com',
-        password='password123',
-        department='1'
-    ), follow_redirects=True)
-
-    assert response.status_code == 200
-    mock_create_user.assert_called_once_with('John', 'Doe', 'john.doe@example.com', 'password123', 'pending', 'inactive', None, '1')
-    mock_create_notification.assert_called_once()
-    assert b'Registration successful, awaiting admin approval.' in response.data
-
-@patch('app.get_session')
-@patch('app.LoginForm')
-def test_login(mock_LoginForm, mock_get_session, client):
-    mock_form = MagicMock()
-    mock_form.validate_on_submit.return_value = True
-    mock_form.email.data = 'john.doe@nucleusteq.com'
-    mock_form.password.data = 'password123'
-    mock_LoginForm.return_value = mock_form
-
-    mock_session = MagicMock()
-    mock_get_session.return_value = mock_session
-    mock_user = MagicMock()
-    mock_user.user_status = 'active'
-    mock_user.password = 'password123'
-    mock_user.role = 'Employee'
-    mock_user.user_id = 1
-    mock_user.manager_id = None
-    mock_session.query().filter_by().first.return_value = mock_user
-
-    response = client.post('/login', data=dict(
-        email='john.doe@nucleusteq.com',
-        password='password123'
-    ), follow_redirects=True)
-
-    assert response.status_code == 200
-    assert session['user_id'] == 1
-    assert session['role'] == 'Employee'
-    assert b'Employee Dashboard' in response.data  # Assuming the dashboard has this string
-
-def test_logout(client):
-    with client.session_transaction() as sess:
-        sess['user_id'] = 1
-        sess['role'] = 'Employee'
-    
-    response = client.get('/logout', follow_redirects=True)
-
-    assert response.status_code == 200
-    assert 'user_id' not in session
-    assert 'role' not in session
-    assert b'Home' in response.data  # Assuming the home page has this string
-
-
-def test_home(client):
-    """Test the home page route."""
-    response = client.get('/')
-    assert response.status_code == 200
-    assert b'Home' in response.data
-
-def test_error(client):
-    """Test the error page route."""
-    response = client.get('/error')
-    assert response.status_code == 200
-    assert b'Error page' in response.data
-
-@patch('app.get_session')
-@patch('app.get_all_reimbursement_requests')
-def test_admin_dashboard(mock_get_all_reimbursement_requests, mock_get_session, client):
-    with client.session_transaction() as sess:
-        sess['user_id'] = 1
-        sess['role'] = 'Admin'
-    
-    mock_session = MagicMock()
-    mock_get_session.return_value = mock_session
-    mock_user = MagicMock()
-    mock_session.query().filter_by().all.return_value = [mock_user]
-
-    mock_reimbursement_request = MagicMock()
-    mock_get_all_reimbursement_requests.return_value = [mock_reimbursement_request]
-
-    response = client.get('/admin_dashboard')
-
-    assert response.status_code == 200
-    assert b'Admin Dashboard' in response.data
-    mock_get_all_reimbursement_requests.assert_called_once()
-    
-
-@patch('app.get_session')
-def test_pending_user_registration(mock_get_session, client):
-    with client.session_transaction() as sess:
-        sess['user_id'] = 1
-        sess['role'] = 'Admin'
-    
-    mock_session = MagicMock()
-    mock_get_session.return_value = mock_session
-    mock_user_inactive = MagicMock()
-    mock_user_manager = MagicMock()
-    mock_session.query().filter_by().options().all.return_value = [mock_user_inactive]
-    mock_session.query().filter().all.return_value = [mock_user_manager]
-
-    response = client.get('/pending_user_registration')
-
-    assert response.status_code == 200
-    assert b'Pending User Registration' in response.data
-
-@patch('app.get_session')
-def test_approve_user(mock_get_session, client):
-    with client.session_transaction() as sess:
-        sess['user_id'] = 1
-        sess['role'] = 'Admin'
-
-    mock_session = MagicMock()
-    mock_get_session.return_value = mock_session
-    mock_user = MagicMock()
-    mock_user.email = 'test@example.com'
-    mock_session.query().get.return_value = mock_user
-
-    response = client.post('/approve_user/1', data=dict(role='Employee', manager_id=2), follow_redirects=True)
-
-    assert response.status_code == 200
-    mock_session.commit.assert_called_once()
-    assert b'User test@example.com approved successfully.' in response.data
-
-@patch('app.get_session')
-def test_reject_user(mock_get_session, client):
-    with client.session_transaction() as sess:
-        sess['user_id'] = 1
-        sess['role'] = 'Admin'
-
-    mock_session = MagicMock()
-    mock_get_session.return_value = mock_session
-    mock_user = MagicMock()
-    mock_user.email = 'test@example.com'
-    mock_session.query().get.return_value = mock_user
-
-    response = client.post('/reject_user/1', follow_redirects=True)
-
-    assert response.status_code == 200
-    mock_session.delete.assert_called_once_with(mock_user)
-    mock_session.commit.assert_called_once()
-    assert b'User test@example.com request rejected and deleted successfully.' in response.data
-    
-    
-
-@patch('app.get_session')
-@patch('app.get_all_reimbursement_requests')
-def test_reimbursement_request_tracking(mock_get_all_reimbursement_requests, mock_get_session, client):
-    mock_session = MagicMock()
-    mock_get_session.return_value = mock_session
-    mock_reimbursement_request = MagicMock()
-    mock_get_all_reimbursement_requests.return_value = [mock_reimbursement_request]
-
-    response = client.get('/reimbursement_request_tracking')
-
-    assert response.status_code == 200
-    assert b'Reimbursement Request Tracking' in response.data  # Assuming the page has this string
-    mock_get_all_reimbursement_requests.assert_called_once()
-    mock_session.close.assert_called_once()
-    
-    
-    
-@patch('app.get_session')
-def test_manage_departments(mock_get_session, client):
-    mock_session = mock_get_session.return_value
-    mock_department = MagicMock()
-    mock_session.query().order_by().all.return_value = [mock_department]
-
-    response = client.get('/manage_departments')
-    assert response.status_code == 200
-    assert b'Manage Departments' in response.data
-
-@patch('app.get_session')
-def test_add_department(mock_get_session, client):
-    mock_session = mock_get_session.return_value
-
-    response = client.post('/add_department', data=dict(department_name='IT', department_id='123'))
-    assert response.status_code == 302  # Redirect status
-    mock_session.add.assert_called_once()
-    mock_session.commit.assert_called_once()
-
-@patch('app.get_session')
-def test_manage_users(mock_get_session, client):
-    mock_session = mock_get_session.return_value
-    mock_user = MagicMock()
-    mock_session.query().filter().all.return_value = [mock_user]
-
-    with client.session_transaction() as sess:
-        sess['user_id'] = 1
-        sess['role'] = 'Admin'
-
-    response = client.get('/manage_users')
-    assert response.status_code == 200
-    assert b'Manage Users' in response.data
-
-@patch('app.get_session')
-def test_edit_user(mock_get_session, client):
-    mock_session = mock_get_session.return_value
-    mock_user = MagicMock()
-    mock_manager = MagicMock()
-    mock_session.query().get.return_value = mock_user
-    mock_session.query().filter().all.return_value = [mock_manager]
-
-    with client.session_transaction() as sess:
-        sess['user_id'] = 1
-        sess['role'] = 'Admin'
-
-    response = client.get('/edit_user/1')
-    assert response.status_code == 200
-    assert b'Edit User' in response.data
-
-@patch('app.get_session')
-def test_update_user(mock_get_session, client):
-    mock_session = mock_get_session.return_value
-    mock_user = MagicMock()
-    mock_session.query().get.return_value = mock_user
-
-    with client.session_transaction() as sess:
-        sess['user_id'] = 1
-        sess['role'] = 'Admin'
-
-    response = client.post('/update_user/1', data=dict(role='employee', manager_id='2'))
-    assert response.status_code == 302  # Redirect status
-    mock_user.role = 'employee'
-    mock_user.manager_id = '2'
-    mock_session.commit.assert_called_once()
-
-@patch('app.get_session')
-def test_delete_user(mock_get_session, client):
-    mock_session = mock_get_session.return_value
-    mock_user = MagicMock()
-    mock_session.query().get.return_value = mock_user
-
-    with client.session_transaction() as sess:
-        sess['user_id'] = 1
-        sess['role'] = 'Admin'
-
-    response = client.post('/delete_user/1')
-    assert response.status_code == 302  # Redirect status
-    mock_user.user_status = 'deleted'
-    mock_session.commit.assert_called_once()
-
-@patch('app.get_session')
-def test_employee_dashboard(mock_get_session, client):
-    with client.session_transaction() as sess:
-        sess['user_id'] = 1
-        sess['role'] = 'Employee'
-
-    response = client.get('/employee_dashboard')
-    assert response.status_code == 200
-    assert b'Employee Dashboard' in response.data
-
-@patch('app.get_all_request_types')
-@patch('app.create_reimbursement_request')
-@patch('app.create_document')
-@patch('app.get_session')
-def test_submit_reimbursement(mock_get_session, mock_create_document, mock_create_reimbursement_request, mock_get_all_request_types, client):
-    mock_get_all_request_types.return_value = [{'request_type_id': 1, 'request_type': 'Travel'}]
-
-    with client.session_transaction() as sess:
-        sess['user_id'] = 1
-        sess['manager_id'] = 2
-
-    response = client.get('/submit_reimbursement')
-    assert response.status_code == 200
-    assert b'Submit Reimbursement' in response.data
-
-    with open('test_document.txt', 'w') as f:
-        f.write('test content')
-
-    with open('test_document.txt', 'rb') as f:
-        data = {
-            'request_type_id': 1,
-            'amount': '100.0',
-            'request_date': '2024-01-01',
-            'document': (f, 'test_document.txt')
-        }
-
-        response = client.post('/submit_reimbursement', data=data, content_type='multipart/form-data')
-        assert response.status_code == 302
-        mock_create_reimbursement_request.assert_called_once()
-        mock_create_document.assert_called_once()
-
-    os.remove('test_document.txt')
-
-
-@patch('app.get_session')
-def test_history(mock_get_session, client):
-    mock_session = mock_get_session.return_value
-    mock_request = MagicMock()
-    mock_document = MagicMock()
-    mock_session.query().filter_by().all.return_value = [mock_request]
-    mock_session.query().filter_by().all.return_value = [mock_document]
-
-    with client.session_transaction() as sess:
-        sess['user_id'] = 1
-        sess['role'] = 'Employee'
-
-    response = client.get('/history')
-    assert response.status_code == 200
-    assert b'History' in response.data
-
-
-@patch('app.get_session')
-def test_manager_dashboard(mock_get_session, client):
-    with client.session_transaction() as sess:
-        sess['user_id'] = 2
-        sess['role'] = 'Manager'
-
-    response = client.get('/manager_dashboard')
-    assert response.status_code == 200
-    assert b'Manager Dashboard' in response.data
-
-@patch('app.get_session')
-def test_pending_requests(mock_get_session, client):
-    mock_session = mock_get_session.return_value
-    mock_request = MagicMock()
-    mock_user = MagicMock()
-    mock_request_type = MagicMock()
-    mock_session.query().join().join().filter().all.return_value = [(mock_request, mock_user, mock_request_type)]
-    
-    with client.session_transaction() as sess:
-        sess['user_id'] = 2
-        sess['role'] = 'Manager'
-
-    response = client.get('/pending_requests')
-    assert response.status_code == 200
-    
-
-@patch('app.get_session')
-def test_approve_reimbursement(mock_get_session, client):
-    mock_session = mock_get_session.return_value
-    mock_request = MagicMock()
-    mock_request.manager_id = 2
-    mock_session.query().filter_by().first.return_value = mock_request
-
-    with client.session_transaction() as sess:
-        sess['user_id'] = 2
-        sess['role'] = 'Manager'
-
-    response = client.post('/approve_reimbursement/1', data={'comments': 'Approved'})
-    assert response.status_code == 302
-    assert mock_request.status == 'approved'
-    assert mock_request.comments == 'Approved'
-
-@patch('app.get_session')
-def test_reject_reimbursement(mock_get_session, client):
-    mock_session = mock_get_session.return_value
-    mock_request = MagicMock()
-    mock_request.manager_id = 2
-    mock_session.query().filter_by().first.return_value = mock_request
-
-    with client.session_transaction() as sess:
-        sess['user_id'] = 2
-        sess['role'] = 'Manager'
-
-    response = client.post('/reject_reimbursement/1', data={'comments': 'Rejected'})
-    assert response.status_code == 302
-    assert mock_request.status == 'rejected'
-    assert mock_request.comments == 'Rejected'
-
-@patch('app.get_session')
-def test_approved_requests(mock_get_session, client):
-    mock_session = mock_get_session.return_value
-    mock_request = MagicMock()
-    mock_user = MagicMock()
-    mock_request_type = MagicMock()
-    mock_session.query().join().join().filter().all.return_value = [(mock_request, mock_user, mock_request_type)]
-    
-    with client.session_transaction() as sess:
-        sess['user_id'] = 2
-        sess['role'] = 'Manager'
-
-    response = client.get('/approved_requests')
-    assert response.status_code == 200
-    assert b'Approved Requests' in response.data
-
-@patch('app.get_session')
-def test_rejected_requests(mock_get_session, client):
-    mock_session = mock_get_session.return_value
-    mock_request = MagicMock()
-    mock_user = MagicMock()
-    mock_request_type = MagicMock()
-    mock_session.query().join().join().filter().all.return_value = [(mock_request, mock_user, mock_request_type)]
-    
-    with client.session_transaction() as sess:
-        sess['user_id'] = 2
-        sess['role'] = 'Manager'
-
-    response = client.get('/rejected_requests')
-    assert response.status_code == 200
-    assert b'Rejected Requests' in response.data
+import pytest
+from app import app
+import metrics
+from flask import session
+from unittest.mock import patch, MagicMock
+from crud import get_document, UserIdentity, DuplicateSubmission, submission_hash
+from passwords import PasswordHasherBusy
+from datetime import date, datetime
+import io
+import json
+import os
+
+def session_identity(user_id):
+    # Treat whatever the test put in the session as the user's current record.
+    return UserIdentity(user_id, session.get('role'), 'active', session.get('manager_id'))
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SECRET_KEY'] = 'your_secret_key_here'
+    with patch('app.get_unread_count', return_value=0), patch('app.get_user_identity', side_effect=session_identity):
+        with app.test_client() as client:
+            with app.app_context():
+                yield client
+
+# Tests for Flask routes
+@patch('app.RegistrationForm')
+@patch('app.create_user')
+@patch('app.enqueue')
+def test_register(mock_enqueue, mock_create_user, mock_RegistrationForm, client):
+    mock_form = MagicMock()
+    mock_form.validate_on_submit.return_value = True
+    mock_form.first_name.data = 'John'
+    mock_form.last_name.data = 'Doe'
+    mock_form.email.data = 'john.doe@example.com'
+    mock_form.password.data = 'password123'
+    mock_form.department.data = '1'
+    mock_RegistrationForm.return_value = mock_form
+
+    mock_user = MagicMock()
+    mock_create_user.return_value = mock_user
+
+    response = client.post('/register', data=dict(
+        first_name='John',
+        last_name='Doe',
+        email='john.doe@example.com',
+        password='password123',
+        department='1'
+    ), follow_redirects=True)
+
+    assert response.status_code == 200
+    mock_create_user.assert_called_once_with('John', 'Doe', 'john.doe@example.com', 'password123', 'pending', 'inactive', None, '1')
+    mock_enqueue.assert_called_once()
+    assert mock_enqueue.call_args[0][0] == 'notify_admins'
+    assert b'Registration successful, awaiting admin approval.' in response.data
+
+@patch('app.RegistrationForm')
+@patch('app.create_user')
+@patch('app.enqueue')
+def test_register_sheds_load_when_hasher_busy(mock_enqueue, mock_create_user, mock_RegistrationForm, client):
+    mock_RegistrationForm.return_value.validate_on_submit.return_value = True
+    mock_create_user.side_effect = PasswordHasherBusy()
+
+    response = client.post('/register', data={'email': 'john.doe@nucleusteq.com', 'password': 'password123'})
+    assert response.status_code == 503
+    assert b'Too many requests right now, please try registering again.' in response.data
+    mock_enqueue.assert_not_called()
+
+@patch('app.get_session')
+@patch('app.LoginForm')
+def test_login(mock_LoginForm, mock_get_session, client):
+    mock_form = MagicMock()
+    mock_form.validate_on_submit.return_value = True
+    mock_form.email.data = 'john.doe@nucleusteq.com'
+    mock_form.password.data = 'password123'
+    mock_LoginForm.return_value = mock_form
+
+    mock_session = MagicMock()
+    mock_get_session.return_value = mock_session
+    mock_user = MagicMock()
+    mock_user.user_status = 'active'
+    mock_user.password = 'password123'
+    mock_user.role = 'Employee'
+    mock_user.user_id = 1
+    mock_user.manager_id = None
+    mock_session.query().filter_by().first.return_value = mock_user
+
+    response = client.post('/login', data=dict(
+        email='john.doe@nucleusteq.com',
+        password='password123'
+    ), follow_redirects=True)
+
+    assert response.status_code == 200
+    assert session['user_id'] == 1
+    assert session['role'] == 'Employee'
+    assert b'Employee Dashboard' in response.data  # Assuming the dashboard has this string
+    # The plaintext password was upgraded to a hash.
+    assert mock_user.password.startswith('pbkdf2:sha256:')
+    mock_session.commit.assert_called_once()
+
+@patch('app.get_session')
+@patch('app.LoginForm')
+@patch('app.check_password', side_effect=PasswordHasherBusy)
+def test_login_sheds_load_when_hasher_busy(mock_check_password, mock_LoginForm, mock_get_session, client):
+    mock_form = MagicMock()
+    mock_form.validate_on_submit.return_value = True
+    mock_form.email.data = 'john.doe@nucleusteq.com'
+    mock_form.password.data = 'password123'
+    mock_LoginForm.return_value = mock_form
+
+    response = client.post('/login', data=dict(email='john.doe@nucleusteq.com', password='password123'))
+    assert response.status_code == 503
+    assert 'user_id' not in session
+
+def test_identity_refreshes_role_from_user_record(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 3
+        sess['role'] = 'Admin'
+
+    with patch('app.get_user_identity', return_value=UserIdentity(3, 'Employee', 'active', 2)):
+        response = client.get('/manage_users')
+    assert response.status_code == 302
+    assert '/login' in response.location
+    with client.session_transaction() as sess:
+        assert sess['role'] == 'Employee'
+        assert sess['manager_id'] == 2
+
+@pytest.mark.parametrize('identity', [None, UserIdentity(3, 'Admin', 'deleted', None)])
+def test_identity_ends_session_of_removed_user(identity, client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 3
+        sess['role'] = 'Admin'
+
+    with patch('app.get_user_identity', return_value=identity):
+        response = client.get('/manage_users')
+    assert response.status_code == 302
+    with client.session_transaction() as sess:
+        assert 'user_id' not in sess
+
+@patch('app.get_spend_analytics')
+def test_analytics(mock_get_spend_analytics, client):
+    bucket = {'approved_count': 2, 'approved_amount': 300.0, 'rejected_count': 1, 'rejected_amount': 50.0}
+    mock_get_spend_analytics.return_value = {'total': bucket, 'by_month': {'2024-01': bucket},
+                                             'by_department': {'IT': bucket}, 'by_request_type': {'Travel': bucket}}
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    response = client.get('/analytics?year=2024')
+    assert response.status_code == 200
+    assert b'Spend Analytics' in response.data
+    assert b'2024-01' in response.data
+    mock_get_spend_analytics.assert_called_once_with(2024)
+    assert client.get('/analytics?format=json').get_json()['by_department'] == {'IT': bucket}
+
+@patch('app.get_review_latency')
+def test_review_latency(mock_get_review_latency, client):
+    mock_get_review_latency.return_value = {2: {'count': 3, 'median_seconds': 7200.0, 'mean_seconds': 8000.0}}
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    response = client.get('/review_latency?days=7&status=approved')
+    assert response.status_code == 200
+    assert response.get_json()['managers'] == [{'manager_id': 2, 'count': 3, 'median_seconds': 7200.0, 'mean_seconds': 8000.0}]
+    since, statuses = mock_get_review_latency.call_args[0]
+    assert statuses == ['approved']
+    assert abs((datetime.utcnow() - since).days - 7) <= 1
+
+def test_logout(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Employee'
+    
+    response = client.get('/logout', follow_redirects=True)
+
+    assert response.status_code == 200
+    assert 'user_id' not in session
+    assert 'role' not in session
+    assert b'Home' in response.data  # Assuming the home page has this string
+
+
+def test_home(client):
+    """Test the home page route."""
+    response = client.get('/')
+    assert response.status_code == 200
+    assert b'Home' in response.data
+
+def test_error(client):
+    """Test the error page route."""
+    response = client.get('/error')
+    assert response.status_code == 200
+    assert b'Error page' in response.data
+
+@patch('app.get_session')
+@patch('app.get_all_reimbursement_requests')
+def test_admin_dashboard(mock_get_all_reimbursement_requests, mock_get_session, client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+    
+    mock_session = MagicMock()
+    mock_get_session.return_value = mock_session
+    mock_user = MagicMock()
+    mock_session.query().filter_by().all.return_value = [mock_user]
+
+    response = client.get('/admin_dashboard')
+
+    assert response.status_code == 200
+    assert b'Admin Dashboard' in response.data
+    mock_get_all_reimbursement_requests.assert_not_called()
+    
+
+@patch('app.get_manager_choices')
+@patch('app.get_pending_registrations_page')
+def test_pending_user_registration(mock_get_page, mock_get_manager_choices, client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+    
+    mock_user_inactive = MagicMock()
+    mock_user_inactive.user_id = 7
+    mock_user_manager = MagicMock()
+    mock_get_page.return_value = ([mock_user_inactive], 7)
+    mock_get_manager_choices.return_value = [mock_user_manager]
+
+    response = client.get('/pending_user_registration?cursor=3')
+
+    assert response.status_code == 200
+    assert b'Pending User Registration' in response.data
+    assert b'cursor=7' in response.data
+    mock_get_page.assert_called_once_with(after_id=3, page_size=50)
+
+@patch('app.approve_users')
+def test_bulk_review_users_json(mock_approve_users, client):
+    mock_approve_users.return_value = {4: 'approved', 5: 'unknown_manager'}
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    response = client.post('/bulk_review_users', json={'action': 'approve', 'items': [
+        {'user_id': 4, 'role': 'manager'}, {'user_id': 5, 'role': 'employee', 'manager_id': 99}]})
+    assert response.status_code == 200
+    mock_approve_users.assert_called_once_with({4: ('manager', None), 5: ('employee', 99)})
+    assert response.get_json() == {'results': [{'user_id': 4, 'outcome': 'approved'},
+                                               {'user_id': 5, 'outcome': 'unknown_manager'}]}
+
+@patch('app.get_manager_choices', return_value=[])
+@patch('app.get_pending_registrations_page', return_value=([], None))
+@patch('app.reject_users')
+def test_bulk_review_users_form(mock_reject_users, mock_get_page, mock_get_manager_choices, client):
+    mock_reject_users.return_value = {4: 'rejected', 5: 'not_pending'}
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    response = client.post('/bulk_review_users', data={'action': 'reject', 'user_ids': ['4', '5'], 'role': '', 'manager_id': ''},
+                           follow_redirects=True)
+    assert response.status_code == 200
+    mock_reject_users.assert_called_once_with([4, 5])
+    assert b'1 of 2 registrations rejected.' in response.data
+
+@patch('app.approve_users')
+def test_bulk_review_users_invalid(mock_approve_users, client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    for payload in ({'action': 'approve', 'items': [{'user_id': 'x'}]}, [1], {'action': 'approve', 'items': [5]},
+                    {'action': 'approve', 'items': [{'user_id': 5, 'role': ['x']}]},
+                    {'action': 'approve', 'items': [{'user_id': 5, 'role': 'employee', 'manager_id': '2'}]},
+                    {'action': None, 'items': [{'user_id': 5}]}):
+        response = client.post('/bulk_review_users', json=payload)
+        assert response.status_code == 400
+    mock_approve_users.assert_not_called()
+
+@patch('app.get_manager_choices', return_value=[])
+@patch('app.get_pending_registrations_page', return_value=([], None))
+@patch('app.get_session')
+def test_approve_user(mock_get_session, mock_get_pending_registrations_page, mock_get_manager_choices, client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    mock_session = MagicMock()
+    mock_get_session.return_value = mock_session
+    mock_user = MagicMock()
+    mock_user.email = 'test@example.com'
+    mock_session.query().get.return_value = mock_user
+
+    response = client.post('/approve_user/1', data=dict(role='Employee', manager_id=2), follow_redirects=True)
+
+    assert response.status_code == 200
+    mock_session.commit.assert_called_once()
+    assert b'User test@example.com approved successfully.' in response.data
+
+@patch('app.get_manager_choices', return_value=[])
+@patch('app.get_pending_registrations_page', return_value=([], None))
+@patch('app.get_session')
+def test_reject_user(mock_get_session, mock_get_pending_registrations_page, mock_get_manager_choices, client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    mock_session = MagicMock()
+    mock_get_session.return_value = mock_session
+    mock_user = MagicMock()
+    mock_user.email = 'test@example.com'
+    mock_session.query().get.return_value = mock_user
+
+    response = client.post('/reject_user/1', follow_redirects=True)
+
+    assert response.status_code == 200
+    mock_session.delete.assert_called_once_with(mock_user)
+    mock_session.commit.assert_called_once()
+    assert b'User test@example.com request rejected and deleted successfully.' in response.data
+    
+    
+
+@patch('app.get_all_request_types')
+@patch('app.get_reimbursement_requests_page')
+def test_reimbursement_request_tracking(mock_get_reimbursement_requests_page, mock_get_all_request_types, client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    mock_reimbursement_request = MagicMock()
+    mock_get_reimbursement_requests_page.return_value = ([mock_reimbursement_request], 41)
+    mock_get_all_request_types.return_value = []
+
+    response = client.get('/reimbursement_request_tracking?status=approved&employee_id=5&date_from=2024-01-01&cursor=90&page_size=20')
+
+    assert response.status_code == 200
+    assert b'Reimbursement Request Tracking' in response.data  # Assuming the page has this string
+    assert b'cursor=41' in response.data
+    filters = mock_get_reimbursement_requests_page.call_args[0][0]
+    assert filters == {'status': 'approved', 'employee_id': 5, 'date_from': datetime(2024, 1, 1).date()}
+    assert mock_get_reimbursement_requests_page.call_args[1] == {'before_id': 90, 'page_size': 20}
+
+    # Unknown parameters are dropped from the links instead of reaching url_for().
+    response = client.get('/reimbursement_request_tracking?status=approved&endpoint=home&_external=1&format=csv')
+    assert response.status_code == 200
+    assert b'endpoint=' not in response.data and b'_external' not in response.data
+    
+    
+    
+@patch('app.get_session')
+def test_manage_departments(mock_get_session, client):
+    mock_session = mock_get_session.return_value
+    mock_department = MagicMock()
+    mock_session.query().order_by().all.return_value = [mock_department]
+
+    response = client.get('/manage_departments')
+    assert response.status_code == 200
+    assert b'Manage Departments' in response.data
+
+@patch('app.invalidate_department_cache')
+@patch('app.get_session')
+def test_add_department(mock_get_session, mock_invalidate_department_cache, client):
+    mock_session = mock_get_session.return_value
+
+    response = client.post('/add_department', data=dict(department_name='IT', department_id='123'))
+    assert response.status_code == 302  # Redirect status
+    mock_session.add.assert_called_once()
+    mock_session.commit.assert_called_once()
+    mock_invalidate_department_cache.assert_called_once()
+
+@patch('app.get_session')
+def test_manage_users(mock_get_session, client):
+    mock_session = mock_get_session.return_value
+    mock_user = MagicMock()
+    mock_session.query().filter().all.return_value = [mock_user]
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    response = client.get('/manage_users')
+    assert response.status_code == 200
+    assert b'Manage Users' in response.data
+
+@patch('app.get_session')
+def test_edit_user(mock_get_session, client):
+    mock_session = mock_get_session.return_value
+    mock_user = MagicMock()
+    mock_manager = MagicMock()
+    mock_session.query().get.return_value = mock_user
+    mock_session.query().filter().all.return_value = [mock_manager]
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    response = client.get('/edit_user/1')
+    assert response.status_code == 200
+    assert b'Edit User' in response.data
+
+@patch('app.get_session')
+def test_update_user(mock_get_session, client):
+    mock_session = mock_get_session.return_value
+    mock_user = MagicMock()
+    mock_session.query().get.return_value = mock_user
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    response = client.post('/update_user/1', data=dict(role='employee', manager_id='2'))
+    assert response.status_code == 302  # Redirect status
+    mock_user.role = 'employee'
+    mock_user.manager_id = '2'
+    mock_session.commit.assert_called_once()
+
+@patch('app.get_session')
+def test_delete_user(mock_get_session, client):
+    mock_session = mock_get_session.return_value
+    mock_user = MagicMock()
+    mock_session.query().get.return_value = mock_user
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    response = client.post('/delete_user/1')
+    assert response.status_code == 302  # Redirect status
+    mock_user.user_status = 'deleted'
+    mock_session.commit.assert_called_once()
+
+@patch('app.get_session')
+def test_employee_dashboard(mock_get_session, client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Employee'
+
+    response = client.get('/employee_dashboard')
+    assert response.status_code == 200
+    assert b'Employee Dashboard' in response.data
+
+@patch('app.get_all_request_types')
+@patch('app.get_amount_limit')
+@patch('app.store_upload')
+@patch('app.enqueue')
+@patch('app.create_reimbursement_request')
+@patch('app.create_document')
+@patch('app.get_session')
+def test_submit_reimbursement(mock_get_session, mock_create_document, mock_create_reimbursement_request, mock_enqueue, mock_store_upload, mock_get_amount_limit, mock_get_all_request_types, client):
+    mock_get_all_request_types.return_value = [{'request_type_id': 1, 'request_type': 'Travel'}]
+    mock_get_amount_limit.return_value = 500.0
+    mock_store_upload.return_value = 'ab/cd/abcd.txt'
+    mock_create_reimbursement_request.return_value = 7
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['manager_id'] = 2
+
+    response = client.get('/submit_reimbursement')
+    assert response.status_code == 200
+    assert b'Submit Reimbursement' in response.data
+
+    with open('test_document.txt', 'w') as f:
+        f.write('test content')
+
+    with open('test_document.txt', 'rb') as f:
+        data = {
+            'request_type_id': 1,
+            'amount': '100.0',
+            'request_date': '2024-01-01',
+            'document': (f, 'test_document.txt')
+        }
+
+        response = client.post('/submit_reimbursement', data=data, content_type='multipart/form-data')
+        assert response.status_code == 302
+        mock_create_reimbursement_request.assert_called_once()
+        assert mock_create_reimbursement_request.call_args.kwargs['document_paths'] == ['ab/cd/abcd.txt']
+        mock_create_document.assert_not_called()
+        mock_enqueue.assert_not_called()
+
+    os.remove('test_document.txt')
+
+
+@patch('app.get_all_request_types', return_value=[])
+@patch('app.store_upload')
+@patch('app.create_reimbursement_request')
+@patch('app.find_submission')
+def test_submit_reimbursement_retry_returns_original(mock_find_submission, mock_create_reimbursement_request, mock_store_upload,
+                                                    mock_get_all_request_types, client):
+    mock_find_submission.return_value = 7
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['manager_id'] = 2
+
+    response = client.post('/submit_reimbursement', content_type='multipart/form-data', data={
+        'idempotency_key': 'abc123', 'request_type_id': 1, 'amount': '100.0', 'request_date': '2024-01-01',
+        'document': (io.BytesIO(b'receipt'), 'receipt.jpg')})
+    assert response.status_code == 302
+    mock_find_submission.assert_called_once_with(1, 'abc123')
+    mock_store_upload.assert_not_called()
+    mock_create_reimbursement_request.assert_not_called()
+    with client.session_transaction() as sess:
+        assert sess['message'] == 'This claim was already submitted as request 7.'
+
+@patch('app.get_all_request_types', return_value=[])
+@patch('app.get_amount_limit')
+@patch('app.store_upload')
+@patch('app.enqueue')
+@patch('app.create_reimbursement_request')
+@patch('app.create_document')
+@patch('app.find_submission')
+def test_submit_reimbursement_duplicate_content(mock_find_submission, mock_create_document, mock_create_reimbursement_request,
+                                                mock_enqueue, mock_store_upload, mock_get_amount_limit,
+                                                mock_get_all_request_types, client):
+    mock_find_submission.return_value = None
+    mock_get_amount_limit.return_value = 500.0
+    digest = 'abcd' + '0' * 60
+    mock_store_upload.return_value = f'ab/cd/{digest}.jpg'
+    mock_create_reimbursement_request.side_effect = DuplicateSubmission(7)
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['manager_id'] = 2
+
+    response = client.post('/submit_reimbursement', content_type='multipart/form-data', data={
+        'idempotency_key': 'new-key', 'request_type_id': 1, 'amount': '100.0', 'request_date': '2024-01-01',
+        'document': (io.BytesIO(b'receipt'), 'receipt.jpg')})
+    assert response.status_code == 302
+    kwargs = mock_create_reimbursement_request.call_args.kwargs
+    assert kwargs['idempotency_key'] == 'new-key'
+    assert kwargs['content_hash'] == submission_hash(1, 100.0, date(2024, 1, 1), [digest])
+    mock_create_document.assert_not_called()
+    mock_enqueue.assert_not_called()
+    with client.session_transaction() as sess:
+        assert sess['message'] == 'This claim was already submitted as request 7.'
+
+
+@patch('app.get_session')
+def test_history(mock_get_session, client):
+    mock_session = mock_get_session.return_value
+    mock_request = MagicMock()
+    mock_document = MagicMock()
+    mock_session.query().filter_by().all.return_value = [mock_request]
+    mock_session.query().filter_by().all.return_value = [mock_document]
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Employee'
+
+    response = client.get('/history')
+    assert response.status_code == 200
+    assert b'History' in response.data
+
+
+MANAGER_SUMMARY = {
+    'total': {'count': 3, 'amount': 300.0},
+    'by_status': {'pending': {'count': 1, 'amount': 100.0}, 'approved': {'count': 2, 'amount': 200.0}},
+    'by_request_type': {'Travel': {'count': 3, 'amount': 300.0}},
+    'by_month': {'2024-01': {'count': 3, 'amount': 300.0}},
+}
+
+@patch('app.get_manager_summary')
+def test_manager_dashboard(mock_get_manager_summary, client):
+    mock_get_manager_summary.return_value = MANAGER_SUMMARY
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+        sess['role'] = 'Manager'
+
+    response = client.get('/manager_dashboard')
+    assert response.status_code == 200
+    assert b'Manager Dashboard' in response.data
+    assert b'2024-01' in response.data
+    mock_get_manager_summary.assert_called_once_with(2)
+
+@patch('app.get_manager_summary')
+def test_manager_dashboard_summary(mock_get_manager_summary, client):
+    mock_get_manager_summary.return_value = MANAGER_SUMMARY
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+        sess['role'] = 'Manager'
+
+    response = client.get('/manager_dashboard/summary')
+    assert response.status_code == 200
+    assert response.get_json() == MANAGER_SUMMARY
+
+@patch('app.get_session')
+def test_pending_requests(mock_get_session, client):
+    mock_session = mock_get_session.return_value
+    mock_request = MagicMock()
+    mock_user = MagicMock()
+    mock_request_type = MagicMock()
+    mock_session.query().join().join().filter().all.return_value = [(mock_request, mock_user, mock_request_type)]
+    
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+        sess['role'] = 'Manager'
+
+    response = client.get('/pending_requests')
+    assert response.status_code == 200
+    
+
+@patch('app.review_reimbursement_requests')
+def test_approve_reimbursement(mock_review, client):
+    mock_review.return_value = {1: 'approved'}
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+        sess['role'] = 'Manager'
+
+    response = client.post('/approve_reimbursement/1', data={'comments': 'Approved', 'version': '3'})
+    assert response.status_code == 302
+    mock_review.assert_called_once_with(2, 'approved', {1: 'Approved'}, {1: 3})
+    with client.session_transaction() as sess:
+        assert sess['message'] == 'Request Approved successfully.'
+
+@patch('app.review_reimbursement_requests')
+def test_reject_reimbursement(mock_review, client):
+    mock_review.return_value = {1: 'rejected'}
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+        sess['role'] = 'Manager'
+
+    response = client.post('/reject_reimbursement/1', data={'comments': 'Rejected'})
+    assert response.status_code == 302
+    mock_review.assert_called_once_with(2, 'rejected', {1: 'Rejected'}, None)
+
+@patch('app.review_reimbursement_requests')
+def test_review_conflict_reported(mock_review, client):
+    mock_review.return_value = {1: 'conflict'}
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+        sess['role'] = 'Manager'
+
+    client.post('/approve_reimbursement/1', data={'comments': 'Approved', 'version': '1'})
+    with client.session_transaction() as sess:
+        assert sess['message'] == 'Request was changed by someone else, please reload and try again.'
+        assert sess['message_category'] == 'warning'
+
+@patch('app.get_session')
+def test_approved_requests(mock_get_session, client):
+    mock_session = mock_get_session.return_value
+    mock_request = MagicMock()
+    mock_user = MagicMock()
+    mock_request_type = MagicMock()
+    mock_session.query().join().join().filter().all.return_value = [(mock_request, mock_user, mock_request_type)]
+    
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+        sess['role'] = 'Manager'
+
+    response = client.get('/approved_requests')
+    assert response.status_code == 200
+    assert b'Approved Requests' in response.data
+
+@patch('app.get_session')
+def test_rejected_requests(mock_get_session, client):
+    mock_session = mock_get_session.return_value
+    mock_request = MagicMock()
+    mock_user = MagicMock()
+    mock_request_type = MagicMock()
+    mock_session.query().join().join().filter().all.return_value = [(mock_request, mock_user, mock_request_type)]
+    
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+        sess['role'] = 'Manager'
+
+    response = client.get('/rejected_requests')
+    assert response.status_code == 200
+    assert b'Rejected Requests' in response.data
+
+@patch('app.get_user_identity', side_effect=session_identity)
+@patch('app.get_session')
+def test_request_session_closed_on_teardown(mock_get_session, mock_get_user_identity):
+    mock_session = mock_get_session.return_value
+    mock_session.query().filter().all.return_value = []
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['role'] = 'Admin'
+        response = client.get('/edit_user/1')
+
+    assert response.status_code == 200
+    mock_get_session.assert_called_once()
+    mock_session.close.assert_called_once()
+
+@patch('app.get_pool_stats')
+def test_pool_stats(mock_get_pool_stats, client):
+    mock_get_pool_stats.return_value = {'checkouts': 3, 'checked_out': 1}
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    response = client.get('/pool_stats')
+    assert response.status_code == 200
+    assert response.get_json() == {'checkouts': 3, 'checked_out': 1}
+
+@patch('app.review_reimbursement_requests')
+def test_bulk_review_reimbursements_json(mock_review, client):
+    mock_review.return_value = {1: 'approved', 2: 'not_pending'}
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+        sess['role'] = 'Manager'
+
+    response = client.post('/bulk_review_reimbursements', json={
+        'action': 'approve',
+        'comments': 'Month end',
+        'items': [{'request_id': 1}, {'request_id': 2, 'comments': 'Checked', 'version': 4}],
+    })
+    assert response.status_code == 200
+    mock_review.assert_called_once_with(2, 'approved', {1: 'Month end', 2: 'Checked'}, {2: 4})
+    assert response.get_json() == {'results': [{'request_id': 1, 'outcome': 'approved'},
+                                               {'request_id': 2, 'outcome': 'not_pending'}]}
+
+@patch('app.review_reimbursement_requests')
+def test_bulk_review_reimbursements_form(mock_review, client):
+    mock_review.return_value = {3: 'rejected', 4: 'rejected'}
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+        sess['role'] = 'Manager'
+
+    response = client.post('/bulk_review_reimbursements', data={
+        'action': 'reject', 'comments': 'Duplicate', 'request_ids': ['3', '4'], 'comments_4': 'No receipt',
+        'version_3': '1', 'version_4': '2'})
+    assert response.status_code == 302
+    mock_review.assert_called_once_with(2, 'rejected', {3: 'Duplicate', 4: 'No receipt'}, {3: 1, 4: 2})
+
+@patch('app.review_reimbursement_requests')
+def test_bulk_review_reimbursements_invalid(mock_review, client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+        sess['role'] = 'Manager'
+
+    response = client.post('/bulk_review_reimbursements', json={'action': 'delete', 'items': [{'request_id': 1}]})
+    assert response.status_code == 400
+    for payload in ([1], {'action': 'approve', 'items': 'abc'}, {'action': 'approve', 'items': [1, 2]},
+                    {'action': 'approve', 'items': [{'request_id': '1'}]},
+                    {'action': 'approve', 'items': [{'request_id': 1, 'comments': ['ok']}]},
+                    {'action': 'approve', 'items': [{'request_id': 1, 'version': '2'}]},
+                    {'action': ['approve'], 'items': [{'request_id': 1}]},
+                    {'action': 'approve', 'comments': 5, 'items': [{'request_id': 1}]}):
+        response = client.post('/bulk_review_reimbursements', json=payload)
+        assert response.status_code == 400
+    mock_review.assert_not_called()
+
+@patch('app.import_users')
+def test_bulk_import_users_csv(mock_import_users, client):
+    mock_import_users.return_value = {'imported': 1, 'errors': [{'row': 2, 'email': None, 'error': 'Missing email'}]}
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    upload = (b'first_name,last_name,email,password,role,department,manager_email\n'
+              b'Jane,Doe,jane@nucleusteq.com,secret,Employee,IT,boss@nucleusteq.com\n'
+              b'John,Doe,,secret,Employee,IT,boss@nucleusteq.com\n')
+    response = client.post('/import_users', data={'file': (io.BytesIO(upload), 'users.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert response.get_json() == mock_import_users.return_value
+    rows = mock_import_users.call_args[0][0]
+    assert len(rows) == 2
+    assert rows[0]['email'] == 'jane@nucleusteq.com'
+    assert rows[0]['manager_email'] == 'boss@nucleusteq.com'
+
+@patch('app.import_users')
+def test_bulk_import_users_jsonl(mock_import_users, client):
+    mock_import_users.return_value = {'imported': 1, 'errors': []}
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    upload = b'{"email": "jane@nucleusteq.com", "role": "Manager"}\n\nnot json\n'
+    response = client.post('/import_users', data={'file': (io.BytesIO(upload), 'users.jsonl')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    mock_import_users.assert_called_once_with([{'email': 'jane@nucleusteq.com', 'role': 'Manager'}, None])
+
+@patch('app.import_users')
+def test_bulk_import_users_rejects_bad_requests(mock_import_users, client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+        sess['role'] = 'Manager'
+    assert client.post('/import_users').status_code == 403
+
+    with client.session_transaction() as sess:
+        sess['role'] = 'Admin'
+    assert client.post('/import_users').status_code == 400
+    response = client.post('/import_users', data={'file': (io.BytesIO(b'x'), 'users.xlsx')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+    mock_import_users.assert_not_called()
+
+@patch('app.iter_reimbursement_request_export')
+def test_export_reimbursement_requests(mock_export, client):
+    row = (1, 5, 'John', 'Doe', 'john.doe@nucleusteq.com', 2, 'Travel', 120.5, datetime(2024, 1, 1).date(), 'approved', 3, 'ok')
+    mock_export.side_effect = lambda filters: iter([row])
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    response = client.get('/export_reimbursement_requests?format=csv&status=approved')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    lines = response.data.decode().splitlines()
+    assert lines[0].startswith('request_id,employee_id')
+    assert lines[1] == '1,5,John,Doe,john.doe@nucleusteq.com,2,Travel,120.5,2024-01-01,approved,3,ok'
+    assert mock_export.call_args[0][0] == {'status': 'approved'}
+
+    response = client.get('/export_reimbursement_requests?format=jsonl')
+    assert response.mimetype == 'application/x-ndjson'
+    record = json.loads(response.data.decode().splitlines()[0])
+    assert record['request_date'] == '2024-01-01'
+    assert record['type_name'] == 'Travel'
+
+    response = client.get('/export_reimbursement_requests?format=xml')
+    assert response.status_code == 400
+
+def test_send_document_content_addressed(client, tmp_path):
+    digest = 'ab' + 'cd' + '0' * 60
+    relative_path = f'ab/cd/{digest}.pdf'
+    os.makedirs(os.path.join('uploads', 'ab', 'cd'), exist_ok=True)
+    with open(os.path.join('uploads', relative_path), 'wb') as f:
+        f.write(b'0123456789')
+    try:
+        response = client.get(f'/user_uploads/{relative_path}')
+        assert response.status_code == 200
+        assert response.headers['ETag'] == f'"{digest}"'
+        assert 'immutable' in response.headers['Cache-Control']
+
+        response = client.get(f'/uploads/{relative_path}', headers={'If-None-Match': f'"{digest}"'})
+        assert response.status_code == 304
+
+        response = client.get(f'/uploads/{relative_path}', headers={'Range': 'bytes=2-5'})
+        assert response.status_code == 206
+        assert response.data == b'2345'
+
+        with patch('app.document_x_accel_prefix', '/protected_uploads/'):
+            response = client.get(f'/uploads/{relative_path}')
+            assert response.headers['X-Accel-Redirect'] == f'/protected_uploads/{relative_path}'
+            assert response.data == b''
+            assert client.get('/uploads/ab/cd/missing.pdf').status_code == 404
+    finally:
+        os.remove(os.path.join('uploads', relative_path))
+        os.removedirs(os.path.join('uploads', 'ab', 'cd'))
+
+def test_send_document_legacy_upload_revalidates(client):
+    response = client.get('/uploads/test_document.pdf')
+    assert response.status_code == 200
+    assert 'no-cache' in response.headers['Cache-Control']
+    etag = response.headers['ETag']
+
+    response = client.get('/uploads/test_document.pdf', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+@patch('app.get_unread_notifications')
+def test_notifications(mock_get_unread_notifications, client):
+    mock_notification = MagicMock()
+    mock_notification.message = 'Your reimbursement request 4 was approved.'
+    mock_get_unread_notifications.return_value = [mock_notification]
+    with client.session_transaction() as sess:
+        sess['user_id'] = 5
+        sess['role'] = 'Employee'
+
+    response = client.get('/notifications')
+    assert response.status_code == 200
+    assert b'Your reimbursement request 4 was approved.' in response.data
+    mock_get_unread_notifications.assert_called_once_with(5)
+
+@patch('app.mark_notifications_read')
+def test_mark_read(mock_mark_notifications_read, client):
+    mock_mark_notifications_read.return_value = 2
+    with client.session_transaction() as sess:
+        sess['user_id'] = 5
+        sess['role'] = 'Employee'
+
+    response = client.post('/notifications/mark_read', json={'notification_ids': [1, 2]})
+    assert response.get_json() == {'updated': 2, 'unread': 0}
+    mock_mark_notifications_read.assert_called_with(5, [1, 2])
+
+    client.post('/notifications/mark_read', json={})
+    mock_mark_notifications_read.assert_called_with(5, None)
+
+    response = client.post('/notifications/mark_read', data={'all': '1'})
+    assert response.status_code == 302
+    mock_mark_notifications_read.assert_called_with(5, None)
+
+    client.post('/notifications/mark_read', data={'notification_ids': ['3']})
+    mock_mark_notifications_read.assert_called_with(5, [3])
+
+@patch('app.mark_notifications_read')
+def test_mark_read_rejects_invalid_ids(mock_mark_notifications_read, client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 5
+        sess['role'] = 'Employee'
+
+    for payload in ({'notification_ids': '12'}, {'notification_ids': ['1', 2]}, {'notification_ids': [True]},
+                    {'notification_ids': 3}, [1, 2]):
+        response = client.post('/notifications/mark_read', json=payload)
+        assert response.status_code == 400
+    response = client.post('/notifications/mark_read', data={'notification_ids': ['x']})
+    assert response.status_code == 400
+    mock_mark_notifications_read.assert_not_called()
+
+def test_metrics_endpoint(client):
+    metrics.route_metrics.reset()
+    client.get('/')
+    client.get('/')
+
+    response = client.get('/metrics')
+    assert response.status_code == 401
+    with patch('app.metrics_token', 'scrape-secret'):
+        assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    assert response.status_code == 200
+    body = response.data.decode()
+    assert 'portal_requests_total{endpoint="home"} 2' in body
+    assert '# TYPE portal_db_queries_total counter' in body
+    assert 'portal_pool_checkouts' in body
+
+def test_metrics_endpoint_for_admins(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert '# TYPE portal_requests_total counter' in response.data.decode()
+
+def test_server_timing_header(client):
+    with patch('metrics.server_timing_header', True):
+        response = client.get('/')
+    assert response.headers['Server-Timing'].startswith('app;dur=')
+    assert 'db;dur=' in response.headers['Server-Timing']
@@ -0,0 +1,79 @@
+import atexit
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler
+from flask import Flask, session
+from flask.logging import default_handler
+from app_logging import JsonFormatter, RequestContextFilter, configure_logging
+
+def make_app():
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test'
+
+    @app.route('/ping')
+    def ping():
+        session['user_id'] = 7
+        app.logger.info('pinged %s', 'ok')
+        return 'pong'
+
+    @app.route('/fail')
+    def fail():
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            app.logger.exception('failed for %s', 'ping')
+        return 'failed'
+
+    return app
+
+def test_json_formatter_includes_context():
+    record = logging.LogRecord('app', logging.INFO, __file__, 1, 'hello %s', ('world',), None)
+    record.request_id = 'abc'
+    record.duration_ms = 1.5
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['message'] == 'hello world'
+    assert entry['level'] == 'INFO'
+    assert entry['request_id'] == 'abc'
+    assert entry['duration_ms'] == 1.5
+    assert 'user_id' not in entry
+
+def test_request_context_filter_runs_in_calling_thread():
+    app = make_app()
+    records = queue.Queue()
+    handler = QueueHandler(records)
+    handler.addFilter(RequestContextFilter())
+    app.logger.addHandler(handler)
+    app.logger.setLevel(logging.INFO)
+
+    with app.test_request_context('/ping', headers={'X-Request-ID': 'req-1'}):
+        from flask import g
+        g.request_id = 'req-1'
+        app.logger.info('inside')
+    record = records.get_nowait()
+    assert record.request_id == 'req-1'
+    assert record.route == 'ping'
+
+def test_configure_logging_writes_json_lines(tmp_path, monkeypatch):
+    log_path = tmp_path / 'app.log'
+    monkeypatch.setattr('app_logging.log_file', str(log_path))
+    app = make_app()
+    listener = configure_logging(app)
+    try:
+        response = app.test_client().get('/ping', headers={'X-Request-ID': 'req-2'})
+        app.test_client().get('/fail')
+    finally:
+        listener.stop()
+        atexit.unregister(listener.stop)
+
+    assert response.headers['X-Request-ID'] == 'req-2'
+    assert default_handler not in app.logger.handlers
+    entries = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert entries[0]['message'] == 'pinged ok'
+    assert entries[0]['request_id'] == 'req-2'
+    assert entries[0]['route'] == 'ping'
+    assert entries[1]['status'] == 200
+    assert entries[1]['user_id'] == 7
+    assert entries[1]['duration_ms'] >= 0
+    assert entries[2]['message'] == 'failed for ping'
+    assert 'ZeroDivisionError' in entries[2]['exception']
@@ -0,0 +1,44 @@
+from unittest.mock import patch
+from cache import TTLCache
+
+def test_get_and_set():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    assert cache.get('missing') is None
+
+def test_entries_expire():
+    cache = TTLCache(maxsize=2, ttl=10)
+    with patch('cache.time.monotonic', return_value=100):
+        cache.set('a', 1)
+    with patch('cache.time.monotonic', return_value=111):
+        assert cache.get('a') is None
+    assert len(cache) == 0
+
+def test_least_recently_used_entry_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+def test_get_or_load_caches_none():
+    cache = TTLCache(maxsize=2, ttl=60)
+    calls = []
+    loader = lambda: calls.append(1)
+    assert cache.get_or_load('a', loader) is None
+    assert cache.get_or_load('a', loader) is None
+    assert len(calls) == 1
+
+def test_invalidate_prefix():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('request_types', [])
+    cache.set('request_type:1', 'x')
+    cache.set('departments', [])
+    cache.invalidate_prefix('request_type')
+    assert cache.get('request_types') is None
+    assert cache.get('request_type:1') is None
+    assert cache.get('departments') == []
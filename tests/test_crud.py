@@ -1,151 +1,229 @@
-import pytest
-from unittest.mock import patch, MagicMock
-from crud import *
-from datetime import datetime
-
-@pytest.fixture
-def mock_session():
-    with patch('crud.get_session') as mock_get_session:
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-        yield mock_session
-
-def test_create_user(mock_session):
-    mock_user = MagicMock()
-    with patch('crud.User', return_value=mock_user):
-        result = create_user('John', 'Doe', 'john.doe@example.com', 'password123', 'admin', 'active', 1, 1)
-        mock_session.add.assert_called_once_with(mock_user)
-        mock_session.commit.assert_called_once()
-        assert result == mock_user
-
-def test_create_department(mock_session):
-    mock_department = MagicMock()
-    with patch('crud.Department', return_value=mock_department):
-        result = create_department('HR')
-        mock_session.add.assert_called_once_with(mock_department)
-        mock_session.commit.assert_called_once()
-        assert result == mock_department
-
-def test_create_request_type(mock_session):
-    mock_request_type = MagicMock()
-    with patch('crud.RequestType', return_value=mock_request_type):
-        result = create_request_type('Travel', 500.00)
-        mock_session.add.assert_called_once_with(mock_request_type)
-        mock_session.commit.assert_called_once()
-        assert result == mock_request_type
-
-def test_create_reimbursement_request(mock_session):
-    mock_request = MagicMock()
-    with patch('crud.ReimbursementRequest', return_value=mock_request):
-        mock_request.request_id = 1
-        result = create_reimbursement_request(1, 1, 200.00, datetime.now(), 1)
-        mock_session.add.assert_called_once_with(mock_request)
-        mock_session.commit.assert_called_once()
-        assert result == 1
-
-def test_get_all_request_types(mock_session):
-    mock_request_types = [MagicMock(), MagicMock()]
-    mock_session.query().all.return_value = mock_request_types
-    result = get_all_request_types()
-    assert result == mock_request_types
-
-def test_create_document(mock_session):
-    mock_document = MagicMock()
-    with patch('crud.Document', return_value=mock_document):
-        result = create_document(1, 'path/to/document')
-        mock_session.add.assert_called_once_with(mock_document)
-        mock_session.commit.assert_called_once()
-        assert result == mock_document
-
-def test_create_notification(mock_session):
-    mock_notification = MagicMock()
-    with patch('crud.Notification', return_value=mock_notification):
-        result = create_notification(1, 'Test message', datetime.now())
-        mock_session.add.assert_called_once_with(mock_notification)
-        mock_session.commit.assert_called_once()
-        assert result == mock_notification
-
-def test_get_user(mock_session):
-    mock_user = MagicMock()
-    mock_session.query().get.return_value = mock_user
-    result = get_user(1)
-    assert result == mock_user
-
-def test_get_departments(mock_session):
-    mock_department = MagicMock()
-    mock_session.query().get.return_value = mock_department
-    result = get_departments(1)
-    assert result == mock_department
-
-def test_get_request_type(mock_session):
-    mock_request_type = MagicMock()
-    mock_session.query().get.return_value = mock_request_type
-    result = get_request_type(1)
-    assert result == mock_request_type
-
-def test_get_reimbursement_request(mock_session):
-    mock_request = MagicMock()
-    mock_session.query().get.return_value = mock_request
-    result = get_reimbursement_request(1)
-    assert result == mock_request
-
-def test_get_all_reimbursement_requests(mock_session):
-    mock_requests = [MagicMock(), MagicMock()]
-    mock_session.query().all.return_value = mock_requests
-    result = get_all_reimbursement_requests()
-    assert result == mock_requests
-
-
-def test_get_amount_limit(mock_session):
-    mock_request_type = MagicMock()
-    mock_request_type.amount_limit = 500.00
-    mock_session.query().filter_by().first.return_value = mock_request_type
-    result = get_amount_limit(1)
-    assert result == 500.00
-
-def test_get_notification(mock_session):
-    mock_notification = MagicMock()
-    mock_session.query().get.return_value = mock_notification
-    result = get_notification(1)
-    assert result == mock_notification
-
-def test_update_user(mock_session):
-    mock_user = MagicMock()
-    mock_session.query().get.return_value = mock_user
-    updates = {'first_name': 'Jane'}
-    result = update_user(1, updates)
-    assert result == mock_user
-    assert mock_user.first_name == 'Jane'
-    mock_session.commit.assert_called_once()
-
-def test_update_department(mock_session):
-    mock_department = MagicMock()
-    mock_session.query().get.return_value = mock_department
-    updates = {'department_name': 'Finance'}
-    result = update_department(1, updates)
-    assert result == mock_department
-    assert mock_department.department_name == 'Finance'
-    mock_session.commit.assert_called_once()
-
-def test_update_request_type(mock_session):
-    mock_request_type = MagicMock()
-    mock_session.query().get.return_value = mock_request_type
-    updates = {'type_name': 'Accommodation'}
-    result = update_request_type(1, updates)
-    assert result == mock_request_type
-    assert mock_request_type.type_name == 'Accommodation'
-    mock_session.commit.assert_called_once()
-
-def test_delete_user(mock_session):
-    mock_user = MagicMock()
-    mock_session.query().get.return_value = mock_user
-    delete_user(1)
-    mock_session.delete.assert_called_once_with(mock_user)
-    mock_session.commit.assert_called_once()
-
-def test_delete_request_type(mock_session):
-    mock_request_type = MagicMock()
-    mock_session.query().get.return_value = mock_request_type
-    delete_request_type(1)
-    mock_session.delete.assert_called_once_with(mock_request_type)
-    mock_session.commit.assert_called_once()
+import pytest
+from unittest.mock import patch, MagicMock
+from crud import *
+from datetime import datetime
+
+@pytest.fixture
+def mock_session():
+    reference_cache.clear()
+    manager_summary_cache.clear()
+    unread_count_cache.clear()
+    user_identity_cache.clear()
+    with patch('crud.get_session') as mock_get_session:
+        mock_session = MagicMock()
+        mock_get_session.return_value = mock_session
+        yield mock_session
+
+def test_create_user(mock_session):
+    mock_user = MagicMock()
+    with patch('crud.User', return_value=mock_user):
+        result = create_user('John', 'Doe', 'john.doe@example.com', 'password123', 'admin', 'active', 1, 1)
+        mock_session.add.assert_called_once_with(mock_user)
+        mock_session.commit.assert_called_once()
+        assert result == mock_user
+
+def test_create_department(mock_session):
+    mock_department = MagicMock()
+    with patch('crud.Department', return_value=mock_department):
+        result = create_department('HR')
+        mock_session.add.assert_called_once_with(mock_department)
+        mock_session.commit.assert_called_once()
+        assert result == mock_department
+
+def test_create_request_type(mock_session):
+    mock_request_type = MagicMock()
+    with patch('crud.RequestType', return_value=mock_request_type):
+        result = create_request_type('Travel', 500.00)
+        mock_session.add.assert_called_once_with(mock_request_type)
+        mock_session.commit.assert_called_once()
+        assert result == mock_request_type
+
+def test_create_reimbursement_request(mock_session):
+    mock_request = MagicMock()
+    with patch('crud.ReimbursementRequest', return_value=mock_request):
+        mock_request.request_id = 1
+        result = create_reimbursement_request(1, 1, 200.00, datetime.now(), 1)
+        mock_session.add.assert_called_once_with(mock_request)
+        mock_session.commit.assert_called_once()
+        assert result == 1
+
+def test_get_all_request_types(mock_session):
+    mock_request_types = [MagicMock(), MagicMock()]
+    mock_session.query().all.return_value = mock_request_types
+    result = get_all_request_types()
+    assert result == mock_request_types
+
+def test_create_document(mock_session):
+    mock_document = MagicMock()
+    with patch('crud.Document', return_value=mock_document):
+        result = create_document(1, 'path/to/document')
+        mock_session.add.assert_called_once_with(mock_document)
+        mock_session.commit.assert_called_once()
+        assert result == mock_document
+
+def test_create_notification(mock_session):
+    mock_notification = MagicMock()
+    with patch('crud.Notification', return_value=mock_notification):
+        result = create_notification(1, 'Test message', datetime.now())
+        mock_session.add.assert_called_once_with(mock_notification)
+        mock_session.commit.assert_called_once()
+        assert result == mock_notification
+
+def test_notify_users_single_insert(mock_session):
+    assert notify_users([3, 4, 4], 'Hello') == 2
+    assert mock_session.execute.call_count == 1
+    rows = mock_session.execute.call_args[0][1]
+    assert sorted(row['user_id'] for row in rows) == [3, 4]
+    mock_session.commit.assert_called_once()
+
+def test_get_unread_count_cached_until_marked_read(mock_session):
+    mock_session.query().filter().scalar.return_value = 4
+    assert get_unread_count(1) == 4
+    assert get_unread_count(1) == 4
+    assert mock_session.query().filter().scalar.call_count == 1
+    mock_session.query().filter().filter().update.return_value = 1
+    mark_notifications_read(1, [10])
+    mock_session.query().filter().scalar.return_value = 3
+    assert get_unread_count(1) == 3
+
+def test_get_user_identity_cached_until_user_updated(mock_session):
+    mock_session.query().filter().first.return_value = (1, 'Employee', 'active', 2)
+    assert get_user_identity(1) == UserIdentity(1, 'Employee', 'active', 2)
+    assert get_user_identity(1).role == 'Employee'
+    assert mock_session.query().filter().first.call_count == 1
+
+    update_user(1, {'role': 'Manager'})
+    mock_session.query().filter().first.return_value = (1, 'Manager', 'active', None)
+    assert get_user_identity(1).role == 'Manager'
+
+    delete_user(1)
+    mock_session.query().filter().first.return_value = None
+    assert get_user_identity(1) is None
+
+def test_get_user(mock_session):
+    mock_user = MagicMock()
+    mock_session.query().get.return_value = mock_user
+    result = get_user(1)
+    assert result == mock_user
+
+def test_get_departments(mock_session):
+    mock_department = MagicMock()
+    mock_session.query().get.return_value = mock_department
+    result = get_departments(1)
+    assert result == mock_department
+
+def test_get_request_type(mock_session):
+    mock_request_type = MagicMock()
+    mock_session.query().get.return_value = mock_request_type
+    result = get_request_type(1)
+    assert result == mock_request_type
+
+def test_get_reimbursement_request(mock_session):
+    mock_request = MagicMock()
+    mock_session.query().get.return_value = mock_request
+    result = get_reimbursement_request(1)
+    assert result == mock_request
+
+def test_get_all_reimbursement_requests(mock_session):
+    mock_requests = [MagicMock(), MagicMock()]
+    mock_session.query().all.return_value = mock_requests
+    result = get_all_reimbursement_requests()
+    assert result == mock_requests
+
+def test_get_reimbursement_requests_page(mock_session):
+    mock_requests = [MagicMock(request_id=i) for i in (30, 20, 10)]
+    mock_query = mock_session.query().options()
+    mock_query.filter.return_value = mock_query
+    mock_query.order_by().limit().all.return_value = mock_requests
+    result, next_cursor = get_reimbursement_requests_page({'status': 'pending'}, before_id=40, page_size=2)
+    assert result == mock_requests[:2]
+    assert next_cursor == 20
+    mock_query.order_by().limit.assert_called_with(3)
+    mock_session.close.assert_called_once()
+
+def test_get_reimbursement_requests_page_caps_page_size(mock_session):
+    mock_query = mock_session.query().options()
+    mock_query.order_by().limit().all.return_value = []
+    result, next_cursor = get_reimbursement_requests_page({}, page_size=10000)
+    assert result == []
+    assert next_cursor is None
+    mock_query.order_by().limit.assert_called_with(MAX_TRACKING_PAGE_SIZE + 1)
+
+def test_get_amount_limit(mock_session):
+    mock_request_type = MagicMock()
+    mock_request_type.amount_limit = 500.00
+    mock_session.query().get.return_value = mock_request_type
+    result = get_amount_limit('1')
+    assert result == 500.00
+    assert get_amount_limit(1) == 500.00
+    mock_session.query().get.assert_called_once_with(1)
+
+def test_get_amount_limit_invalid_id(mock_session):
+    assert get_amount_limit('abc') is None
+    assert get_amount_limit(None) is None
+
+def test_get_all_request_types_cached_until_invalidated(mock_session):
+    mock_session.query().all.return_value = [MagicMock()]
+    get_all_request_types()
+    get_all_request_types()
+    assert mock_session.query().all.call_count == 1
+    mock_session.query().get.return_value = MagicMock()
+    update_request_type(1, {'amount_limit': 900})
+    get_all_request_types()
+    assert mock_session.query().all.call_count == 2
+
+def test_get_all_departments_cached_until_invalidated(mock_session):
+    mock_session.query().order_by().all.return_value = [MagicMock()]
+    get_all_departments()
+    get_all_departments()
+    assert mock_session.query().order_by().all.call_count == 1
+    create_department('Finance')
+    get_all_departments()
+    assert mock_session.query().order_by().all.call_count == 2
+
+def test_get_notification(mock_session):
+    mock_notification = MagicMock()
+    mock_session.query().get.return_value = mock_notification
+    result = get_notification(1)
+    assert result == mock_notification
+
+def test_update_user(mock_session):
+    mock_user = MagicMock()
+    mock_session.query().get.return_value = mock_user
+    updates = {'first_name': 'Jane'}
+    result = update_user(1, updates)
+    assert result == mock_user
+    assert mock_user.first_name == 'Jane'
+    mock_session.commit.assert_called_once()
+
+def test_update_department(mock_session):
+    mock_department = MagicMock()
+    mock_session.query().get.return_value = mock_department
+    updates = {'department_name': 'Finance'}
+    result = update_department(1, updates)
+    assert result == mock_department
+    assert mock_department.department_name == 'Finance'
+    mock_session.commit.assert_called_once()
+
+def test_update_request_type(mock_session):
+    mock_request_type = MagicMock()
+    mock_session.query().get.return_value = mock_request_type
+    updates = {'type_name': 'Accommodation'}
+    result = update_request_type(1, updates)
+    assert result == mock_request_type
+    assert mock_request_type.type_name == 'Accommodation'
+    mock_session.commit.assert_called_once()
+
+def test_delete_user(mock_session):
+    mock_user = MagicMock()
+    mock_session.query().get.return_value = mock_user
+    delete_user(1)
+    mock_session.delete.assert_called_once_with(mock_user)
+    mock_session.commit.assert_called_once()
+
+def test_delete_request_type(mock_session):
+    mock_request_type = MagicMock()
+    mock_session.query().get.return_value = mock_request_type
+    delete_request_type(1)
+    mock_session.delete.assert_called_once_with(mock_request_type)
+    mock_session.commit.assert_called_once()
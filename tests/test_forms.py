@@ -0,0 +1,29 @@
+from unittest.mock import patch, MagicMock
+from app import app
+from forms import RegistrationForm
+
+def department(department_id, name):
+    mock_department = MagicMock()
+    mock_department.department_id = department_id
+    mock_department.department_name = name
+    return mock_department
+
+def test_department_choices_loaded_per_form():
+    with app.test_request_context(), patch('forms.get_all_departments') as mock_get_all_departments:
+        mock_get_all_departments.return_value = [department(1, 'HR')]
+        assert RegistrationForm().department.choices == [(1, 'HR')]
+        mock_get_all_departments.return_value = [department(1, 'HR'), department(2, 'IT')]
+        assert RegistrationForm().department.choices == [(1, 'HR'), (2, 'IT')]
+
+def test_department_choice_validated_as_id():
+    app.config['WTF_CSRF_ENABLED'] = False
+    try:
+        with app.test_request_context(method='POST', data={
+                'first_name': 'Jane', 'last_name': 'Doe', 'email': 'jane@nucleusteq.com',
+                'password': 'secret1', 'confirm_password': 'secret1', 'department': '2'}), \
+                patch('forms.get_all_departments', return_value=[department(1, 'HR'), department(2, 'IT')]):
+            form = RegistrationForm()
+            assert form.validate()
+            assert form.department.data == 2
+    finally:
+        app.config['WTF_CSRF_ENABLED'] = True
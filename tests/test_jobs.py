@@ -0,0 +1,121 @@
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import jobs
+from models import Base, Job
+
+@pytest.fixture
+def job_session(tmp_path):
+    # A file database so worker threads get their own connections instead of sharing one.
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={'check_same_thread': False, 'timeout': 10})
+    Base.metadata.create_all(engine)
+    TestSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with patch('jobs.get_session', TestSession):
+        yield TestSession
+    engine.dispose()
+
+@pytest.fixture
+def calls():
+    received = []
+    jobs.handlers['test_job'] = received.append
+    yield received
+    jobs.handlers.pop('test_job', None)
+
+def get_job(job_session, job_id):
+    session = job_session()
+    job = session.query(Job).get(job_id)
+    session.close()
+    return job
+
+def test_enqueue_and_run(job_session, calls):
+    job = jobs.enqueue('test_job', {'value': 1})
+    assert jobs.run_pending() == 1
+    assert calls == [{'value': 1}]
+    assert get_job(job_session, job.job_id).status == 'done'
+    assert jobs.run_pending() == 0
+
+def test_enqueue_in_callers_transaction(job_session, calls):
+    session = job_session()
+    with patch.object(jobs.worker, 'wake') as wake:
+        jobs.enqueue('test_job', {'value': 2}, session=session)
+        assert jobs.run_pending() == 0
+        wake.assert_not_called()
+        session.commit()
+        wake.assert_called_once_with()
+        session.commit()
+        wake.assert_called_once_with()
+    session.close()
+    assert jobs.run_pending() == 1
+    assert calls == [{'value': 2}]
+
+def test_failed_job_retried_with_backoff(job_session):
+    jobs.handlers['flaky'] = lambda payload: 1 / 0
+    try:
+        job = jobs.enqueue('flaky', {}, max_attempts=3)
+        started = datetime.utcnow()
+        assert jobs.run_pending() == 1
+        failed = get_job(job_session, job.job_id)
+        assert failed.status == 'queued'
+        assert failed.attempts == 1
+        assert 'ZeroDivisionError' in failed.last_error
+        assert failed.run_at >= started + timedelta(seconds=jobs.backoff_delay(1) - 1)
+        assert jobs.run_pending() == 0
+    finally:
+        jobs.handlers.pop('flaky')
+
+def test_job_dead_lettered_after_max_attempts(job_session):
+    job = jobs.enqueue('unknown_job', {}, max_attempts=2)
+    for _ in range(2):
+        session = job_session()
+        session.query(Job).update({Job.run_at: datetime.utcnow() - timedelta(seconds=1)})
+        session.commit()
+        session.close()
+        jobs.run_pending()
+    dead = get_job(job_session, job.job_id)
+    assert dead.status == 'dead'
+    assert dead.attempts == 2
+    assert 'No handler registered' in dead.last_error
+
+def test_backoff_delay_capped():
+    assert jobs.backoff_delay(1) == jobs.job_backoff_seconds
+    assert jobs.backoff_delay(2) == jobs.job_backoff_seconds * 2
+    assert jobs.backoff_delay(100) == jobs.job_backoff_max_seconds
+
+def test_stale_running_jobs_requeued(job_session):
+    job = jobs.enqueue('test_job', {})
+    session = job_session()
+    session.query(Job).update({Job.status: 'running', Job.locked_at: datetime.utcnow() - timedelta(days=1)})
+    session.commit()
+    session.close()
+    assert jobs.requeue_stale_jobs() == 1
+    assert get_job(job_session, job.job_id).status == 'queued'
+
+def test_old_done_jobs_purged(job_session, calls):
+    old, recent = jobs.enqueue('test_job', {}), jobs.enqueue('test_job', {})
+    dead = jobs.enqueue('unknown_job', {}, max_attempts=1)
+    jobs.run_pending()
+    session = job_session()
+    session.query(Job).filter(Job.job_id.in_([old.job_id, dead.job_id])).update(
+        {Job.run_at: datetime.utcnow() - timedelta(seconds=jobs.job_retention_seconds + 60)}, synchronize_session=False)
+    session.commit()
+    session.close()
+    assert jobs.purge_done_jobs(batch_size=1) == 1
+    assert get_job(job_session, old.job_id) is None
+    assert get_job(job_session, recent.job_id).status == 'done'
+    assert get_job(job_session, dead.job_id).status == 'dead'
+
+def test_worker_threads_run_jobs_and_stop(job_session, calls):
+    worker = jobs.JobWorker(threads=2, poll_interval=0.05)
+    worker.start()
+    try:
+        for value in range(5):
+            jobs.enqueue('test_job', {'value': value})
+        deadline = datetime.utcnow() + timedelta(seconds=5)
+        while len(calls) < 5 and datetime.utcnow() < deadline:
+            worker._stopping.wait(0.05)
+    finally:
+        worker.stop()
+    assert not worker.running
+    assert sorted(call['value'] for call in calls) == list(range(5))
@@ -0,0 +1,77 @@
+import logging
+import sqlite3
+import pytest
+from unittest.mock import patch
+from flask import Flask
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+import database
+import metrics
+
+def make_app():
+    app = Flask(__name__)
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE items (id INTEGER PRIMARY KEY)'))
+
+    @app.route('/items')
+    def items():
+        with engine.begin() as connection:
+            connection.execute(text('INSERT INTO items (id) VALUES (NULL), (NULL)'))
+            connection.execute(text('SELECT * FROM items')).fetchall()
+        return 'ok'
+
+    metrics.init_app(app, engine)
+    return app
+
+def test_queries_counted_per_endpoint():
+    metrics.route_metrics.reset()
+    app = make_app()
+    client = app.test_client()
+    client.get('/items')
+    client.get('/items')
+
+    stats = metrics.route_metrics.snapshot()['items']
+    assert stats['requests'] == 2
+    assert stats['queries'] == 4
+    assert stats['rows'] >= 4
+    assert stats['db_seconds'] <= stats['wall_seconds']
+    assert 'portal_db_queries_total{endpoint="items"} 4' in metrics.render_prometheus()
+
+def test_slow_queries_logged(caplog):
+    app = make_app()
+    with patch('metrics.slow_query_threshold_ms', 0), caplog.at_level(logging.WARNING, logger='slow_query'):
+        app.test_client().get('/items')
+    assert any('SELECT * FROM items' in record.getMessage() for record in caplog.records)
+
+def test_failed_queries_leave_no_timer_behind():
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    metrics.instrument_engine(engine)
+    with engine.connect() as connection:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.execute(text('SELECT * FROM missing'))
+        connection.execute(text('SELECT 1')).fetchall()
+        assert 'query_started' not in connection.info
+
+def test_label_values_escaped():
+    assert metrics._escape_label('a"b\\c') == 'a\\"b\\\\c'
+
+def test_pool_counts_only_timeouts_as_checkout_timeouts():
+    with patch.dict(database._pool_stats, dict.fromkeys(database._pool_stats, 0)):
+        pool = database.TimedQueuePool(lambda: sqlite3.connect(':memory:'), pool_size=1, max_overflow=0, timeout=0.01)
+        held = pool.connect()
+        with pytest.raises(database.exc.TimeoutError):
+            pool.connect()
+        held.close()
+        assert database._pool_stats['checkouts'] == 1
+        assert database._pool_stats['checkout_timeouts'] == 1
+
+        def refuse():
+            raise sqlite3.OperationalError('unable to open database file')
+
+        failing = database.TimedQueuePool(refuse, pool_size=1, max_overflow=0, timeout=0.01)
+        with pytest.raises(sqlite3.OperationalError):
+            failing.connect()
+        assert database._pool_stats['checkout_timeouts'] == 1
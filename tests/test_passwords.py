@@ -0,0 +1,41 @@
+import threading
+import pytest
+from unittest.mock import patch
+from werkzeug.security import generate_password_hash
+import passwords
+from passwords import PasswordHasher, PasswordHasherBusy
+
+@pytest.fixture
+def hasher():
+    fast = PasswordHasher(iterations=1000)
+    with patch('passwords.hasher', fast):
+        yield fast
+
+def test_hash_and_verify(hasher):
+    stored = passwords.hash_password('secret1')
+    assert stored.startswith('pbkdf2:sha256:1000$')
+    assert passwords.check_password(stored, 'secret1') == (True, False)
+    assert passwords.check_password(stored, 'wrong') == (False, False)
+
+def test_legacy_hashes_need_rehash(hasher):
+    legacy = generate_password_hash('secret1', method='sha256')
+    assert passwords.check_password(legacy, 'secret1') == (True, True)
+    cheaper = PasswordHasher(iterations=500).hash('secret1')
+    assert passwords.check_password(cheaper, 'secret1') == (True, True)
+
+def test_plaintext_passwords_match_and_need_rehash(hasher):
+    assert passwords.check_password('secret1', 'secret1') == (True, True)
+    assert passwords.check_password('a$b$c', 'a$b$c') == (True, True)
+    assert passwords.check_password('secret1', 'secret2') == (False, False)
+
+def test_busy_hasher_sheds_load(hasher):
+    release = threading.Event()
+    with patch('passwords._slots', threading.BoundedSemaphore(1)), patch('passwords.password_hash_timeout', 0.01):
+        blocked = threading.Thread(target=passwords._run, args=(release.wait,))
+        blocked.start()
+        try:
+            with pytest.raises(PasswordHasherBusy):
+                passwords.hash_password('secret1')
+        finally:
+            release.set()
+            blocked.join()
@@ -0,0 +1,127 @@
+import pytest
+from datetime import date
+from unittest.mock import patch
+from sqlalchemy.orm import sessionmaker
+import crud
+import jobs
+from models import User, ReimbursementRequest, Document
+from tests.factories import seed
+
+def count_statements(client, statements, url, user_id, role):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['role'] = role
+    statements.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    return len(statements)
+
+@pytest.mark.parametrize('url, user_id, role', [
+    ('/history', 2, 'Employee'),
+    ('/pending_requests', 1, 'Manager'),
+    ('/approved_requests', 1, 'Manager'),
+    ('/rejected_requests', 1, 'Manager'),
+])
+def test_document_views_issue_constant_queries(engine, client, statements, url, user_id, role):
+    seed(engine, 3)
+    small = count_statements(client, statements, url, user_id, role)
+
+    seed_more = sessionmaker(bind=engine)()
+    for status in ('pending', 'approved', 'rejected'):
+        for i in range(50):
+            request = ReimbursementRequest(employee_id=2, request_type_id=1, amount=100, request_date=date(2024, 1, 2),
+                                           status=status, manager_id=1)
+            request.documents = [Document(document_path=f'more_{status}_{i}.pdf')]
+            seed_more.add(request)
+    seed_more.commit()
+    seed_more.close()
+
+    large = count_statements(client, statements, url, user_id, role)
+    assert small == large
+    assert large <= 2
+
+def test_bulk_review_is_one_transaction(engine, statements):
+    seed(engine, 3)
+    session = sessionmaker(bind=engine)()
+    session.add(User(user_id=3, first_name='Other', last_name='Manager', email='other@nucleusteq.com',
+                     password='x', role='Manager', user_status='active', department_id=1))
+    session.add(ReimbursementRequest(request_id=500, employee_id=2, request_type_id=1, amount=10,
+                                     request_date=date(2024, 1, 1), status='pending', manager_id=3))
+    session.commit()
+    pending_ids = [row.request_id for row in session.query(ReimbursementRequest.request_id)
+                   .filter_by(manager_id=1, status='pending')]
+    approved_id = session.query(ReimbursementRequest.request_id).filter_by(status='approved').first().request_id
+    session.close()
+
+    comments = {request_id: 'ok' for request_id in pending_ids}
+    comments.update({approved_id: None, 500: None, 9999: None})
+    statements.clear()
+    with patch('crud.get_session', sessionmaker(bind=engine)):
+        results = crud.review_reimbursement_requests(1, 'approved', comments)
+
+    assert len([statement for statement in statements if statement.lstrip().upper().startswith(('SELECT', 'UPDATE'))]) == 2
+    assert results == {**{request_id: 'approved' for request_id in pending_ids},
+                       approved_id: 'not_pending', 500: 'forbidden', 9999: 'not_found'}
+    session = sessionmaker(bind=engine)()
+    assert session.query(ReimbursementRequest).filter_by(manager_id=1, status='pending').count() == 0
+    assert session.query(ReimbursementRequest).get(500).status == 'pending'
+    assert {r.comments for r in session.query(ReimbursementRequest).filter(ReimbursementRequest.request_id.in_(pending_ids))} == {'ok'}
+    session.close()
+
+def test_export_streams_filtered_rows(engine):
+    seed(engine, 5)
+    with patch('crud.get_session', sessionmaker(bind=engine)):
+        rows = list(crud.iter_reimbursement_request_export({'status': 'rejected'}, batch_size=2))
+    assert len(rows) == 5
+    assert [row.request_id for row in rows] == sorted(row.request_id for row in rows)
+    assert {row.status for row in rows} == {'rejected'}
+    assert rows[0].type_name == 'Travel'
+    assert rows[0].email == 'employee@nucleusteq.com'
+
+def test_manager_summary_is_one_grouped_query(engine, statements):
+    seed(engine, 4)
+    crud.reference_cache.clear()
+    crud.manager_summary_cache.clear()
+    with patch('crud.get_session', sessionmaker(bind=engine)):
+        crud.get_all_request_types()
+        statements.clear()
+        summary = crud.get_manager_summary(1)
+        assert len(statements) == 1
+        assert crud.get_manager_summary(1) is summary
+        assert len(statements) == 1
+
+    assert summary['total'] == {'count': 12, 'amount': 1200.0}
+    assert summary['by_status']['approved'] == {'count': 4, 'amount': 400.0}
+    assert summary['by_request_type'] == {'Travel': {'count': 12, 'amount': 1200.0}}
+    assert summary['by_month'] == {'2024-01': {'count': 12, 'amount': 1200.0}}
+    crud.manager_summary_cache.clear()
+
+def test_notification_fan_out_and_review_notifications(engine, statements):
+    seed(engine, 2)
+    session = sessionmaker(bind=engine)()
+    session.add(User(user_id=4, first_name='Second', last_name='Employee', email='second@nucleusteq.com',
+                     password='x', role='Employee', user_status='active', manager_id=1, department_id=1))
+    session.commit()
+    pending_ids = [row.request_id for row in session.query(ReimbursementRequest.request_id).filter_by(status='pending')]
+    session.close()
+    crud.unread_count_cache.clear()
+
+    with patch('crud.get_session', sessionmaker(bind=engine)), patch('jobs.get_session', sessionmaker(bind=engine)):
+        statements.clear()
+        assert crud.notify_team(1, 'Policy updated') == 2
+        assert len([statement for statement in statements if statement.lstrip().upper().startswith('INSERT')]) == 1
+        assert crud.get_unread_count(2) == 1
+
+        crud.review_reimbursement_requests(1, 'approved', dict.fromkeys(pending_ids, 'ok'))
+        assert crud.get_unread_count(2) == 1
+        assert jobs.run_pending() == 2
+        assert crud.get_unread_count(2) == 1 + len(pending_ids)
+        unread = crud.get_unread_notifications(2)
+        assert unread[0].created_at >= unread[-1].created_at
+
+        assert crud.mark_notifications_read(2, [unread[0].notification_id]) == 1
+        assert crud.get_unread_count(2) == len(pending_ids)
+        crud.mark_notifications_read(2)
+        assert crud.get_unread_count(2) == 0
+        assert crud.get_unread_count(4) == 1
+    crud.unread_count_cache.clear()
@@ -0,0 +1,85 @@
+import pytest
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import crud
+from models import (Base, User, Department, RequestType, ReimbursementRequest, RequestStatusHistory,
+                    MonthlySpendRollup)
+
+REQUESTS = 20
+
+@pytest.fixture
+def engine(tmp_path):
+    # A file database so every reviewer thread gets its own connection.
+    engine = create_engine(f"sqlite:///{tmp_path / 'review.db'}", connect_args={'check_same_thread': False, 'timeout': 30})
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Department(department_id=1, department_name='IT'))
+    session.add(RequestType(request_type_id=1, type_name='Travel', amount_limit=1000))
+    session.add(User(user_id=1, first_name='Manager', last_name='One', email='manager@nucleusteq.com',
+                     password='x', role='Manager', user_status='active', department_id=1))
+    session.add(User(user_id=2, first_name='Employee', last_name='One', email='employee@nucleusteq.com',
+                     password='x', role='Employee', user_status='active', manager_id=1, department_id=1))
+    for request_id in range(1, REQUESTS + 1):
+        session.add(ReimbursementRequest(request_id=request_id, employee_id=2, request_type_id=1, amount=10,
+                                         request_date=date(2024, 1, 1), status='pending', manager_id=1))
+    session.commit()
+    session.close()
+    TestSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with patch('crud.get_session', TestSession), patch('jobs.get_session', TestSession):
+        yield engine
+    engine.dispose()
+
+def rollups(engine):
+    session = sessionmaker(bind=engine)()
+    rows = {(r.status, r.request_count, r.total_amount) for r in session.query(MonthlySpendRollup)}
+    session.close()
+    return rows
+
+def test_concurrent_reviews_have_one_winner(engine):
+    request_ids = list(range(1, REQUESTS + 1))
+
+    def review(worker):
+        # Half the reviewers approve and half reject the same requests, in different orders.
+        status = 'approved' if worker % 2 else 'rejected'
+        ids = request_ids if worker % 3 else request_ids[::-1]
+        return status, crud.review_reimbursement_requests(1, status, dict.fromkeys(ids, 'checked'))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        outcomes = list(executor.map(review, range(16)))
+
+    winners = {}
+    for status, results in outcomes:
+        for request_id, outcome in results.items():
+            assert outcome in (status, 'not_pending', 'conflict')
+            if outcome == status:
+                assert request_id not in winners
+                winners[request_id] = status
+    assert set(winners) == set(request_ids)
+
+    session = sessionmaker(bind=engine)()
+    for row in session.query(ReimbursementRequest):
+        assert row.status == winners[row.request_id]
+        assert row.version == 2
+    history = Counter(row.request_id for row in session.query(RequestStatusHistory).filter_by(old_status='pending'))
+    session.close()
+    assert history == dict.fromkeys(request_ids, 1)
+
+    incremental = rollups(engine)
+    crud.rebuild_monthly_spend_rollups()
+    assert rollups(engine) == incremental
+
+def test_stale_version_is_a_conflict(engine):
+    assert crud.review_reimbursement_requests(1, 'approved', {1: 'ok', 2: 'ok'}, {1: 1, 2: 1}) == {1: 'approved', 2: 'approved'}
+    # The request changed since this reviewer loaded the page.
+    assert crud.review_reimbursement_requests(1, 'rejected', {3: 'late'}, {3: 0}) == {3: 'conflict'}
+    assert crud.review_reimbursement_requests(1, 'rejected', {1: 'late'}, {1: 1}) == {1: 'not_pending'}
+
+    session = sessionmaker(bind=engine)()
+    assert session.query(ReimbursementRequest).get(3).status == 'pending'
+    assert session.query(ReimbursementRequest).get(3).version == 1
+    assert session.query(ReimbursementRequest).get(1).version == 2
+    session.close()
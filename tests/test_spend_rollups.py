@@ -0,0 +1,54 @@
+from datetime import date
+from unittest.mock import patch
+from sqlalchemy.orm import sessionmaker
+import crud
+from models import User, Department, ReimbursementRequest, MonthlySpendRollup
+from tests.factories import seed
+
+def test_spend_rollups_maintained_on_review(engine, statements):
+    seed(engine, 3)
+    session = sessionmaker(bind=engine)()
+    session.add(Department(department_id=2, department_name='Sales'))
+    session.add(User(user_id=4, first_name='Sales', last_name='Employee', email='sales@nucleusteq.com',
+                     password='x', role='Employee', user_status='active', manager_id=1, department_id=2))
+    session.add(ReimbursementRequest(request_id=600, employee_id=4, request_type_id=1, amount=70,
+                                     request_date=date(2024, 2, 10), status='pending', manager_id=1))
+    session.commit()
+    pending_ids = [row.request_id for row in session.query(ReimbursementRequest.request_id)
+                   .filter_by(status='pending', employee_id=2)]
+    session.close()
+    crud.reference_cache.clear()
+
+    def rollups():
+        session = sessionmaker(bind=engine)()
+        rows = {(r.year, r.month, r.department_id, r.request_type_id, r.status): (r.request_count, r.total_amount)
+                for r in session.query(MonthlySpendRollup)}
+        session.close()
+        return rows
+
+    with patch('crud.get_session', sessionmaker(bind=engine)), patch('jobs.get_session', sessionmaker(bind=engine)):
+        # Seeded approved/rejected rows predate the rollups, so backfill first.
+        assert crud.rebuild_monthly_spend_rollups() == 2
+        assert rollups() == {(2024, 1, 1, 1, 'approved'): (3, 300.0), (2024, 1, 1, 1, 'rejected'): (3, 300.0)}
+
+        crud.review_reimbursement_requests(1, 'approved', {**dict.fromkeys(pending_ids[:2], 'ok'), 600: 'ok'})
+        crud.review_reimbursement_requests(1, 'rejected', {pending_ids[2]: 'no receipt'})
+        incremental = rollups()
+        assert incremental == {(2024, 1, 1, 1, 'approved'): (5, 500.0), (2024, 1, 1, 1, 'rejected'): (4, 400.0),
+                               (2024, 2, 2, 1, 'approved'): (1, 70.0)}
+        crud.rebuild_monthly_spend_rollups()
+        assert rollups() == incremental
+
+        crud.get_all_departments()
+        crud.get_all_request_types()
+        statements.clear()
+        analytics = crud.get_spend_analytics()
+        assert len(statements) == 1
+        assert 'monthly_spend_rollups' in statements[0] and 'reimbursement_requests' not in statements[0]
+        assert analytics['total']['approved_amount'] == 570.0
+        assert analytics['by_department']['Sales'] == {'approved_count': 1, 'approved_amount': 70.0,
+                                                       'rejected_count': 0, 'rejected_amount': 0.0}
+        assert list(analytics['by_month']) == ['2024-01', '2024-02']
+        assert analytics['by_request_type']['Travel']['rejected_count'] == 4
+        assert crud.get_spend_analytics(2023)['total']['approved_count'] == 0
+    crud.reference_cache.clear()
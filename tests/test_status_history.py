@@ -0,0 +1,48 @@
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+from sqlalchemy.orm import sessionmaker
+import crud
+from models import User, RequestStatusHistory
+from tests.factories import seed
+
+def test_status_history_and_review_latency(engine, statements):
+    seed(engine, 0)
+    session = sessionmaker(bind=engine)()
+    session.add(User(user_id=3, first_name='Other', last_name='Manager', email='other@nucleusteq.com',
+                     password='x', role='Manager', user_status='active', department_id=1))
+    session.commit()
+    session.close()
+
+    with patch('crud.get_session', sessionmaker(bind=engine)), patch('jobs.get_session', sessionmaker(bind=engine)):
+        request_ids = [crud.create_reimbursement_request(2, 1, 50, date(2024, 1, 1), 1) for _ in range(4)]
+        other_id = crud.create_reimbursement_request(2, 1, 50, date(2024, 1, 1), 3)
+
+        # Back-date the submissions so each review took a known time.
+        session = sessionmaker(bind=engine)()
+        now = datetime.utcnow()
+        for hours, request_id in zip([1, 2, 3, 10], request_ids):
+            (session.query(RequestStatusHistory).filter_by(request_id=request_id)
+             .update({RequestStatusHistory.changed_at: now - timedelta(hours=hours)}))
+        session.query(RequestStatusHistory).filter_by(request_id=other_id).update(
+            {RequestStatusHistory.changed_at: now - timedelta(hours=5)})
+        session.commit()
+        session.close()
+
+        statements.clear()
+        crud.review_reimbursement_requests(1, 'approved', dict.fromkeys(request_ids[:3], 'ok'))
+        assert len([statement for statement in statements if 'request_status_history' in statement]) == 1
+        crud.review_reimbursement_requests(1, 'rejected', {request_ids[3]: 'missing receipt'})
+        crud.review_reimbursement_requests(3, 'approved', {other_id: None})
+
+        history = crud.get_status_history(request_ids[3])
+        assert [(entry.old_status, entry.new_status, entry.actor_id, entry.comment) for entry in history] == [
+            (None, 'pending', 2, None), ('pending', 'rejected', 1, 'missing receipt')]
+
+        since = now - timedelta(minutes=1)
+        latency = crud.get_review_latency(since, ['approved'])
+        assert latency[1]['count'] == 3
+        assert round(latency[1]['median_seconds'] / 3600) == 2
+        assert round(latency[3]['median_seconds'] / 3600) == 5
+        assert crud.get_review_latency(since)[1]['count'] == 4
+        assert list(crud.get_review_latency(since, manager_id=3)) == [3]
+        assert crud.get_review_latency(now + timedelta(minutes=1)) == {}
@@ -0,0 +1,42 @@
+import hashlib
+import io
+import os
+from unittest.mock import patch
+from werkzeug.datastructures import FileStorage
+from storage import store_upload
+
+def make_upload(content, filename='receipt.PDF'):
+    return FileStorage(stream=io.BytesIO(content), filename=filename)
+
+def test_store_upload_uses_content_address(tmp_path):
+    content = b'receipt contents'
+    digest = hashlib.sha256(content).hexdigest()
+
+    path = store_upload(make_upload(content), str(tmp_path))
+
+    assert path == f'{digest[:2]}/{digest[2:4]}/{digest}.pdf'
+    assert (tmp_path / digest[:2] / digest[2:4] / f'{digest}.pdf').read_bytes() == content
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.part')]
+
+def test_store_upload_deduplicates_identical_files(tmp_path):
+    first = store_upload(make_upload(b'same', 'receipt.pdf'), str(tmp_path))
+    second = store_upload(make_upload(b'same', 'other/../receipt.pdf'), str(tmp_path))
+    different = store_upload(make_upload(b'different', 'receipt.pdf'), str(tmp_path))
+
+    assert first == second
+    assert first != different
+    assert sum(len(files) for _, _, files in os.walk(tmp_path)) == 2
+
+def test_store_upload_reads_in_chunks(tmp_path):
+    content = os.urandom(10 * 1024)
+    upload = make_upload(content)
+    reads = []
+    original_read = upload.stream.read
+    upload.stream.read = lambda size=-1: reads.append(size) or original_read(size)
+
+    with patch('storage.CHUNK_SIZE', 4096):
+        path = store_upload(upload, str(tmp_path))
+
+    assert set(reads) == {4096}
+    assert len(reads) == 4
+    assert (tmp_path / path).read_bytes() == content
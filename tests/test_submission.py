@@ -0,0 +1,73 @@
+import pytest
+from datetime import date
+from unittest.mock import patch
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import sessionmaker
+import crud
+from models import ReimbursementRequest, Document
+from tests.factories import seed
+
+def test_duplicate_submissions_return_original(engine, statements):
+    seed(engine, 0)
+    receipt = 'ab' * 32
+    content_hash = crud.submission_hash(2, 100, date(2024, 1, 5), [receipt])
+
+    def submit(idempotency_key, amount=100, receipt_hash=content_hash):
+        return crud.create_reimbursement_request(2, 1, amount, date(2024, 1, 5), 1,
+                                                 idempotency_key=idempotency_key, content_hash=receipt_hash)
+
+    with patch('crud.get_session', sessionmaker(bind=engine)):
+        request_id = submit('key-1')
+        statements.clear()
+        assert crud.find_submission(2, 'key-1') == request_id
+        assert len(statements) == 1
+        assert crud.find_submission(4, 'key-1') is None
+
+        # A retry with the same key, or the same claim under a new key, hits a unique index.
+        for key in ('key-1', 'key-2'):
+            with pytest.raises(crud.DuplicateSubmission) as duplicate:
+                submit(key)
+            assert duplicate.value.request_id == request_id
+        other_id = submit('key-3', amount=120, receipt_hash=crud.submission_hash(2, 120, date(2024, 1, 5), [receipt]))
+        assert other_id != request_id
+        assert crud.submission_hash(2, 100, date(2024, 1, 5), [receipt, None]) is None
+        assert submit(None, receipt_hash=None) not in (request_id, other_id)
+
+        # Once rejected, the same claim can be corrected and submitted again under a new key.
+        assert crud.review_reimbursement_requests(1, 'rejected', {request_id: 'wrong type'}) == {request_id: 'rejected'}
+        resubmitted_id = submit('key-4')
+        assert resubmitted_id not in (request_id, other_id)
+        with pytest.raises(crud.DuplicateSubmission) as duplicate:
+            submit('key-5')
+        assert duplicate.value.request_id == resubmitted_id
+        with pytest.raises(crud.DuplicateSubmission) as duplicate:
+            submit('key-1')
+        assert duplicate.value.request_id == request_id
+
+    session = sessionmaker(bind=engine)()
+    assert session.query(ReimbursementRequest).count() == 4
+    assert session.query(ReimbursementRequest).get(request_id).content_hash is None
+    session.close()
+
+def test_request_and_documents_are_one_transaction(engine, statements):
+    seed(engine, 0)
+    paths = ['aa/aa/a.jpg', 'bb/bb/b.jpg', 'cc/cc/c.jpg']
+    commits = []
+    event.listen(engine, 'commit', lambda connection: commits.append(connection))
+
+    with patch('crud.get_session', sessionmaker(bind=engine)):
+        statements.clear()
+        request_id = crud.create_reimbursement_request(2, 1, 100, date(2024, 1, 5), 1, document_paths=paths)
+        assert len(commits) == 1
+        assert len([statement for statement in statements if 'INSERT INTO documents' in statement]) == 1
+
+        # Nothing is left behind when a later write in the unit of work fails.
+        with patch('crud.add_status_history', side_effect=SQLAlchemyError('history down')), pytest.raises(SQLAlchemyError):
+            crud.create_reimbursement_request(2, 1, 50, date(2024, 1, 6), 1, document_paths=['dd/dd/d.jpg'])
+
+    session = sessionmaker(bind=engine)()
+    assert session.query(ReimbursementRequest).count() == 1
+    assert sorted(document.document_path for document in session.query(Document).filter_by(request_id=request_id)) == paths
+    assert session.query(Document).count() == 3
+    session.close()
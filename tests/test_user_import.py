@@ -0,0 +1,70 @@
+from unittest.mock import patch
+from sqlalchemy.orm import sessionmaker
+from werkzeug.security import check_password_hash
+import crud
+from passwords import PasswordHasher
+from models import User
+from tests.factories import seed
+
+def test_user_import_resolves_references_in_bulk(engine, statements):
+    seed(engine, 1)
+    crud.reference_cache.clear()
+    rows = [
+        {'first_name': 'New', 'last_name': 'Manager', 'email': 'NewManager@NucleusTeq.com', 'password': 'pw',
+         'role': 'manager', 'department': 'it'},
+        {'first_name': 'A', 'last_name': 'Employee', 'email': 'a@nucleusteq.com', 'password': 'pw',
+         'role': 'Employee', 'department': 'IT', 'manager_email': 'newManager@nucleusteq.com'},
+        {'first_name': 'B', 'last_name': 'Employee', 'email': 'b@nucleusteq.com', 'password': 'pw',
+         'role': 'Employee', 'department': 'IT', 'manager_email': 'manager@nucleusteq.com'},
+        {'first_name': 'C', 'last_name': 'Employee', 'email': 'employee@nucleusteq.com', 'password': 'pw',
+         'role': 'Employee', 'department': 'IT', 'manager_email': 'manager@nucleusteq.com'},
+        {'first_name': 'D', 'last_name': 'Employee', 'email': 'd@nucleusteq.com', 'password': 'pw',
+         'role': 'Employee', 'department': 'Sales', 'manager_email': 'manager@nucleusteq.com'},
+        {'first_name': 'E', 'last_name': 'Employee', 'email': 'e@nucleusteq.com', 'password': 'pw',
+         'role': 'Employee', 'department': 'IT', 'manager_email': 'employee@nucleusteq.com'},
+        {'first_name': 'F', 'last_name': 'Employee', 'email': 'f@example.com', 'password': 'pw',
+         'role': 'Employee', 'department': 'IT', 'manager_email': 'manager@nucleusteq.com'},
+        {'first_name': 'A', 'last_name': 'Again', 'email': 'A@nucleusteq.com', 'password': 'pw',
+         'role': 'Employee', 'department': 'IT', 'manager_email': 'manager@nucleusteq.com'},
+        {'email': 'g@nucleusteq.com'},
+        None,
+    ]
+    with patch('crud.get_session', sessionmaker(bind=engine)), patch('passwords.hasher', PasswordHasher(iterations=1000)):
+        crud.get_all_departments()
+        statements.clear()
+        result = crud.import_users(rows)
+
+    assert result['imported'] == 3
+    assert [(error['row'], error['error']) for error in result['errors']] == [
+        (4, 'Email already registered'),
+        (5, 'Unknown department Sales'),
+        (6, 'Unknown manager employee@nucleusteq.com'),
+        (7, 'Invalid email domain'),
+        (8, 'Duplicate email in import'),
+        (9, 'Missing first_name, last_name, password, role, department'),
+        (10, 'Malformed row'),
+    ]
+    # One lookup, one chunked insert, then the new managers' ids and their employees.
+    assert len([statement for statement in statements if statement.lstrip().upper().startswith(('SELECT', 'INSERT'))]) == 4
+
+    session = sessionmaker(bind=engine)()
+    users = {user.email: user for user in session.query(User)}
+    assert users['newmanager@nucleusteq.com'].role == 'Manager'
+    assert users['a@nucleusteq.com'].manager_id == users['newmanager@nucleusteq.com'].user_id
+    assert users['b@nucleusteq.com'].manager_id == 1
+    assert users['b@nucleusteq.com'].user_status == 'active'
+    assert check_password_hash(users['b@nucleusteq.com'].password, 'pw')
+    session.close()
+    crud.reference_cache.clear()
+
+def test_hash_passwords_in_worker_processes():
+    try:
+        with patch('crud.user_import_parallel_min_rows', 2), patch('crud.user_import_hash_workers', 2), \
+                patch('passwords.hasher', PasswordHasher(iterations=1000)):
+            hashes = crud.hash_passwords(['one', 'two', 'three'])
+    finally:
+        crud.shutdown_hash_pool()
+    # Spawned workers only see the patched hasher because it is passed to them.
+    assert all(password_hash.startswith('pbkdf2:sha256:1000$') for password_hash in hashes)
+    assert [check_password_hash(password_hash, password)
+            for password_hash, password in zip(hashes, ['one', 'two', 'three'])] == [True, True, True]
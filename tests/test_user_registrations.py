@@ -0,0 +1,50 @@
+from unittest.mock import patch
+from sqlalchemy.orm import sessionmaker
+import crud
+from models import User
+from tests.factories import add_registrations, seed
+
+def test_pending_registrations_page_is_bounded(engine, client, statements):
+    seed(engine, 1)
+    add_registrations(engine, 60)
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'Admin'
+
+    with patch('crud.get_session', sessionmaker(bind=engine)):
+        statements.clear()
+        response = client.get('/pending_user_registration')
+        assert response.status_code == 200
+        assert len(statements) == 2
+        assert b'new49@nucleusteq.com' in response.data
+        assert b'new50@nucleusteq.com' not in response.data
+        assert b'cursor=149' in response.data
+
+        users, next_cursor = crud.get_pending_registrations_page(after_id=149)
+    assert [user.user_id for user in users] == list(range(150, 160))
+    assert next_cursor is None
+    assert users[0].department.department_name == 'IT'
+
+def test_bulk_user_review_is_one_transaction(engine, statements):
+    seed(engine, 1)
+    add_registrations(engine, 5)
+    approvals = {100: ('employee', 1), 101: ('Manager', None), 102: ('employee', None), 103: ('employee', 2),
+                 104: ('director', None), 2: ('employee', 1), 999: ('employee', 1)}
+    with patch('crud.get_session', sessionmaker(bind=engine)):
+        statements.clear()
+        results = crud.approve_users(approvals)
+        assert len([statement for statement in statements if statement.lstrip().upper().startswith(('SELECT', 'UPDATE'))]) == 3
+        assert results == {100: 'approved', 101: 'approved', 102: 'manager_required', 103: 'unknown_manager',
+                           104: 'invalid_role', 2: 'not_pending', 999: 'not_found'}
+
+        statements.clear()
+        assert crud.reject_users([102, 100, 998]) == {102: 'rejected', 100: 'not_pending', 998: 'not_found'}
+        assert len([statement for statement in statements if statement.lstrip().upper().startswith(('SELECT', 'DELETE'))]) == 2
+
+    session = sessionmaker(bind=engine)()
+    assert (session.query(User).get(100).role, session.query(User).get(100).manager_id) == ('Employee', 1)
+    assert session.query(User).get(100).user_status == 'active'
+    assert (session.query(User).get(101).role, session.query(User).get(101).manager_id) == ('Manager', None)
+    assert session.query(User).get(102) is None
+    assert session.query(User).get(103).user_status == 'inactive'
+    session.close()